@@ -0,0 +1,62 @@
+"""Referrer lookups against the number of attributes in the tree.
+
+Every entity holds 10 TEXT attributes. 1,000 of them are referenced from
+another group by an EXREF and an AXREF, referenced by another AXREF.
+Their referrers are read in a lazy tree (``refs``) and listed as
+backlinks, following AXREF chains.
+
+Usage: python benchmarks/bench_backlinks.py [N_ATTRIBUTES...]
+"""
+from common import Storage, DType, tempdb, timer, sizes, populate
+from contacto.helpers import refid_to_bytes
+
+LOOKUPS = 1_000
+
+
+def referrers(db_file, step):
+    """Adds XREFs to every step-th entity and its "A0" to a group "R".
+    """
+    stor = Storage(db_file)
+    conn = stor.db_conn
+    with conn:
+        rid = conn.execute('INSERT INTO "group" VALUES (NULL, ?)',
+                           ['R']).lastrowid
+        sql = 'SELECT id, entity_id FROM attribute WHERE name=? \
+               AND entity_id % ? = 0 LIMIT ?'
+        rows = conn.execute(sql, ('A0', step, LOOKUPS)).fetchall()
+        sql = 'INSERT INTO attribute (name, type, data, entity_id) \
+               VALUES (?, ?, ?, ?)'
+        for aid, target in rows:
+            eid = conn.execute('INSERT INTO entity VALUES (NULL, ?, NULL, ?)',
+                               (f"E{target}", rid)).lastrowid
+            ref = conn.execute(sql, ('a', DType.AXREF, refid_to_bytes(aid),
+                                     eid)).lastrowid
+            conn.executemany(sql, (('e', DType.EXREF, refid_to_bytes(target),
+                                    eid),
+                                   ('aa', DType.AXREF, refid_to_bytes(ref),
+                                    eid)))
+    del stor
+    return [target for _, target in rows]
+
+
+def main():
+    for n in sizes([100_000, 1_000_000]):
+        print(f"{n:,} attributes")
+        with tempdb() as db_file:
+            n_entities = populate(db_file, n)
+            targets = referrers(db_file, max(1, n_entities // LOOKUPS))
+            stor = Storage(db_file, lazy=True)
+            ents = [stor.get_entity(f"G{eid // 100 + 1}", f"E{eid}")
+                    for eid in targets]
+            attrs = [ent.attributes['A0'] for ent in ents]
+            with timer('  refs (lazy entities)', len(ents)):
+                assert all(len(ent.refs) == 1 for ent in ents)
+            with timer('  refs (lazy attributes)', len(attrs)):
+                assert all(len(attr.refs) == 1 for attr in attrs)
+            with timer('  backlinks (transitive)', len(attrs)):
+                assert all(len(stor.backlinks(attr, True)) == 2
+                           for attr in attrs)
+
+
+if __name__ == '__main__':
+    main()
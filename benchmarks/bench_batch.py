@@ -0,0 +1,49 @@
+"""Throughput of set operations: CLI processes vs. a single batch.
+
+Sets attributes of existing entities, one ``set`` process per value
+(a few runs only), then all of them in a ``batch`` process reading
+TSV lines from stdin, with the default and a single-commit batch size.
+
+Usage: python benchmarks/bench_batch.py [N_OPERATIONS...]
+"""
+import os
+import sys
+import subprocess
+from common import tempdb, timer, sizes, populate
+
+RUNS = 20
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def cli(db_file, *args, stdin=None):
+    """Runs a CLI process.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    cmd = [sys.executable, '-m', 'contacto', '-o', db_file, *args]
+    subprocess.run(cmd, env=env, check=True, input=stdin,
+                   universal_newlines=True, stderr=subprocess.DEVNULL)
+
+
+def lines(n, label):
+    """TSV set operations on existing entities.
+    """
+    return ''.join(f"set\tG{i // 100 + 1}/E{i}/{label}\tvalue {i}\n"
+                   for i in range(n))
+
+
+def main():
+    for n in sizes([10_000, 100_000]):
+        print(f"{n:,} set operations")
+        with tempdb() as db_file:
+            populate(db_file, n * 10)
+            with timer(f"  set processes ({RUNS})", RUNS):
+                for i in range(RUNS):
+                    cli(db_file, 'set', f"G1/E{i}/proc", 'value')
+            with timer('  batch', n):
+                cli(db_file, 'batch', stdin=lines(n, 'batch'))
+            with timer('  batch -n (single commit)', n):
+                cli(db_file, 'batch', '-n', str(n), stdin=lines(n, 'single'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Per-command CLI latency with and without a running server.
+
+Runs ``get -r`` and ``set`` as separate CLI processes, first opening
+the storage in every process, then forwarding to ``contacto serve``.
+Requests sent to the server from a running process (``daemon.request``)
+show the latency without the interpreter startup.
+
+Usage: python benchmarks/bench_daemon.py [N_ATTRIBUTES...]
+"""
+import os
+import sys
+import time
+import subprocess
+from common import tempdb, timer, sizes, populate
+from contacto import daemon
+
+RUNS = 20
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def cli(db_file, *args):
+    """Runs a CLI process, returns its output.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    cmd = [sys.executable, '-m', 'contacto', '-o', db_file, *args]
+    return subprocess.run(cmd, env=env, check=True,
+                          stdout=subprocess.PIPE).stdout
+
+
+def commands(db_file, label):
+    """Times CLI processes reading and writing an attribute.
+    """
+    with timer(f"  get -r ({label})", RUNS):
+        for _ in range(RUNS):
+            assert cli(db_file, 'get', '-r', 'G2/E100/A0')
+    with timer(f"  set ({label})", RUNS):
+        for i in range(RUNS):
+            cli(db_file, 'set', f"G2/E100/{label}{i}", 'value')
+
+
+def main():
+    for n in sizes([10_000, 100_000]):
+        print(f"{n:,} attributes, {RUNS} runs")
+        with tempdb() as db_file:
+            populate(db_file, n)
+            commands(db_file, 'local')
+
+            env = dict(os.environ, PYTHONPATH=ROOT)
+            server = subprocess.Popen([sys.executable, '-m', 'contacto',
+                                       '-o', db_file, 'serve'], env=env,
+                                      stderr=subprocess.DEVNULL)
+            while not os.path.exists(daemon.socket_path(db_file)):
+                time.sleep(0.01)
+            try:
+                commands(db_file, 'served')
+                args = ['-o', db_file, 'get', '-r', 'G2/E100/A0']
+                with timer('  get -r (request)', RUNS):
+                    for _ in range(RUNS):
+                        assert daemon.request(db_file, args)[0] == 0
+            finally:
+                daemon.stop(db_file)
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Group deletion wall time against the number of its entities.
+
+Every entity holds 10 TEXT attributes. A tenth of them is referenced from
+another group by an EXREF and an AXREF, both deleted along with the group.
+The group is deleted from a loaded and from a lazy tree.
+
+Usage: python benchmarks/bench_delete.py [N_ENTITIES...]
+"""
+from common import Storage, DType, tempdb, timer, sizes, populate
+from contacto.helpers import refid_to_bytes
+
+
+def referrers(db_file):
+    """Adds XREFs into group "G1" to a group "R".
+    """
+    stor = Storage(db_file)
+    conn = stor.db_conn
+    with conn:
+        rid = conn.execute('INSERT INTO "group" VALUES (NULL, ?)',
+                           ['R']).lastrowid
+        eid = conn.execute('INSERT INTO entity VALUES (NULL, ?, NULL, ?)',
+                           ('E', rid)).lastrowid
+        sql = 'SELECT id, entity_id FROM attribute WHERE name=? \
+               AND entity_id % 10 = 0'
+        rows = conn.execute(sql, ['A0']).fetchall()
+        sql = 'INSERT INTO attribute (name, type, data, entity_id) \
+               VALUES (?, ?, ?, ?)'
+        conn.executemany(sql, ((f"e{target}", DType.EXREF,
+                                refid_to_bytes(target), eid)
+                               for _, target in rows))
+        conn.executemany(sql, ((f"a{aid}", DType.AXREF,
+                                refid_to_bytes(aid), eid)
+                               for aid, _ in rows))
+    del stor
+
+
+def main():
+    for n in sizes([1_000, 10_000]):
+        print(f"group of {n:,} entities")
+        for lazy in (False, True):
+            with tempdb() as db_file:
+                populate(db_file, n * 10, grp_size=n)
+                referrers(db_file)
+                stor = Storage(db_file, lazy=lazy)
+                group = stor.get_group('G1')
+                with timer(f"  delete ({'lazy' if lazy else 'loaded'})", n):
+                    assert group.delete_safe()
+                assert not stor.get_group('R').entities['E'].attributes
+
+
+if __name__ == '__main__':
+    main()
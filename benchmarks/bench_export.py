@@ -0,0 +1,49 @@
+"""Peak memory and time of a streamed YAML export vs. yaml.safe_dump.
+
+The streamed export is measured with both YAML backends. It releases
+the groups of the lazy Storage once written, so its peak should not grow
+with the tree.
+
+Usage: python benchmarks/bench_export.py [N_ATTRIBUTES...]
+"""
+import os
+import tracemalloc
+import yaml
+from common import Storage, populate, tempdb, timer, sizes
+from contacto.serial import Serial
+
+
+def safe_dump(stor, file):
+    data = {
+        gname: {
+            ename: {aname: attr.data for aname, attr in ent.attributes.items()}
+            for ename, ent in grp.entities.items()
+        }
+        for gname, grp in stor.groups.items()
+    }
+    yaml.safe_dump(data, file)
+
+
+def main():
+    for n in sizes([2_000, 10_000]):
+        with tempdb() as db_file:
+            populate(db_file, n, bin_size=1024)
+            print(f"{n:,} attributes (+ binary attributes)")
+            for label, export in (
+                    ('safe_dump', safe_dump),
+                    ('streamed (Python)', lambda s, f:
+                     Serial(s, libyaml=False).export_yaml(f)),
+                    ('streamed (LibYAML)', lambda s, f:
+                     Serial(s).export_yaml(f))):
+                stor = Storage(db_file, lazy=True)
+                with open(os.devnull, 'w') as f:
+                    tracemalloc.start()
+                    with timer(f"  {label}"):
+                        export(stor, f)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                print(f"  {label:<38} {peak / 2**20:10.1f} MB peak")
+
+
+if __name__ == '__main__':
+    main()
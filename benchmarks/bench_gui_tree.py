@@ -0,0 +1,65 @@
+"""Time to show the GUI contact tree: eager tree widget vs. lazy model.
+
+The widget gets an item for every element of an eagerly loaded Storage
+(as the GUI did before). The model is shown over a lazy Storage, its
+rows are read when the view asks for them. Runs on the offscreen Qt
+platform, an empty DB is timed for comparison.
+
+Usage: python benchmarks/bench_gui_tree.py [N_ATTRIBUTES...]
+"""
+import os
+import sys
+from common import Storage, tempdb, timer, sizes, populate
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt5 import QtWidgets  # noqa: E402
+from contacto.gui import TreeModel  # noqa: E402
+from contacto.helpers import attr_val_str  # noqa: E402
+
+
+def widget_tree(db_file):
+    """Fills a tree widget with the whole tree.
+    """
+    tree = QtWidgets.QTreeWidget()
+    for gname, group in sorted(Storage(db_file).groups.items()):
+        gitem = QtWidgets.QTreeWidgetItem(tree, [gname, 'Group'])
+        for ename, entity in sorted(group.entities.items()):
+            eitem = QtWidgets.QTreeWidgetItem(gitem, [ename, 'Entity'])
+            for aname, attr in sorted(entity.attributes.items()):
+                QtWidgets.QTreeWidgetItem(
+                    eitem, [aname, 'Attr', attr_val_str(attr, False)])
+    return tree
+
+
+def model_tree(db_file, app):
+    """Shows a lazy model and expands its first group and entity.
+    """
+    view = QtWidgets.QTreeView()
+    view.setUniformRowHeights(True)
+    model = TreeModel(Storage(db_file, lazy=True), view)
+    view.setModel(model)
+    view.show()
+    app.processEvents()
+    group = model.index(0, 0)
+    view.expand(group)
+    view.expand(model.index(0, 0, group))
+    app.processEvents()
+    return view
+
+
+def main():
+    app = QtWidgets.QApplication(sys.argv)
+    for n in sizes([0, 100_000, 1_000_000]):
+        print(f"{n:,} attributes")
+        with tempdb() as db_file:
+            if n:
+                populate(db_file, n)
+            if n <= 100_000:
+                with timer('  tree widget (eager)'):
+                    widget_tree(db_file)
+            with timer('  tree model (lazy) + expand'):
+                model_tree(db_file, app).close()
+
+
+if __name__ == '__main__':
+    main()
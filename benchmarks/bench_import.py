@@ -0,0 +1,47 @@
+"""Bulk import throughput, into an empty and into a populated Storage.
+
+Usage: python benchmarks/bench_import.py [N_ATTRIBUTES...]
+"""
+import io
+import yaml
+from common import Storage, DType, tempdb, timer, sizes
+from contacto.serial import Serial
+
+
+def rows(n_attributes, ent_size=10, grp_size=100):
+    """Synthetic import rows, every entity references the previous one.
+    """
+    for i in range(n_attributes):
+        eid = i // ent_size
+        gname, ename = f"G{eid // grp_size}", f"E{eid}"
+        if i % ent_size == 0 and eid:
+            prev = (f"G{(eid - 1) // grp_size}", f"E{eid - 1}", 'A1')
+            yield gname, ename, 'A0', DType.AXREF, prev
+        else:
+            yield gname, ename, f"A{i % ent_size}", DType.TEXT, f"value {i}"
+
+
+def main():
+    for n in sizes([10_000, 100_000]):
+        print(f"{n:,} attributes")
+        with tempdb() as db_file:
+            stor = Storage(db_file, lazy=True)
+            for label in ('bulk_import (new)', 'bulk_import (update)'):
+                with timer(f"  {label}", n), stor.db_conn:
+                    stor.bulk_import(rows(n))
+
+            data = {}
+            for gname, ename, aname, dtype, value in rows(n):
+                if dtype.is_xref():
+                    value = f"REF:{'/'.join(value)}"
+                data.setdefault(gname, {}).setdefault(ename, {})[aname] = \
+                    value
+            text = yaml.safe_dump(data)
+            for libyaml in (False, True):
+                serial = Serial(stor, libyaml)
+                with timer(f"  import_yaml ({serial.backend})", n):
+                    assert serial.import_yaml(io.StringIO(text))
+
+
+if __name__ == '__main__':
+    main()
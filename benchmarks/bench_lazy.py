@@ -0,0 +1,24 @@
+"""Open-and-get latency of an eager vs. a lazy Storage.
+
+Usage: python benchmarks/bench_lazy.py [N_ATTRIBUTES...]
+"""
+from common import Storage, populate, tempdb, timer, sizes
+
+
+def open_and_get(db_file, lazy):
+    stor = Storage(db_file, lazy=lazy)
+    return stor.get_attribute('G1', 'E50', 'A3').get()
+
+
+def main():
+    for n in sizes([10_000, 100_000]):
+        with tempdb() as db_file:
+            populate(db_file, n, bin_size=4096)
+            print(f"{n:,} attributes (+ binary attributes)")
+            for lazy in (False, True):
+                with timer(f"  open+get ({'lazy' if lazy else 'eager'})"):
+                    open_and_get(db_file, lazy)
+
+
+if __name__ == '__main__':
+    main()
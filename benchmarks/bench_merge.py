@@ -0,0 +1,69 @@
+"""Group merge wall time against the number of entities.
+
+Two groups of N entities share half of their entity names, every entity
+holds 10 TEXT attributes. A tenth of the merged group's entities is
+referenced from a third group by an EXREF and an AXREF, which are
+redirected by the merge. Groups are merged in a loaded and a lazy tree.
+
+Usage: python benchmarks/bench_merge.py [N_ENTITIES...]
+"""
+from common import Storage, DType, tempdb, timer, sizes
+from contacto.helpers import refid_to_bytes
+
+ENT_SIZE = 10
+
+
+def populate(db_file, n):
+    """Creates groups "A" (E0, E1, ...) and "B" (starting at E<n/2>),
+    and a group "R" referencing "B".
+    """
+    stor = Storage(db_file)
+    conn = stor.db_conn
+    sql = 'INSERT INTO attribute (name, type, data, entity_id) \
+           VALUES (?, ?, ?, ?)'
+    with conn:
+        for gname, start in (('A', 0), ('B', n // 2)):
+            gid = conn.execute('INSERT INTO "group" VALUES (NULL, ?)',
+                               [gname]).lastrowid
+            for i in range(start, start + n):
+                eid = conn.execute('INSERT INTO entity \
+                                    VALUES (NULL, ?, NULL, ?)',
+                                   (f"E{i}", gid)).lastrowid
+                conn.executemany(sql, ((f"A{j}", DType.TEXT,
+                                        f"{gname} {i} {j}".encode(), eid)
+                                       for j in range(ENT_SIZE)))
+        rid = conn.execute('INSERT INTO "group" VALUES (NULL, ?)',
+                           ['R']).lastrowid
+        eid = conn.execute('INSERT INTO entity VALUES (NULL, ?, NULL, ?)',
+                           ('E', rid)).lastrowid
+        rows = conn.execute('SELECT a.id, e.id FROM attribute AS a \
+                             JOIN entity AS e ON (e.id=a.entity_id) \
+                             JOIN "group" AS g ON (g.id=e.group_id) \
+                             WHERE g.name=? AND a.name=? \
+                             AND e.id % 10 = 0', ('B', 'A0')).fetchall()
+        conn.executemany(sql, ((f"e{target}", DType.EXREF,
+                                refid_to_bytes(target), eid)
+                               for _, target in rows))
+        conn.executemany(sql, ((f"a{aid}", DType.AXREF,
+                                refid_to_bytes(aid), eid)
+                               for aid, _ in rows))
+    del stor
+
+
+def main():
+    for n in sizes([1_000, 10_000]):
+        print(f"groups of {n:,} entities")
+        for lazy in (False, True):
+            with tempdb() as db_file:
+                populate(db_file, n)
+                stor = Storage(db_file, lazy=lazy)
+                dst, src = stor.get_group('A'), stor.get_group('B')
+                with timer(f"  merge ({'lazy' if lazy else 'loaded'})", n):
+                    assert dst.merge_safe(src)
+                assert len(dst.entities) == n * 3 // 2
+                refs = stor.get_entity('R', 'E').attributes.values()
+                assert all(str(ref.data).startswith('A/') for ref in refs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Single-write and bulk-write latency under each Storage profile.
+
+Usage: python benchmarks/bench_profile.py [N_WRITES...]
+"""
+from common import Storage, DType, tempdb, timer, sizes
+from contacto.storage import PROFILES
+
+
+def single_writes(stor, n):
+    """One transaction (commit) per created Attribute.
+    """
+    ent = stor.create_group_safe('Single').create_entity_safe('E')
+    for i in range(n):
+        assert ent.create_attribute_safe(f"A{i}", DType.TEXT, f"value {i}")
+
+
+def bulk_write(stor, n):
+    """A single bulk import transaction.
+    """
+    rows = (('Bulk', f"E{i // 10}", f"A{i % 10}", DType.TEXT, f"value {i}")
+            for i in range(n))
+    with stor.db_conn:
+        stor.bulk_import(rows)
+
+
+def main():
+    for n in sizes([1_000, 100_000]):
+        print(f"{n:,} writes")
+        for profile in PROFILES:
+            with tempdb() as db_file:
+                stor = Storage(db_file, lazy=True, profile=profile)
+                # single writes are slow under the default profile
+                n_single = min(n, 1_000)
+                with timer(f"  {profile}: single writes", n_single):
+                    single_writes(stor, n_single)
+                with timer(f"  {profile}: bulk write", n):
+                    bulk_write(stor, n)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Attribute rotation cost against the history length.
+
+An Attribute is rotated and updated repeatedly, as the watchdog plugin
+does with tracked sources, the last 100 rotations are timed.
+
+Usage: python benchmarks/bench_rotate.py [HISTORY_LENGTH...]
+"""
+from common import Storage, DType, tempdb, timer, sizes
+
+
+def main():
+    for n in sizes([100, 1_000]):
+        print(f"history of {n:,} values")
+        with tempdb() as db_file:
+            stor = Storage(db_file, profile='wal')
+            ent = stor.create_group_safe('G').create_entity_safe('E')
+            attr = ent.create_attribute_safe('A', DType.TEXT, 'value')
+            for i in range(n):
+                with stor.db_conn:
+                    attr.rotate()
+                    attr.data = f"value {i}"
+                    attr.update()
+            with timer('  rotate + update', 100):
+                for i in range(100):
+                    with stor.db_conn:
+                        attr.rotate()
+                        attr.data = f"new value {i}"
+                        attr.update()
+            with timer('  reload'):
+                stor.reload()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Fuzzy value search (get -V -v NEEDLE): linear scan vs. the value index.
+
+Usage: python benchmarks/bench_search.py [N_ATTRIBUTES...]
+"""
+from common import Storage, populate, tempdb, timer, sizes
+from contacto.view import View
+
+
+def search(db_file, needle, indexed):
+    stor = Storage(db_file, lazy=indexed)
+    stor.fts = indexed
+    view = View(stor)
+    view.set_attr_value_filter(needle, True)
+    view.filter()
+    return sum(len(e.attributes) for g in view.groups.values()
+               for e in g.entities.values())
+
+
+def main():
+    for n in sizes([10_000, 100_000, 1_000_000]):
+        with tempdb() as db_file:
+            populate(db_file, n)
+            print(f"{n:,} attributes")
+            for indexed in (False, True):
+                label = 'indexed' if indexed else 'linear scan'
+                with timer(f"  open+search ({label})"):
+                    hits = search(db_file, f"VALUE {n // 2} ", indexed)
+            print(f"  {hits} hit(s)")
+
+
+if __name__ == '__main__':
+    main()
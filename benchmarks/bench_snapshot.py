@@ -0,0 +1,33 @@
+"""Size and speed of a binary snapshot vs. a YAML export.
+
+Usage: python benchmarks/bench_snapshot.py [N_ATTRIBUTES...]
+"""
+import os
+from common import Storage, populate, tempdb, timer, sizes
+from contacto.serial import Serial
+
+
+def main():
+    for n in sizes([10_000, 100_000]):
+        with tempdb() as db_file:
+            populate(db_file, n, bin_size=4096)
+            print(f"{n:,} attributes (+ binary attributes)")
+            dump_dir = os.path.dirname(db_file)
+            for fmt, mode in (('yaml', ''), ('snapshot', 'b')):
+                path = os.path.join(dump_dir, f"dump.{fmt}")
+                serial = Serial(Storage(db_file, lazy=True))
+                export = getattr(serial, f"export_{fmt}")
+                with open(path, f"w{mode}") as f, timer(f"  export {fmt}"):
+                    assert export(f)
+
+                serial = Serial(Storage(os.path.join(dump_dir, f"{fmt}.db"),
+                                        lazy=True))
+                import_ = getattr(serial, f"import_{fmt}")
+                with open(path, f"r{mode}") as f, timer(f"  import {fmt}", n):
+                    assert import_(f)
+                print(f"  {fmt + ' size':<38} "
+                      f"{os.path.getsize(path) / 2**20:10.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
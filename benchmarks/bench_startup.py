@@ -0,0 +1,67 @@
+"""CLI startup: wall time of short commands and their import time.
+
+Every command runs as a new process, as in shell scripts. The import
+time is the cumulative ``python -X importtime`` time of Contacto modules.
+A served ``get`` is forwarded to a running ``contacto serve``.
+
+Usage: python benchmarks/bench_startup.py [RUNS...]
+"""
+import os
+import sys
+import time
+import subprocess
+from common import tempdb, timer, sizes, populate
+from contacto import daemon
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+COMMANDS = ['--help', 'plugin -l', 'get -r G2/E100/A0']
+
+
+def cli(db_file, arg, importtime=False):
+    """Runs a CLI process, returns the import time of Contacto in ms.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    # as installed, modules are not compiled on every run
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    cmd = [sys.executable, *(['-X', 'importtime'] if importtime else []),
+           '-m', 'contacto', '-o', db_file, *arg.split()]
+    res = subprocess.run(cmd, env=env, check=True, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE, universal_newlines=True)
+    return max((int(line.split('|')[1]) / 1000
+                for line in res.stderr.splitlines()
+                if line.split('|')[-1].strip().startswith('contacto')),
+               default=None)
+
+
+def commands(db_file, runs, args, label=''):
+    """Times CLI processes running each command.
+    """
+    for arg in args:
+        imports = cli(db_file, arg, importtime=True)
+        with timer(f"  {arg}{label} (imports {imports:.0f} ms)", runs):
+            for _ in range(runs):
+                cli(db_file, arg)
+
+
+def main():
+    for runs in sizes([20]):
+        print(f"{runs} runs")
+        with tempdb() as db_file:
+            populate(db_file, 10_000)
+            commands(db_file, runs, COMMANDS)
+
+            env = dict(os.environ, PYTHONPATH=ROOT)
+            server = subprocess.Popen([sys.executable, '-m', 'contacto',
+                                       '-o', db_file, 'serve'], env=env,
+                                      stderr=subprocess.DEVNULL)
+            while not os.path.exists(daemon.socket_path(db_file)):
+                time.sleep(0.01)
+            try:
+                commands(db_file, runs, COMMANDS[-1:], ', served')
+            finally:
+                daemon.stop(db_file)
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
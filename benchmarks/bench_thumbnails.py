@@ -0,0 +1,70 @@
+"""Thumbnail validation cost of updates, rotations and imports.
+
+Entities get their thumbnails through AXREFs to a shared picture, so an
+update of the picture propagates to all of them. Pictures alternate
+between two JPEG images, so the same blobs are validated again and again.
+An import of many thumbnails sharing a few images is timed as well.
+
+Usage: python benchmarks/bench_thumbnails.py [N_ENTITIES...]
+"""
+import io
+from PIL import Image
+from common import Storage, DType, tempdb, timer, sizes
+
+RUNS = 20
+
+
+def jpeg(color, size=512):
+    """Encodes a noisy image, so that decoding it takes a while.
+    """
+    img = Image.effect_noise((size, size), 64).convert('RGB')
+    img.paste(color, (0, 0, size // 2, size // 2))
+    bio = io.BytesIO()
+    img.save(bio, 'JPEG')
+    return bio.getvalue()
+
+
+def main():
+    images = [jpeg(color) for color in ('red', 'blue')]
+    for n in sizes([10, 100]):
+        print(f"{n:,} entities sharing a thumbnail, {RUNS} runs")
+        with tempdb() as db_file:
+            stor = Storage(db_file)
+            grp = stor.create_group_safe('G')
+            with stor.db_conn:
+                pic = grp.create_entity('P').create_attribute(
+                    'pic', DType.BIN, images[0])
+                for i in range(n):
+                    grp.create_entity(f"E{i}").create_attribute(
+                        'thumbnail', DType.AXREF, pic)
+            with timer('  update shared picture', RUNS):
+                for i in range(RUNS):
+                    with stor.db_conn:
+                        pic.data = images[(i + 1) % 2]
+                        pic.update()
+            with timer('  rotate + update', RUNS):
+                for i in range(RUNS):
+                    with stor.db_conn:
+                        pic.rotate()
+                        pic.data = images[i % 2]
+                        pic.update()
+            with timer('  deferred updates (1 commit)', RUNS):
+                stor.defer_thumbnails(True)
+                with stor.db_conn:
+                    for i in range(RUNS):
+                        pic.data = images[(i + 1) % 2]
+                        pic.update()
+                    stor.validate_thumbnails()
+                stor.defer_thumbnails(False)
+
+        with tempdb() as db_file:
+            stor = Storage(db_file)
+            rows = [('G', f"E{i}", 'thumbnail', DType.BIN, images[i % 2])
+                    for i in range(n)]
+            with timer('  bulk import', n):
+                with stor.db_conn:
+                    stor.bulk_import(rows)
+
+
+if __name__ == '__main__':
+    main()
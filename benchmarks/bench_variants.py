@@ -0,0 +1,57 @@
+"""Downscaled thumbnail variants: making them and the data they save.
+
+Distinct photo-sized thumbnails are imported, their variants are then
+made again in this process and in a pool of worker processes.
+Reading all 64 px variants (as GUI icons) is compared to reading
+the full thumbnails.
+
+Usage: python benchmarks/bench_variants.py [N_THUMBNAILS...]
+"""
+import io
+import os
+from PIL import Image
+from common import Storage, DType, tempdb, timer, sizes
+
+CAT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                   'tests', 'fixtures', 'cat.jpg')
+
+
+def photo(i, size=(2048, 1536)):
+    """Encodes a distinct photo-sized JPEG, the test cat with some noise.
+    """
+    img = Image.open(CAT).resize(size)
+    noise = Image.effect_noise(size, 16 + i).convert('RGB')
+    img = Image.blend(img, noise, 0.1)
+    bio = io.BytesIO()
+    img.save(bio, 'JPEG', quality=90)
+    return bio.getvalue()
+
+
+def main():
+    for n in sizes([16, 64]):
+        print(f"{n:,} thumbnails")
+        rows = [('G', f"E{i}", 'thumbnail', DType.BIN, photo(i))
+                for i in range(n)]
+        with tempdb() as db_file:
+            stor = Storage(db_file)
+            with timer('  bulk import', n):
+                with stor.db_conn:
+                    stor.bulk_import(rows)
+            for label, workers in (('in process', 0), ('worker pool', None)):
+                with stor.db_conn:
+                    stor.db_conn.execute('DELETE FROM thumbnail_variant')
+                with timer(f"  make variants ({label})", n):
+                    with stor.db_conn:
+                        stor.make_variants(workers=workers)
+
+            entities = stor.get_group('G').entities.values()
+            with timer('  read full thumbnails', n):
+                full = sum(len(e.get_thumbnail()) for e in entities)
+            with timer('  read 64 px variants', n):
+                small = sum(len(e.get_thumbnail(size=64)) for e in entities)
+            print(f"  {full / 2**20:.1f} MiB full, {small / 2**10:.1f} KiB"
+                  f" 64 px ({full // small:,}x less)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Watchdog refresh wall time against the number of sources.
+
+Sources are served by a local HTTP server that delays every response
+to simulate network latency. A single worker stands for sequential fetching.
+A second refresh revalidates all sources, which the server answers with
+304 Not Modified.
+
+Usage: python benchmarks/bench_watchdog.py [N_SOURCES...]
+"""
+import os
+import sys
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from common import Storage, DType, tempdb, timer, sizes
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'plugins'))
+import contacto_watchdog as watchdog  # noqa: E402
+
+LATENCY = 0.05  # seconds
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(LATENCY)
+        body = self.path.encode()
+        etag = f'"{self.path}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    # sources are spread over 4 hosts (local servers)
+    servers = [ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+               for _ in range(4)]
+    for httpd in servers:
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    hosts = [f"127.0.0.1:{httpd.server_address[1]}" for httpd in servers]
+
+    for n in sizes([100, 500]):
+        print(f"{n:,} sources ({LATENCY * 1000:.0f} ms latency)")
+        for workers in (1, watchdog.MAX_WORKERS):
+            with tempdb() as db_file:
+                stor = Storage(db_file, profile='wal')
+                with stor.db_conn:
+                    stor.bulk_import(
+                        ('G', f"E{i}", 'bio_textsource', DType.TEXT,
+                         f"http://{hosts[i % len(hosts)]}/{i}")
+                        for i in range(n))
+                watchdog.MAX_WORKERS = workers
+                with timer(f"  {workers} worker(s)", n):
+                    assert watchdog.plugin_init(stor)
+                with timer(f"  {workers} worker(s), revalidated", n):
+                    assert watchdog.plugin_init(stor)
+    for httpd in servers:
+        httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main()
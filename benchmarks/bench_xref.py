@@ -0,0 +1,42 @@
+"""Resolving AXREF chains against the chain length.
+
+Every Attribute of a chain is resolved once, as dumps and searches do.
+The first pass resolves the chain, later passes are answered by the cache.
+Reloading checks the whole tree for loops, references created into
+the chain are checked one by one.
+
+Usage: python benchmarks/bench_xref.py [CHAIN_LENGTH...]
+"""
+from common import Storage, DType, tempdb, timer, sizes
+
+
+def main():
+    for n in sizes([100, 500, 5_000]):
+        print(f"chain of {n:,} AXREFs")
+        with tempdb() as db_file:
+            stor = Storage(db_file)
+            rows = [('G', 'E', 'A0', DType.TEXT, 'value')]
+            rows.extend(('G', 'E', f"A{i}", DType.AXREF,
+                         ('G', 'E', f"A{i - 1}")) for i in range(1, n + 1))
+            with stor.db_conn:
+                stor.bulk_import(rows)
+            with timer('  reload', n):
+                stor.reload()
+            attrs = list(stor.get_entity('G', 'E').attributes.values())
+            for label in ('first pass', 'cached'):
+                with timer(f"  get() of all, {label}", len(attrs)):
+                    for attr in attrs:
+                        assert attr.get() == (DType.TEXT, 'value')
+            link = stor.get_attribute('G', 'E', f"A{n // 2}")
+            link.type, link.data = DType.TEXT, 'new'
+            with timer('  update in the middle'):
+                assert link.update_safe()
+            ent = stor.create_group_safe('H').create_entity_safe('F')
+            with timer('  create references to the chain end', 100):
+                with stor.db_conn:
+                    for i in range(100):
+                        ent.create_attribute(f"R{i}", DType.AXREF, attrs[-1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Shared helpers for Contacto benchmarks.
+
+Benchmarks are plain scripts, run them from the project root, e.g.:
+
+    $ python benchmarks/bench_lazy.py
+"""
+import os
+import sys
+import time
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from contacto.storage import Storage  # noqa: E402
+from contacto.helpers import DType, blob_digest  # noqa: E402
+
+
+def populate(db_file, n_attributes, ent_size=10, grp_size=100, bin_size=0):
+    """Fills a database with a synthetic contact tree.
+
+    Every entity gets `ent_size` TEXT attributes, every group holds
+    `grp_size` entities. If `bin_size` is set, each entity also gets
+    a binary attribute of that size.
+
+    :return: number of entities created
+    :rtype:  int
+    """
+    stor = Storage(db_file)
+    conn = stor.db_conn
+    n_entities = max(1, n_attributes // ent_size)
+    blob = os.urandom(bin_size) if bin_size else None
+    with conn:
+        for gid in range(1, n_entities // grp_size + 2):
+            conn.execute('INSERT INTO "group" VALUES (?, ?)', (gid, f"G{gid}"))
+        conn.executemany(
+            'INSERT INTO entity VALUES (?, ?, NULL, ?)',
+            ((eid, f"E{eid}", eid // grp_size + 1)
+             for eid in range(n_entities)))
+        conn.executemany(
+            'INSERT INTO attribute (name, type, data, entity_id) \
+             VALUES (?, ?, ?, ?)',
+            ((f"A{i % ent_size}", DType.TEXT,
+              f"value {i} of entity {i // ent_size}".encode(), i // ent_size)
+             for i in range(n_entities * ent_size)))
+        if blob:
+            # distinct data, stored as shared blobs referenced by hash
+            blobs = [blob[:-8] + eid.to_bytes(8, byteorder='little')
+                     for eid in range(n_entities)]
+            conn.executemany(
+                'INSERT INTO blob (hash, data) VALUES (?, ?)',
+                ((blob_digest(data), data) for data in blobs))
+            conn.executemany(
+                'INSERT INTO attribute (name, type, data, entity_id) \
+                 VALUES (?, ?, ?, ?)',
+                (('photo', DType.BIN, blob_digest(data), eid)
+                 for eid, data in enumerate(blobs)))
+    del stor
+    return n_entities
+
+
+@contextlib.contextmanager
+def tempdb():
+    """Yields a path to a temporary database file.
+    """
+    with tempfile.TemporaryDirectory() as d:
+        yield os.path.join(d, 'bench.db')
+
+
+@contextlib.contextmanager
+def timer(label, count=None):
+    """Prints wall time of the enclosed block (and throughput if counted).
+    """
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    rate = f", {count / elapsed:,.0f}/s" if count else ''
+    print(f"{label:<40} {elapsed * 1000:10.1f} ms{rate}")
+
+
+def sizes(default):
+    """Problem sizes from the command line or the provided defaults.
+    """
+    return [int(arg) for arg in sys.argv[1:]] or default
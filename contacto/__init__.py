@@ -1,3 +1,11 @@
-from .cli import main
+def main():
+    """CLI entrypoint, see `contacto.cli.main`.
+
+    The CLI is imported on use, so importing a Contacto module
+    does not import the CLI and its dependencies.
+    """
+    from .cli import main
+    main()
+
 
 __all__ = ['main']
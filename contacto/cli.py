@@ -1,14 +1,33 @@
 """CLI interface using Click.
+
+Modules with heavy dependencies (YAML, images, plugins) are imported
+by the commands using them, so that starting the CLI stays fast.
 """
 
 import click
 import sys
-from .storage import Storage
+import json
+import time
+import signal
+from .storage import Storage, Group, PROFILES
 from .helpers import parse_refspec, parse_valspec
 from .helpers import DType, Scope, dump_lscope, refspec_scope
-from .helpers import print_warning, print_error, get_plugins, run_plugins
-from .view import View
-from .serial import Serial
+from .helpers import print_warning, print_error, find_plugins, run_plugins
+from .helpers import size_str
+from . import daemon
+
+# batch operations and the names of their JSON arguments
+BATCH_ARGS = {
+    'set': ('refspec', 'value'),
+    'del': ('refspec',),
+    'merge': ('src', 'dst'),
+}
+
+
+def rspec_str(p_rspec):
+    """Formats a parsed refspec.
+    """
+    return '/'.join(name for name in p_rspec if name)
 
 
 def group_set(storage, gname):
@@ -21,8 +40,7 @@ def group_set(storage, gname):
     :return: created group
     :rtype:  class:`contacto.storage.Group`
     """
-    return storage.get_group(gname) or \
-        storage.create_group_safe(gname) or sys.exit(1)
+    return storage.get_group(gname) or storage.create_group(gname)
 
 
 def entity_set(storage, gname, ename, recursive):
@@ -38,6 +56,7 @@ def entity_set(storage, gname, ename, recursive):
     :type  recursive: bool
     :return: created entity
     :rtype:  class:`contacto.storage.Entity`
+    :raises Exception: the group does not exist
     """
     ent = storage.get_entity(gname, ename)
     if ent:
@@ -47,9 +66,152 @@ def entity_set(storage, gname, ename, recursive):
     else:
         grp = storage.get_group(gname)
         if not grp:
-            print_error(f"Group {gname} does not exist.")
-            sys.exit(1)
-    return grp.create_entity_safe(ename) or sys.exit(1)
+            raise Exception(f"Group {gname} does not exist.")
+    return grp.create_entity(ename)
+
+
+def value_parse(storage, value):
+    """Parses a valspec, resolving references.
+
+    :param storage: used storage
+    :type  storage: class:`contacto.storage.Storage`
+    :param value: valspec
+    :type  value: str
+    :return: attribute type and data, (None, None) if no value is given
+    :rtype:  tuple
+    :raises Exception: invalid valspec or reference
+    """
+    vtype, vdata = parse_valspec(value)
+    if vtype and vtype.is_xref():
+        vdata = storage.get_from_rspec(vdata)
+        if not vdata:
+            raise Exception("Invalid reference")
+    return vtype, vdata
+
+
+def element_set(storage, p_rspec, vtype, vdata, recursive=False,
+                rotate=False, keep=None):
+    """Creates or updates an element (the set command).
+
+    Attributes are set to the value, other elements ignore it.
+    Not transactional, see `transaction`.
+
+    :param storage: used storage
+    :type  storage: class:`contacto.storage.Storage`
+    :param p_rspec: parsed full refspec
+    :type  p_rspec: tuple
+    :param vtype: attribute type
+    :type  vtype: class:`contacto.helpers.DType`
+    :param vdata: attribute data
+    :param recursive: create missing parents
+    :type  recursive: bool, optional
+    :param rotate: rotate the previous attribute value
+    :type  rotate: bool, optional
+    :param keep: keep at most this many rotated values
+    :type  keep: int, optional
+    :raises Exception: the element cannot be set
+    """
+    scope = refspec_scope(p_rspec)
+    if scope == Scope.GROUP:
+        group_set(storage, p_rspec[0])
+        return
+    if scope == Scope.ENTITY:
+        entity_set(storage, *p_rspec[:2], recursive)
+        return
+    if not vtype:
+        raise Exception('Attributes require supplied value.')
+    attr = storage.get_attribute(*p_rspec)
+    if attr:
+        if vtype == attr.type and vdata == attr.data:
+            return
+        if rotate:
+            attr.rotate(keep)
+        attr.type, attr.data = vtype, vdata
+        attr.update()
+        return
+    if recursive:
+        ent = entity_set(storage, *p_rspec[:2], recursive)
+    else:
+        ent = storage.get_entity(*p_rspec[:2])
+        if not ent:
+            raise Exception(f"Entity {rspec_str(p_rspec[:2])} "
+                            "does not exist.")
+    ent.create_attribute(p_rspec[2], vtype, vdata)
+
+
+def element_del(storage, p_rspec):
+    """Deletes an element (the del command).
+    Not transactional, see `transaction`.
+
+    :param storage: used storage
+    :type  storage: class:`contacto.storage.Storage`
+    :param p_rspec: parsed full refspec
+    :type  p_rspec: tuple
+    :raises Exception: the element does not exist
+    """
+    elem = storage.get_from_rspec(p_rspec)
+    if not elem:
+        raise Exception(f"{rspec_str(p_rspec)} does not exist.")
+    elem.delete()
+
+
+def element_merge(storage, p_rspec_src, p_rspec_dst):
+    """Merges an element into another one (the merge command).
+    Not transactional, see `transaction`.
+
+    :param storage: used storage
+    :type  storage: class:`contacto.storage.Storage`
+    :param p_rspec_src: parsed full refspec of the merged element
+    :type  p_rspec_src: tuple
+    :param p_rspec_dst: parsed full refspec of the element merged into
+    :type  p_rspec_dst: tuple
+    :raises Exception: the elements cannot be merged
+    """
+    src = storage.get_from_rspec(p_rspec_src)
+    dst = storage.get_from_rspec(p_rspec_dst)
+    for elem, p_rspec in ((src, p_rspec_src), (dst, p_rspec_dst)):
+        if not elem:
+            raise Exception(f"{rspec_str(p_rspec)} does not exist.")
+    if type(src) != type(dst) or not hasattr(src, 'merge'):
+        raise Exception('You can only merge 2 entities or 2 groups.')
+    dst.merge(src)
+
+
+def transaction(storage, operation, *args):
+    """Runs an element operation in a single transaction.
+
+    The in-memory tree is read anew if it fails.
+
+    :param storage: used storage
+    :type  storage: class:`contacto.storage.Storage`
+    :param operation: operation taking the storage and args
+    :type  operation: Callable
+    :return: success
+    :rtype:  bool
+    """
+    try:
+        with storage.db_conn:
+            operation(storage, *args)
+        return True
+    except Exception as e:
+        print_error(e)
+        storage.reload()
+        return False
+
+
+def make_variants(storage):
+    """Makes downscaled variants of thumbnails set by a command.
+
+    Runs once the command is done, in a transaction of its own.
+
+    :param storage: used storage
+    :type  storage: class:`contacto.storage.Storage`
+    """
+    try:
+        with storage.db_conn:
+            storage.make_pending_variants()
+    except Exception as e:
+        print_error(e)
 
 
 def validate_refspec(ctx, param, value):
@@ -91,12 +253,19 @@ def validate_full_refspec(ctx, param, value):
 @click.group()
 @click.option('-o', '--open', 'dbname', type=click.Path(exists=False),
               required=True, help='Path to storage file')
+@click.option('-p', '--profile', help='Storage connection tuning profile.',
+              type=click.Choice(list(PROFILES)),
+              default='default', show_default=True)
 @click.pass_context
-def main_cmd(ctx, dbname):
+def main_cmd(ctx, dbname, profile):
     """Contacto CLI: manage your contacts in the console."""
 
     ctx.ensure_object(dict)
-    ctx.obj['storage'] = Storage(dbname)
+    # a running server provides its own storage
+    if 'storage' not in ctx.obj:
+        storage = Storage(dbname, lazy=True, profile=profile)
+        ctx.obj['storage'] = storage
+        ctx.call_on_close(lambda: make_variants(storage))
 
 
 @main_cmd.command(name='get')
@@ -115,6 +284,8 @@ def main_cmd(ctx, dbname):
 @click.pass_context
 def get_cmd(ctx, scope, fuzzy, value, val_fuzzy, raw, yaml, refspec):
     """Fetch and print matching elements"""
+    from .view import View
+    from .serial import Serial
 
     scope = Scope.from_str(scope)
     if val_fuzzy and not value:
@@ -140,10 +311,12 @@ def get_cmd(ctx, scope, fuzzy, value, val_fuzzy, raw, yaml, refspec):
               help='Read binary data (use with -i).', is_flag=True)
 @click.option('-i', '--stdin', help='Read VALUE from stdin.', is_flag=True)
 @click.option('-R', '--rotate', help='Rotate attribute value.', is_flag=True)
+@click.option('-k', '--keep', type=click.IntRange(min=0),
+              help='Keep at most N rotated values (use with -R).')
 @click.argument('refspec', callback=validate_full_refspec)
 @click.argument('value', required=False)
 @click.pass_context
-def set_cmd(ctx, recursive, binary, stdin, rotate, refspec, value):
+def set_cmd(ctx, recursive, binary, stdin, rotate, keep, refspec, value):
     """Create or update a REFSPEC-specified element.
 
     VALUE sets thumbnails of entities and values of attributes."""
@@ -154,47 +327,17 @@ def set_cmd(ctx, recursive, binary, stdin, rotate, refspec, value):
     stor = ctx.obj['storage']
     if not stdin:
         try:
-            vtype, vdata = parse_valspec(value)
+            vtype, vdata = value_parse(stor, value)
         except Exception as e:
             print_error(e)
             sys.exit(1)
-        if vtype and vtype.is_xref():
-            vdata = stor.get_from_rspec(vdata)
-            if not vdata:
-                print_error("Invalid reference")
-                sys.exit(1)
     elif not binary:
         vtype, vdata = DType.TEXT, sys.stdin.read()
     else:
         vtype, vdata = DType.BIN, sys.stdin.buffer.read()
 
-    scope = refspec_scope(refspec)
-    if scope == Scope.GROUP:
-        group_set(stor, refspec[0])
-    if scope == Scope.ENTITY:
-        entity_set(stor, *refspec[:2], recursive)
-    if scope == Scope.ATTRIBUTE:
-        if not vtype:
-            print_error(f'Attributes require supplied value.')
-            sys.exit(1)
-        attr = stor.get_attribute(*refspec)
-        if attr:
-            if vtype == attr.type or vdata == attr.data:
-                return
-            if rotate:
-                attr.rotate_safe() or sys.exit(1)
-            attr.type, attr.data = vtype, vdata
-            attr.update_safe() or sys.exit(1)
-            return
-        entp = refspec[:2]
-        if recursive:
-            ent = entity_set(stor, *entp, recursive)
-        else:
-            ent = stor.get_entity(*entp)
-            if not ent:
-                print_error(f"Entity {'/'.join(entp)} does not exist.")
-                sys.exit(1)
-        ent.create_attribute_safe(refspec[2], vtype, vdata) or sys.exit(1)
+    transaction(stor, element_set, refspec, vtype, vdata, recursive,
+                rotate, keep) or sys.exit(1)
 
 
 @main_cmd.command(name='del')
@@ -203,9 +346,7 @@ def set_cmd(ctx, recursive, binary, stdin, rotate, refspec, value):
 def del_cmd(ctx, refspec):
     """Delete a REFSPEC-specified element."""
 
-    stor = ctx.obj['storage']
-    elem = stor.get_from_rspec(refspec) or sys.exit(1)
-    elem.delete_safe() or sys.exit(1)
+    transaction(ctx.obj['storage'], element_del, refspec) or sys.exit(1)
 
 
 @main_cmd.command(name='merge')
@@ -215,34 +356,322 @@ def del_cmd(ctx, refspec):
 def merge_cmd(ctx, refspec_src, refspec_dst):
     """Merge entity/group specified by REFSPEC_SRC into REFSPEC_DST."""
 
-    stor = ctx.obj['storage']
-    src = stor.get_from_rspec(refspec_src) or sys.exit(1)
-    dst = stor.get_from_rspec(refspec_dst) or sys.exit(1)
+    transaction(ctx.obj['storage'], element_merge, refspec_src,
+                refspec_dst) or sys.exit(1)
 
-    if type(src) != type(dst) or not hasattr(src, 'merge'):
-        print_error('You can only merge 2 entities or 2 groups.')
+
+def batch_parse(line, fmt):
+    """Parses a batch operation line.
+
+    TSV lines hold the operation and its arguments, JSON lines hold
+    an object with the operation in "op" and its arguments by name.
+
+    :param line: operation line
+    :type  line: str
+    :param fmt: line format, tsv or json
+    :type  fmt: str
+    :return: operation name, arguments and per-line set options
+    :rtype:  tuple
+    :raises Exception: malformed line
+    """
+    if fmt == 'json':
+        obj = json.loads(line)
+        if not isinstance(obj, dict):
+            raise Exception('JSON object required')
+        op = obj.get('op')
+        names = BATCH_ARGS.get(op, ())
+        args = [obj.get(name) for name in names]
+        opts = {key: obj[key] for key in ('recursive', 'rotate', 'keep')
+                if key in obj}
+    else:
+        op, *args = line.split('\t')
+        opts = {}
+    if op not in BATCH_ARGS:
+        raise Exception(f"Unknown operation: {op}")
+    required = len(BATCH_ARGS[op]) - (op == 'set')
+    if not required <= len(args) <= len(BATCH_ARGS[op]) or \
+            None in args[:required] or \
+            not all(isinstance(arg, str) for arg in args if arg is not None):
+        raise Exception(f"Invalid {op} arguments")
+    return op, args, opts
+
+
+def batch_refspec(refspec):
+    """Parses a full refspec of a batch operation.
+
+    :param refspec: refspec
+    :type  refspec: str
+    :return: parsed refspec
+    :rtype:  tuple
+    :raises Exception: invalid refspec
+    """
+    p_rspec = parse_refspec(refspec)
+    if not refspec_scope(p_rspec):
+        raise Exception('Fully-specified refspec required')
+    return p_rspec
+
+
+def batch_run(storage, op, args, opts):
+    """Runs a batch operation like the matching CLI command.
+    Not transactional, values are resolved when the operation runs.
+
+    :param storage: used storage
+    :type  storage: class:`contacto.storage.Storage`
+    :param op: operation name (set, del or merge)
+    :type  op: str
+    :param args: refspec arguments, followed by the valspec of set
+    :type  args: list
+    :param opts: set options (recursive, rotate, keep)
+    :type  opts: dict
+    :raises Exception: the operation failed
+    """
+    if op == 'set':
+        refspec = batch_refspec(args[0])
+        value = args[1] if len(args) > 1 else None
+        element_set(storage, refspec, *value_parse(storage, value), **opts)
+    elif op == 'del':
+        element_del(storage, batch_refspec(args[0]))
+    else:
+        element_merge(storage, *map(batch_refspec, args))
+
+
+@main_cmd.command(name='batch')
+@click.option('-f', '--format', 'fmt', help='Input line format.',
+              type=click.Choice(['tsv', 'json']),
+              default='tsv', show_default=True)
+@click.option('-n', '--batch-size', type=click.IntRange(min=1),
+              default=1000, show_default=True,
+              help='Commit after every N operations.')
+@click.option('-r', '--recursive',
+              help='Create elements recursively.', is_flag=True)
+@click.option('-R', '--rotate', help='Rotate attribute values.', is_flag=True)
+@click.option('-k', '--keep', type=click.IntRange(min=0),
+              help='Keep at most N rotated values (use with -R).')
+@click.argument('file', type=click.File('r'), default='-')
+@click.pass_context
+def batch_cmd(ctx, fmt, batch_size, recursive, rotate, keep, file):
+    """Run set/del/merge operations read from FILE (stdin by default).
+
+    TSV lines are "set REFSPEC [VALUE]", "del REFSPEC" and
+    "merge REFSPEC_SRC REFSPEC_DST", fields separated by tabs.
+    JSON lines are objects such as {"op": "set", "refspec": ...,
+    "value": ..., "recursive": true}, {"op": "del", "refspec": ...}
+    and {"op": "merge", "src": ..., "dst": ...}.
+
+    Operations behave like the commands of the same name. A failed one
+    is reported with its line number and undone, the others go on."""
+
+    stor = ctx.obj['storage']
+    conn = stor.db_conn
+    defaults = {'recursive': recursive, 'rotate': rotate, 'keep': keep}
+    ops = failed = 0
+    start = time.perf_counter()
+    # thumbnails are validated once per commit
+    stor.defer_thumbnails(True)
+    try:
+        for n, line in enumerate(file, 1):
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            # a failed operation is undone alone
+            conn.execute('SAVEPOINT batch_op')
+            try:
+                op, args, opts = batch_parse(line, fmt)
+                batch_run(stor, op, args, {**defaults, **opts})
+                conn.execute('RELEASE batch_op')
+            except Exception as e:
+                conn.execute('ROLLBACK TO batch_op')
+                conn.execute('RELEASE batch_op')
+                print_error(f"line {n}: {e}")
+                stor.reload()
+                failed += 1
+            ops += 1
+            if ops % batch_size == 0:
+                stor.validate_thumbnails()
+                conn.commit()
+        stor.validate_thumbnails()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        stor.reload()
+        raise
+    finally:
+        stor.defer_thumbnails(False)
+    secs = time.perf_counter() - start
+    click.echo(f"{ops} operations, {failed} failed in {secs:.2f} s "
+               f"({ops / secs if secs else 0:.0f} ops/s)", err=True)
+    if failed:
         sys.exit(1)
-    dst.merge_safe(src) or sys.exit(1)
+
+
+def yaml_serial(storage, pure, verbose):
+    """Creates a Serial with the selected YAML backend, may report it.
+    """
+    from .serial import Serial
+    serial = Serial(storage, libyaml=not pure)
+    if verbose:
+        click.echo(f"YAML backend: {serial.backend}", err=True)
+    return serial
 
 
 @main_cmd.command(name='import')
+@click.option('-f', '--format', 'fmt', help='Input data format.',
+              type=click.Choice(['yaml', 'snapshot']),
+              default='yaml', show_default=True)
+@click.option('-P', '--pure', is_flag=True,
+              help='Use the pure-Python YAML parser.')
+@click.option('-v', '--verbose', is_flag=True,
+              help='Report the used YAML backend.')
 @click.argument('file', type=click.File('r'), required=False)
 @click.pass_context
-def import_cmd(ctx, file):
-    """Import YAML data from FILE or stdin."""
-
-    serial = Serial(ctx.obj['storage'])
-    serial.import_yaml(file or sys.stdin) or sys.exit(1)
+def import_cmd(ctx, fmt, pure, verbose, file):
+    """Import YAML data (or a snapshot) from FILE or stdin."""
+
+    file = file or sys.stdin
+    if fmt == 'snapshot':
+        from .serial import Serial
+        serial = Serial(ctx.obj['storage'])
+        serial.import_snapshot(file.buffer) or sys.exit(1)
+        return
+    serial = yaml_serial(ctx.obj['storage'], pure, verbose)
+    serial.import_yaml(file) or sys.exit(1)
 
 
 @main_cmd.command(name='export')
+@click.option('-f', '--format', 'fmt', help='Output data format.',
+              type=click.Choice(['yaml', 'snapshot']),
+              default='yaml', show_default=True)
+@click.option('-P', '--pure', is_flag=True,
+              help='Use the pure-Python YAML emitter.')
+@click.option('-v', '--verbose', is_flag=True,
+              help='Report the used YAML backend.')
+@click.option('-s', '--since', type=click.IntRange(min=0),
+              help='Export elements changed after change SEQ only.')
+@click.option('-t', '--thumbnail-size', 'thumb_size',
+              type=click.IntRange(min=1),
+              help='Export thumbnail attributes downscaled to N px or more.')
 @click.argument('file', type=click.File('w'), required=False)
 @click.pass_context
-def export_cmd(ctx, file):
-    """Export YAML data to FILE or stdout. Similar to 'get -y'"""
+def export_cmd(ctx, fmt, pure, verbose, since, thumb_size, file):
+    """Export YAML data (or a snapshot) to FILE or stdout.
+    Similar to 'get -y'"""
+
+    file = file or sys.stdout
+    if fmt == 'snapshot':
+        if since is not None:
+            print_error('Snapshots cannot be incremental.')
+            sys.exit(1)
+        if thumb_size is not None:
+            print_error('Snapshots keep full thumbnails.')
+            sys.exit(1)
+        from .serial import Serial
+        serial = Serial(ctx.obj['storage'])
+        serial.export_snapshot(file.buffer) or sys.exit(1)
+        return
+    storage = ctx.obj['storage']
+    if since is not None:
+        from .view import View
+        storage = View(storage)
+        storage.set_change_filter(since)
+        storage.filter()
+    serial = yaml_serial(storage, pure, verbose)
+    serial.export_yaml(file, thumb_size=thumb_size) or sys.exit(1)
+
+
+@main_cmd.command(name='changes')
+@click.option('-s', '--since', type=click.IntRange(min=0), default=0,
+              help='Print changes after change SEQ only.')
+@click.option('-l', '--last', is_flag=True,
+              help='Print the last change SEQ only.')
+@click.pass_context
+def changes_cmd(ctx, since, last):
+    """Print logged changes (SEQ, operation, refspec), oldest first.
+    Operations are I(nsert), U(pdate) and D(elete)."""
+
+    storage = ctx.obj['storage']
+    if last:
+        click.echo(storage.last_change())
+        return
+    for seq, op, _, _, rspec in storage.changes(since):
+        click.echo(f"{seq}\t{op}\t{rspec}")
+
+
+@main_cmd.command(name='backlinks')
+@click.option('-t', '--transitive', is_flag=True,
+              help='Include references to the references, recursively.')
+@click.argument('refspec', callback=validate_full_refspec)
+@click.pass_context
+def backlinks_cmd(ctx, refspec, transitive):
+    """Print refspecs of references to an entity or an attribute."""
+
+    storage = ctx.obj['storage']
+    elem = storage.get_from_rspec(refspec) or sys.exit(1)
+    if isinstance(elem, Group):
+        print_error('Only entities and attributes may be referenced.')
+        sys.exit(1)
+    for rspec in storage.backlinks(elem, transitive):
+        click.echo(rspec)
+
+
+@main_cmd.command(name='stats')
+@click.pass_context
+def stats_cmd(ctx):
+    """Print binary data statistics and the space saved by sharing it."""
+
+    stats = ctx.obj['storage'].blob_stats()
+    click.echo(f"Blobs:      {stats['blobs']} "
+               f"({stats['references']} references)")
+    click.echo(f"Stored:     {size_str(stats['stored'])}")
+    click.echo(f"Referenced: {size_str(stats['referenced'])}")
+    click.echo(f"Saved:      {size_str(stats['saved'])}")
 
-    serial = Serial(ctx.obj['storage'])
-    serial.export_yaml(file or sys.stdout) or sys.exit(1)
+
+@main_cmd.command(name='thumbnails')
+@click.option('-j', '--jobs', type=click.IntRange(min=0),
+              help='Number of worker processes (0: none, default: CPUs).')
+@click.pass_context
+def thumbnails_cmd(ctx, jobs):
+    """Make missing downscaled variants of entity thumbnails.
+
+    Variants are made after commands setting thumbnails, this fills them
+    in for thumbnails set by older versions of Contacto."""
+
+    storage = ctx.obj['storage']
+    try:
+        with storage.db_conn:
+            count = storage.make_variants(workers=jobs)
+    except Exception as e:
+        print_error(e)
+        sys.exit(1)
+    click.echo(f"Downscaled {count} thumbnails.")
+
+
+@main_cmd.command(name='serve')
+@click.option('-s', '--stop', is_flag=True, help='Stop the running server.')
+@click.pass_context
+def serve_cmd(ctx, stop):
+    """Keep the storage open and serve get/set/del/merge commands.
+
+    While the server runs, the CLI forwards these commands to it through
+    a socket next to the storage file. Stop it with -s or a signal."""
+
+    storage = ctx.obj['storage']
+    if stop:
+        daemon.stop(storage.db_file) or sys.exit(1)
+        return
+    # stops like Ctrl-C, commands do not catch it
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    server = daemon.Server(storage, main_cmd)
+    try:
+        server.serve(lambda: click.echo(f"Serving on {server.path}",
+                                        err=True))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print_error(e)
+        sys.exit(1)
 
 
 @main_cmd.command(name='plugin')
@@ -253,7 +682,7 @@ def plugin_cmd(ctx, list, whitelist):
     """Run Contacto plugins, optionally specify which by name"""
 
     if list:
-        click.echo(', '.join(get_plugins().keys()))
+        click.echo(', '.join(find_plugins().keys()))
         return
 
     ok, nok = run_plugins(ctx.obj['storage'], whitelist)
@@ -267,6 +696,10 @@ def plugin_cmd(ctx, list, whitelist):
 
 
 def main():
-    """CLI entrypoint, initializes the Click main command"""
+    """CLI entrypoint, initializes the Click main command.
+    Served commands are forwarded to a running server instead."""
 
+    code = daemon.forward(sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
     main_cmd(prog_name='contacto')
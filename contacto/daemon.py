@@ -0,0 +1,332 @@
+"""Storage server keeping the tree warm between CLI invocations.
+
+The server (``contacto serve``) keeps a Storage open and runs served CLI
+commands sent over a Unix domain socket placed next to the storage file.
+The CLI forwards served commands to it while it runs, so the command
+output and exit code are the same as if it was run locally.
+
+Each connection carries a single exchange of JSON lines::
+
+    {"args": ["-o", "my.db", "get", "Family"], "cwd": "/home/me"}
+    {"code": 0, "out": "<base64 stdout>", "err": "<base64 stderr>"}
+
+Commands run in the working directory of the client, so that relative
+paths (``FILE:`` valspecs) resolve as they would locally.
+
+A ``{"stop": true}`` request stops the server.
+"""
+import os
+import io
+import sys
+import json
+import base64
+import socket
+import traceback
+
+# CLI commands answered by the server
+SERVED = ('get', 'set', 'del', 'merge')
+# server socket file suffix, appended to the storage file path
+SOCKET_SUFFIX = '.sock'
+
+
+def socket_path(dbname):
+    """Server socket path of a storage file.
+
+    :param dbname: storage file path
+    :type  dbname: str
+    :return: socket path
+    :rtype:  str
+    """
+    return os.path.abspath(dbname) + SOCKET_SUFFIX
+
+
+def split_args(args):
+    """Finds the storage file and the command in CLI arguments.
+
+    Only the main command options are scanned, see `contacto.cli.main_cmd`.
+
+    :param args: CLI arguments
+    :type  args: list
+    :return: storage file (or None), command (or None), command arguments
+    :rtype:  tuple
+    """
+    dbname = None
+    args = iter(args)
+    for arg in args:
+        if arg in ('-o', '--open'):
+            dbname = next(args, None)
+        elif arg in ('-p', '--profile'):
+            next(args, None)
+        elif arg.startswith('--open='):
+            dbname = arg[len('--open='):]
+        elif arg.startswith('-o'):
+            dbname = arg[2:]
+        elif not arg.startswith('-'):
+            return dbname, arg, list(args)
+    return dbname, None, []
+
+
+def reads_stdin(command, args):
+    """True if a command reads its input from stdin (set -i).
+
+    :param command: CLI command
+    :type  command: str
+    :param args: command arguments
+    :type  args: list
+    :rtype: bool
+    """
+    if command != 'set':
+        return False
+    for arg in args:
+        if arg == '--':
+            break
+        if arg == '--stdin' or (arg[:1] == '-' and arg[1:2] != '-'
+                                and 'i' in arg[1:]):
+            return True
+    return False
+
+
+def connect(path):
+    """Connects to a running server.
+
+    :param path: server socket path
+    :type  path: str
+    :return: connected socket, None if no server is running
+    :rtype:  Union[None, class:`socket.socket`]
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def exchange(sock, request):
+    """Sends a request to the server and reads its response.
+
+    :param sock: connected socket, closed afterwards
+    :type  sock: class:`socket.socket`
+    :param request: request object
+    :type  request: dict
+    :return: response object, None if the server gave no valid response
+    :rtype:  Union[None, dict]
+    """
+    with sock, sock.makefile('rwb') as f:
+        try:
+            f.write(json.dumps(request).encode() + b'\n')
+            f.flush()
+            return json.loads(f.readline())
+        except (OSError, ValueError):
+            # the server went away or answered garbage
+            return None
+
+
+def request(dbname, args):
+    """Runs a served CLI command in the server of a storage file.
+
+    The command runs in the current working directory.
+
+    :param dbname: storage file path
+    :type  dbname: str
+    :param args: CLI arguments, including the main command options
+    :type  args: list
+    :return: exit code, stdout and stderr data; None if no server is running
+             or it gave no valid response
+    :rtype:  Union[None, tuple]
+    """
+    sock = connect(socket_path(dbname))
+    if sock is None:
+        return None
+    res = exchange(sock, {'args': list(args), 'cwd': os.getcwd()})
+    if res is None:
+        return None
+    return (res['code'], base64.b64decode(res['out']),
+            base64.b64decode(res['err']))
+
+
+def forward(args):
+    """Thin client: forwards a served CLI command to a running server
+    and prints its output.
+
+    :param args: CLI arguments
+    :type  args: list
+    :return: exit code, None if the command must run locally
+    :rtype:  Union[None, int]
+    """
+    dbname, command, cmd_args = split_args(args)
+    if dbname is None or command not in SERVED or \
+            reads_stdin(command, cmd_args):
+        return None
+    res = request(dbname, args)
+    if res is None:
+        return None
+    code, out, err = res
+    sys.stdout.buffer.write(out)
+    sys.stdout.flush()
+    sys.stderr.buffer.write(err)
+    sys.stderr.flush()
+    return code
+
+
+def stop(dbname):
+    """Stops the server of a storage file.
+
+    :param dbname: storage file path
+    :type  dbname: str
+    :return: True if a server was running
+    :rtype:  bool
+    """
+    sock = connect(socket_path(dbname))
+    if sock is None:
+        return False
+    exchange(sock, {'stop': True})
+    return True
+
+
+class Server:
+    """Runs served CLI commands against a Storage kept open.
+
+    Requests are answered one at a time, in a single thread, so the Storage
+    is only used by that thread. If another connection changes the DB,
+    the tree is read anew before the next command.
+    """
+
+    def __init__(self, storage, command):
+        """Constructor.
+
+        :param storage: served storage
+        :type  storage: class:`contacto.storage.Storage`
+        :param command: Click main command running the requests
+        :type  command: class:`click.Group`
+        """
+        self.storage = storage
+        self.command = command
+        self.path = socket_path(storage.db_file)
+        self.running = False
+        self.version = self.__data_version()
+
+    def __data_version(self):
+        """Changes with every commit of another DB connection.
+        """
+        sql = 'PRAGMA data_version'
+        return self.storage.db_conn.execute(sql).fetchone()[0]
+
+    def serve(self, ready=None):
+        """Accepts requests until stopped, removes the socket afterwards.
+
+        :param ready: called once the socket accepts connections
+        :type  ready: Callable, optional
+        :raises OSError: the socket cannot be created,
+                         FileExistsError if a server is already running
+        """
+        sock = connect(self.path)
+        if sock is not None:
+            sock.close()
+            raise FileExistsError(f"Server already running: {self.path}")
+        if os.path.exists(self.path):
+            # left behind by a killed server
+            os.unlink(self.path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+            listener.bind(self.path)
+            try:
+                listener.listen()
+                if ready:
+                    ready()
+                self.running = True
+                while self.running:
+                    conn, _ = listener.accept()
+                    with conn, conn.makefile('rwb') as f:
+                        self.handle(f)
+            finally:
+                self.running = False
+                os.unlink(self.path)
+
+    def handle(self, f):
+        """Answers a request.
+
+        :param f: connection file
+        :type  f: class:`io.BufferedRWPair`
+        """
+        try:
+            req = json.loads(f.readline())
+        except ValueError:
+            return
+        if req.get('stop'):
+            self.running = False
+            res = {'code': 0, 'out': '', 'err': ''}
+        else:
+            code, out, err = self.run(req.get('args', []), req.get('cwd'))
+            res = {'code': code, 'out': base64.b64encode(out).decode(),
+                   'err': base64.b64encode(err).decode()}
+        try:
+            f.write(json.dumps(res).encode() + b'\n')
+            f.flush()
+        except OSError:
+            # the client is gone
+            pass
+        # made after answering, the client does not wait for them
+        self.make_variants()
+
+    def make_variants(self):
+        """Makes downscaled variants of thumbnails set by served commands.
+        """
+        try:
+            with self.storage.db_conn:
+                self.storage.make_pending_variants()
+        except Exception:
+            traceback.print_exc()
+
+    def run(self, args, cwd=None):
+        """Runs a served CLI command, capturing its output.
+
+        :param args: CLI arguments, including the main command options
+        :type  args: list
+        :param cwd: working directory of the command
+        :type  cwd: str, optional
+        :return: exit code, stdout and stderr data
+        :rtype:  tuple
+        """
+        _, command, _ = split_args(args)
+        if command not in SERVED:
+            return 2, b'', f"Command not served: {command}\n".encode()
+        version = self.__data_version()
+        if version != self.version:
+            self.storage.reload()
+            self.version = version
+
+        out, err = io.BytesIO(), io.BytesIO()
+        # the wrappers close their buffers when collected
+        captured = (io.TextIOWrapper(io.BytesIO(), encoding='utf-8'),
+                    io.TextIOWrapper(out, encoding='utf-8',
+                                     write_through=True),
+                    io.TextIOWrapper(err, encoding='utf-8',
+                                     write_through=True))
+        server_cwd = os.getcwd()
+        try:
+            os.chdir(cwd or server_cwd)
+        except OSError as e:
+            return 1, b'', f"{e}\n".encode()
+        streams = sys.stdin, sys.stdout, sys.stderr
+        sys.stdin, sys.stdout, sys.stderr = captured
+        try:
+            self.command.main(args, prog_name='contacto',
+                              obj={'storage': self.storage})
+            code = 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else int(bool(e.code))
+        except Exception:
+            traceback.print_exc()
+            # drop whatever the command left behind
+            self.storage.db_conn.rollback()
+            self.storage.reload()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.stdin, sys.stdout, sys.stderr = streams
+            os.chdir(server_cwd)
+        return code, out.getvalue(), err.getvalue()
@@ -1,37 +1,237 @@
 """A Qt5 frontend for Contacto
 
-For now it it read-only.
+For now it it read-only. The contact tree is shown through a model
+reading the storage lazily, as tree nodes are expanded.
 """
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets, QtGui, QtCore, uic
+import click
 import sys
 import pkgutil
 import io
-from .storage import Storage
+from .storage import Storage, Group, Entity, Attribute
 from .serial import Serial
 from .helpers import DType, attr_val_str, print_error
 
 
 MAIN_UI = 'resources/mainwindow.ui'
 ABOUT_HTML = 'resources/about.html'
+# default entity icon size (px), icons use the thumbnail variant as big
+ICON_SIZE = 64
+# tree model column headers
+HEADERS = ('Name', 'Type', 'Value')
+# tree model rows added at once when a node is expanded or scrolled
+FETCH_BATCH = 500
+
+
+class TreeNode:
+    """A tree model node wrapping a storage element
+    """
+    def __init__(self, elem, parent=None, row=0):
+        """Node initializer
+
+        :param elem: wrapped element (the root wraps the storage)
+        :type  elem: class:`contacto.storage.StorageElement`
+        :param parent: parent node, None for the root
+        :type  parent: class:`TreeNode`, optional
+        :param row: row in the parent node
+        :type  row: int, optional
+        """
+        self.elem = elem
+        self.parent = parent
+        self.row = row
+        # sorted child names, listed on first expansion
+        self.names = None
+        # child nodes fetched so far
+        self.children = []
+        # entity icon, False if there is none
+        self.icon = None
+
+    def child_elems(self):
+        """Name-indexed child elements (loaded if lazy)
+
+        :return: child element dictionary, None for attributes
+        :rtype:  Union[dict, None]
+        """
+        if isinstance(self.elem, Attribute):
+            return None
+        if isinstance(self.elem, Entity):
+            return self.elem.attributes
+        if isinstance(self.elem, Group):
+            return self.elem.entities
+        return self.elem.groups
+
+
+class TreeModel(QtCore.QAbstractItemModel):
+    """Contact tree model populated on demand
+
+    Children of a node are read from the storage when the node is expanded
+    and added to the model in batches as the view scrolls to them.
+    Values are only formatted for the rows the view displays.
+    """
+    def __init__(self, storage, parent=None, icon_size=ICON_SIZE):
+        """Model initializer
+
+        :param storage: displayed storage, preferably lazy
+        :type  storage: class:`contacto.storage.Storage`
+        :param parent: Qt parent object
+        :type  parent: class:`QtCore.QObject`, optional
+        :param icon_size: entity icon size (px)
+        :type  icon_size: int, optional
+        """
+        super().__init__(parent)
+        self.root = TreeNode(storage)
+        self.icon_size = icon_size
+
+    def node(self, index):
+        """Gets the node of a model index
+
+        :param index: model index, invalid for the root
+        :type  index: class:`QtCore.QModelIndex`
+        :return: tree node
+        :rtype:  class:`TreeNode`
+        """
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        node = self.node(parent)
+        if not self.hasIndex(row, column, parent) or \
+                row >= len(node.children):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is self.root:
+            return QtCore.QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self.node(parent).children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(HEADERS)
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return False
+        node = self.node(parent)
+        if node.names is not None:
+            return bool(node.names)
+        # do not load children just to draw the expander
+        return not isinstance(node.elem, Attribute)
+
+    def canFetchMore(self, parent):
+        if parent.column() > 0:
+            return False
+        node = self.node(parent)
+        if node.names is None:
+            return not isinstance(node.elem, Attribute)
+        return len(node.children) < len(node.names)
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        elems = node.child_elems()
+        if elems is None:
+            return
+        if node.names is None:
+            node.names = sorted(elems)
+        first = len(node.children)
+        last = min(first + FETCH_BATCH, len(node.names)) - 1
+        if last < first:
+            return
+        self.beginInsertRows(parent, first, last)
+        node.children.extend(TreeNode(elems[name], node, row) for row, name
+                             in enumerate(node.names[first:last + 1], first))
+        self.endInsertRows()
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        elem, column = node.elem, index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if column == 0:
+                return elem.name
+            if column == 1:
+                if isinstance(elem, Attribute):
+                    return type_to_str(elem.type)
+                return 'Entity' if isinstance(elem, Entity) else 'Group'
+            if isinstance(elem, Attribute):
+                return attr_val_str(elem, False)
+            return None
+        if role == QtCore.Qt.DecorationRole and column == 0 and \
+                isinstance(elem, Entity):
+            if node.icon is None:
+                node.icon = entity_icon(elem, self.icon_size) or False
+            return node.icon or None
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and \
+                role == QtCore.Qt.DisplayRole:
+            return HEADERS[section]
+        return None
+
+
+def type_to_str(dtype):
+    """Returns a string representation of attribute type
+
+    :param dtype: attribute data type
+    :type dtype:  class:`contacto.helpers.DType`
+    :return: string representation
+    :rtype:  str
+    """
+    tstr = '???'
+    if dtype is DType.BIN:
+        tstr = "binary"
+    elif dtype is DType.TEXT:
+        tstr = "text"
+    elif dtype is DType.AXREF:
+        tstr = "-> attr"
+    elif dtype is DType.EXREF:
+        tstr = "-> entity"
+    return f"Attr ({tstr})"
+
+
+def entity_icon(entity, size=ICON_SIZE):
+    """Makes an icon of a downscaled entity thumbnail
+
+    :param entity: displayed entity
+    :type  entity: class:`contacto.storage.Entity`
+    :param size: icon size (px), the smallest variant as big is used
+    :type  size: int, optional
+    :return: thumbnail icon, None if there is no thumbnail
+    :rtype:  Union[class:`QtGui.QIcon`, None]
+    """
+    thumb = entity.get_thumbnail(size=size)
+    if not thumb:
+        return None
+    pixmap = QtGui.QPixmap()
+    if not pixmap.loadFromData(thumb):
+        return None
+    return QtGui.QIcon(pixmap)
 
 
 class GUI:
     """Wrapper for all GUI logic
     """
-    def __init__(self):
+    def __init__(self, dbname=':memory:', icon_size=ICON_SIZE):
         """GUI initializer
 
-        Allows passing DB name from args
+        :param dbname: name of database holding raw data
+        :type  dbname: str, optional
+        :param icon_size: entity icon size (px)
+        :type  icon_size: int, optional
         """
-        self.app = QtWidgets.QApplication(sys.argv)
+        self.icon_size = icon_size
+        self.app = QtWidgets.QApplication.instance() or \
+            QtWidgets.QApplication(sys.argv)
         self.app.setApplicationName("Contacto")
-
-        # initialize from args
-        if len(sys.argv) > 1:
-            fname = sys.argv[1]
-        else:
-            fname = ':memory:'
-        self.open(fname)
+        self.open(dbname)
 
         script = pkgutil.get_data(__name__, MAIN_UI).decode('utf-8')
         sio = io.StringIO(script)
@@ -41,9 +241,10 @@ class GUI:
         uic.loadUi(sio, self.window)
 
         # load main UI areas
-        self.tree = self.window.findChild(QtWidgets.QTreeWidget, 'treeWidget')
-        self.tree.setColumnWidth(0, 200)
+        self.tree = self.window.findChild(QtWidgets.QTreeView, 'treeView')
+        self.tree.setIconSize(QtCore.QSize(icon_size, icon_size))
         self.init_tree()
+        self.tree.setColumnWidth(0, 200)
 
         # actions
         act = self.window.findChild(QtWidgets.QAction, 'actionOpen')
@@ -55,52 +256,22 @@ class GUI:
         act = self.window.findChild(QtWidgets.QAction, 'actionExport_to')
         act.triggered.connect(self.action_export)
 
-    @staticmethod
-    def __type_to_str(dtype):
-        """Returns a string representation of attribute type
-
-        :param dtype: attribute data type
-        :type dtype:  class:`contacto.helpers.DType`
-        :return: string representation
-        :rtype:  str
-        """
-        tstr = '???'
-        if dtype is DType.BIN:
-            tstr = "binary"
-        elif dtype is DType.TEXT:
-            tstr = "text"
-        elif dtype is DType.AXREF:
-            tstr = "-> attr"
-        elif dtype is DType.EXREF:
-            tstr = "-> entity"
-        return f"Attr ({tstr})"
-
     def open(self, dbname):
         """Open a new Storage around a filename
 
         :param dbname: name of database holding raw data
         :type  dbname: str
         """
-        self.storage = Storage(dbname)
+        # let plugins write while the GUI reads, read what is displayed
+        self.storage = Storage(dbname, lazy=True, profile='wal')
         self.serial = Serial(self.storage)
         self.filename = dbname
 
     def init_tree(self):
-        """Loads contact data into the tree widget
+        """Shows contact data of the storage in the tree view
         """
-        for gname, group in sorted(self.storage.groups.items()):
-            gitem = QtWidgets.QTreeWidgetItem(self.tree)
-            gitem.setText(0, gname)
-            gitem.setText(1, "Group")
-            for ename, entity in sorted(group.entities.items()):
-                eitem = QtWidgets.QTreeWidgetItem(gitem)
-                eitem.setText(0, ename)
-                eitem.setText(1, "Entity")
-                for aname, attr in sorted(entity.attributes.items()):
-                    aitem = QtWidgets.QTreeWidgetItem(eitem)
-                    aitem.setText(0, aname)
-                    aitem.setText(1, self.__type_to_str(attr.type))
-                    aitem.setText(2, attr_val_str(attr, False))
+        self.model = TreeModel(self.storage, self.tree, self.icon_size)
+        self.tree.setModel(self.model)
 
     def action_open(self):
         """Qt action: open new DB
@@ -133,6 +304,8 @@ class GUI:
             with open(fname, 'r') as f:
                 if not serial.import_yaml(f):
                     raise Exception("YAML import failed")
+            # imported elements replace the displayed ones
+            self.init_tree()
         except Exception as e:
             QtWidgets.QMessageBox.critical(self.window, 'Import error', str(e))
 
@@ -158,10 +331,16 @@ class GUI:
         return self.app.exec()
 
 
-def main():
+@click.command()
+@click.option('-s', '--icon-size', type=click.IntRange(min=1),
+              default=ICON_SIZE, show_default=True,
+              help='Entity icon size in px, the smallest thumbnail variant'
+                   ' as big is shown.')
+@click.argument('database', type=click.Path(), default=':memory:')
+def main(database, icon_size):
     """GUI entry-point
     """
-    gui = GUI()
+    gui = GUI(database, icon_size)
     gui.run()
 
 
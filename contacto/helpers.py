@@ -4,12 +4,21 @@
 from enum import IntEnum
 import pkgutil
 import importlib
-from PIL import Image
-from urllib.request import urlopen
+import hashlib
+import json
 import io
+import os
 import sys
+import time
 import click
 
+# top-level module name prefix of plugins
+PLUGIN_PREFIX = 'contacto_'
+# directories modified this recently are rescanned (timestamp granularity)
+PLUGIN_RACY_NS = 2 * 10**9
+# bounding box sizes (px) of downscaled thumbnail variants
+THUMB_SIZES = (64, 256)
+
 
 class DType(IntEnum):
     """Attribute data types.
@@ -46,6 +55,60 @@ class Scope(IntEnum):
         raise Exception("Unknown scope")
 
 
+class BlobHandle:
+    """A lightweight reference to binary data stored in the database.
+
+    Holds the location (table, column and rowid), size and content hash
+    of the data. The data itself is read only when requested, using
+    incremental BLOB I/O where the sqlite3 module supports it.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, conn, table, column, rowid, size, digest=None):
+        """Initialize from a connection, data location and data size.
+        """
+        self.conn = conn
+        self.table = table
+        self.column = column
+        self.rowid = rowid
+        self.size = size
+        self.digest = digest
+
+    def __len__(self):
+        """Size of the referenced data in bytes.
+        """
+        return self.size
+
+    def read(self):
+        """Reads the referenced data.
+
+        :return: binary data
+        :rtype:  bytes
+        """
+        return b''.join(self.chunks(max(self.size, 1)))
+
+    def chunks(self, size=CHUNK_SIZE):
+        """Generates the referenced data in chunks.
+
+        :param size: chunk size
+        :type  size: int, optional
+        :return: data chunks
+        :rtype:  generator
+        """
+        if not hasattr(self.conn, 'blobopen'):
+            # no incremental BLOB I/O (Python < 3.11)
+            sql = f'SELECT {self.column} FROM "{self.table}" WHERE id=?'
+            yield self.conn.execute(sql, [self.rowid]).fetchone()[0]
+            return
+        with self.conn.blobopen(self.table, self.column, self.rowid,
+                                readonly=True) as blob:
+            chunk = blob.read(size)
+            while chunk:
+                yield chunk
+                chunk = blob.read(size)
+
+
 def bytes_to_attrdata(dtype, bin_data):
     """Parses attribute data from its binary-packed form.
 
@@ -77,7 +140,29 @@ def attrdata_to_bytes(dtype, attr_data):
         return attr_data
     if dtype is DType.TEXT:
         return attr_data.encode('utf-8')
-    return attr_data.id.to_bytes(4, byteorder='little')
+    return refid_to_bytes(attr_data.id)
+
+
+def blob_digest(data):
+    """Computes the content hash identifying stored binary data.
+
+    :param data: binary data
+    :type  data: bytes
+    :return: SHA-256 digest
+    :rtype:  bytes
+    """
+    return hashlib.sha256(data).digest()
+
+
+def refid_to_bytes(elem_id):
+    """Packs an XREF target ID into its binary form.
+
+    :param elem_id: ID of the referenced element
+    :type  elem_id: int
+    :return: packed ID
+    :rtype:  bytes
+    """
+    return elem_id.to_bytes(4, byteorder='little')
 
 
 def parse_refspec(rspec):
@@ -127,20 +212,89 @@ def parse_ref(rspec):
     raise Exception('Bad REF signature')
 
 
-def get_plugins():
-    """Uses pkgutil to find plugins among top-level modules.
+def plugin_manifest_path():
+    """Path of the cached plugin manifest, in the user cache directory.
 
-    :return: found plugins
-    :rtype:  dict
+    :return: manifest path
+    :rtype:  str
     """
-    def fam_name(name):
-        return name.split('contacto_')[1]
+    cache = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache, 'contacto', 'plugins.json')
 
-    return {
-        fam_name(name): importlib.import_module(name)
+
+def _search_path_key():
+    """Module search path entries with their modification times.
+
+    Adding or removing a module changes the time of its directory.
+    """
+    key = []
+    for entry in sys.path:
+        entry = os.path.abspath(entry or os.curdir)
+        try:
+            key.append([entry, os.stat(entry).st_mtime_ns])
+        except OSError:
+            key.append([entry, None])
+    return key
+
+
+def find_plugins():
+    """Finds plugins among top-level modules without importing them.
+
+    Scanning the module search path is slow, found plugins are kept
+    in a manifest (see `plugin_manifest_path`). The path is scanned again
+    once its entries or their modification times change. Directories
+    modified just now are not cached, another module may follow within
+    the same timestamp.
+
+    :return: plugin names and module names
+    :rtype:  dict
+    """
+    key = _search_path_key()
+    path = plugin_manifest_path()
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest['path'] == key:
+            return manifest['plugins']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    plugins = {
+        name[len(PLUGIN_PREFIX):]: name
         for finder, name, ispkg
         in pkgutil.iter_modules()
-        if name.startswith('contacto_')
+        if name.startswith(PLUGIN_PREFIX)
+    }
+    # time.time_ns requires Python 3.7+
+    now = int(time.time() * 1e9)
+    if any(mtime is not None and now - mtime < PLUGIN_RACY_NS
+           for _, mtime in key):
+        return plugins
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # replaced at once, concurrent readers never see a partial file
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, 'w') as f:
+            json.dump({'path': key, 'plugins': plugins}, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return plugins
+
+
+def get_plugins(whitelist=[]):
+    """Imports found plugins.
+
+    :param whitelist: plugin names to import, all if empty
+    :type  whitelist: list, optional
+    :return: plugin names and modules
+    :rtype:  dict
+    """
+    return {
+        name: importlib.import_module(module)
+        for name, module in find_plugins().items()
+        if len(whitelist) == 0 or name in whitelist
     }
 
 
@@ -154,17 +308,10 @@ def run_plugins(storage, whitelist=[]):
     :return: lists of successful and failed run plugins
     :rtype:  (list, list)
     """
-    def wl_compliant(name):
-        if len(whitelist) == 0:
-            return True
-        return name in whitelist
-
-    plugins = get_plugins()
+    plugins = get_plugins(whitelist)
     success, fail = [], []
 
     for name, plugin in plugins.items():
-        if not wl_compliant(name):
-            continue
         if hasattr(plugin, 'plugin_init'):
             if plugin.plugin_init(storage):
                 success.append(name)
@@ -230,7 +377,7 @@ def attr_val_str(attr, direct):
     :return: string representation
     :rtype:  str
     """
-    vtype, val = attr.get()
+    vtype, val = attr.get(deferred=not direct)
     if direct:
         return val
     s, pfx = '', ''
@@ -248,12 +395,12 @@ def attr_val_str(attr, direct):
 def size_str(blob):
     """Gets binary data size in human-readable units.
 
-    :param blob: binary data
-    :type  blob: bytes
+    :param blob: binary data (or its size)
+    :type  blob: Union[bytes, class:`contacto.helpers.BlobHandle`, int]
     :return: data size with units
     :rtype:  str
     """
-    size = len(blob)
+    size = blob if type(blob) is int else len(blob)
     sfx = 'B'
     if size > 1024:
         size /= 1024
@@ -272,6 +419,8 @@ def validate_img(data):
     :return: true if data is an image
     :rtype:  bool
     """
+    # imported on use, PIL is slow to import
+    from PIL import Image
     try:
         bio = io.BytesIO(data)
         img = Image.open(bio)
@@ -281,6 +430,39 @@ def validate_img(data):
     return True
 
 
+def downscale_img(data, sizes=THUMB_SIZES):
+    """Downscales an image into thumbnail variants.
+
+    Variants fit in square bounding boxes, smaller images are not
+    enlarged. They are WebP images (PNG if Pillow lacks WebP support).
+    Run in worker processes, see `contacto.storage.Storage.make_variants`.
+
+    :param data: image data
+    :type  data: bytes
+    :param sizes: bounding box sizes
+    :type  sizes: Iterable, optional
+    :return: (size, format, data) tuples, None if data is not an image
+    :rtype:  Union[list, None]
+    """
+    from PIL import Image, features
+    fmt = 'WEBP' if features.check('webp') else 'PNG'
+    variants = []
+    try:
+        img = Image.open(io.BytesIO(data))
+        # each variant is scaled down from the previous, bigger one
+        for size in sorted(sizes, reverse=True):
+            img.thumbnail((size, size))
+            if img.mode not in ('RGB', 'RGBA'):
+                alpha = 'A' in img.getbands() or 'transparency' in img.info
+                img = img.convert('RGBA' if alpha else 'RGB')
+            bio = io.BytesIO()
+            img.save(bio, fmt)
+            variants.append((size, fmt, bio.getvalue()))
+    except Exception:
+        return None
+    return sorted(variants)
+
+
 def parse_valspec(value):
     """Parses an attribute value specifier (used in data input/import).
 
@@ -296,6 +478,7 @@ def parse_valspec(value):
         with open(fname, 'rb') as f:
             return DType.BIN, f.read()
     if value.startswith('URL:'):
+        from urllib.request import urlopen
         url = value.split('URL:')[1]
         with urlopen(url) as f:
             return DType.BIN, f.read()
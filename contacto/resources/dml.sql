@@ -17,3 +17,136 @@ CREATE TABLE IF NOT EXISTS attribute (
     entity_id INTEGER NOT NULL REFERENCES entity(id) ON DELETE CASCADE,
     UNIQUE(entity_id, name)
 );
+-- XREF target ID column ref_id, its index and the triggers keeping it
+-- up to date are added by Storage.migrate
+-- binary data shared by content, BIN attributes and thumbnails hold hashes
+-- image validation column image is added by Storage.migrate
+CREATE TABLE IF NOT EXISTS blob (
+    id INTEGER PRIMARY KEY,
+    hash BLOB NOT NULL UNIQUE,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    data BLOB NOT NULL
+);
+-- downscaled variants of thumbnail blobs, see helpers.downscale_img
+CREATE TABLE IF NOT EXISTS thumbnail_variant (
+    hash BLOB NOT NULL REFERENCES blob(hash) ON DELETE CASCADE,
+    size INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY(hash, size)
+);
+CREATE INDEX IF NOT EXISTS entity_thumbnail ON entity(thumbnail)
+WHERE thumbnail IS NOT NULL;
+CREATE TRIGGER IF NOT EXISTS attribute_blob_insert AFTER INSERT ON attribute
+WHEN new.type = 2 BEGIN
+    UPDATE blob SET refcount = refcount + 1 WHERE hash = new.data;
+END;
+CREATE TRIGGER IF NOT EXISTS attribute_blob_delete AFTER DELETE ON attribute
+WHEN old.type = 2 BEGIN
+    UPDATE blob SET refcount = refcount - 1 WHERE hash = old.data;
+    DELETE FROM blob WHERE hash = old.data AND refcount <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS attribute_blob_update
+AFTER UPDATE OF type, data ON attribute BEGIN
+    UPDATE blob SET refcount = refcount + 1
+        WHERE new.type = 2 AND hash = new.data;
+    UPDATE blob SET refcount = refcount - 1
+        WHERE old.type = 2 AND hash = old.data;
+    DELETE FROM blob WHERE old.type = 2 AND hash = old.data AND refcount <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entity_blob_insert AFTER INSERT ON entity BEGIN
+    UPDATE blob SET refcount = refcount + 1 WHERE hash = new.thumbnail;
+END;
+CREATE TRIGGER IF NOT EXISTS entity_blob_delete AFTER DELETE ON entity BEGIN
+    UPDATE blob SET refcount = refcount - 1 WHERE hash = old.thumbnail;
+    DELETE FROM blob WHERE hash = old.thumbnail AND refcount <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entity_blob_update
+AFTER UPDATE OF thumbnail ON entity BEGIN
+    UPDATE blob SET refcount = refcount + 1 WHERE hash = new.thumbnail;
+    UPDATE blob SET refcount = refcount - 1 WHERE hash = old.thumbnail;
+    DELETE FROM blob WHERE hash = old.thumbnail AND refcount <= 0;
+END;
+-- change log, element scope is 1 for groups, 2 entities, 3 attributes
+-- Storage.delete_tree deletes (and so logs) children before their parent,
+-- rows deleted by a cascade only are not logged
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    scope INTEGER NOT NULL,
+    elem_id INTEGER NOT NULL,
+    refspec TEXT
+);
+CREATE TRIGGER IF NOT EXISTS group_log_insert AFTER INSERT ON "group" BEGIN
+    INSERT INTO change_log (op, scope, elem_id, refspec)
+        VALUES ('I', 1, new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS group_log_update AFTER UPDATE ON "group"
+WHEN old.name IS NOT new.name BEGIN
+    INSERT INTO change_log (op, scope, elem_id, refspec)
+        VALUES ('U', 1, new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS group_log_delete AFTER DELETE ON "group" BEGIN
+    INSERT INTO change_log (op, scope, elem_id, refspec)
+        VALUES ('D', 1, old.id, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entity_log_insert AFTER INSERT ON entity BEGIN
+    INSERT INTO change_log (op, scope, elem_id, refspec)
+        SELECT 'I', 2, new.id, g.name || '/' || new.name
+        FROM "group" AS g WHERE g.id = new.group_id;
+END;
+CREATE TRIGGER IF NOT EXISTS entity_log_update AFTER UPDATE ON entity
+WHEN old.name IS NOT new.name OR old.thumbnail IS NOT new.thumbnail
+    OR old.group_id IS NOT new.group_id BEGIN
+    INSERT INTO change_log (op, scope, elem_id, refspec)
+        SELECT 'U', 2, new.id, g.name || '/' || new.name
+        FROM "group" AS g WHERE g.id = new.group_id;
+END;
+CREATE TRIGGER IF NOT EXISTS entity_log_delete AFTER DELETE ON entity BEGIN
+    INSERT INTO change_log (op, scope, elem_id, refspec)
+        SELECT 'D', 2, old.id, g.name || '/' || old.name
+        FROM "group" AS g WHERE g.id = old.group_id;
+END;
+CREATE TRIGGER IF NOT EXISTS attribute_log_insert AFTER INSERT ON attribute
+BEGIN
+    INSERT INTO change_log (op, scope, elem_id, refspec)
+        SELECT 'I', 3, new.id, g.name || '/' || e.name || '/' || new.name
+        FROM entity AS e JOIN "group" AS g ON (g.id = e.group_id)
+        WHERE e.id = new.entity_id;
+END;
+CREATE TRIGGER IF NOT EXISTS attribute_log_update AFTER UPDATE ON attribute
+WHEN old.name IS NOT new.name OR old.type IS NOT new.type
+    OR old.data IS NOT new.data OR old.entity_id IS NOT new.entity_id BEGIN
+    INSERT INTO change_log (op, scope, elem_id, refspec)
+        SELECT 'U', 3, new.id, g.name || '/' || e.name || '/' || new.name
+        FROM entity AS e JOIN "group" AS g ON (g.id = e.group_id)
+        WHERE e.id = new.entity_id;
+END;
+CREATE TRIGGER IF NOT EXISTS attribute_log_delete AFTER DELETE ON attribute
+BEGIN
+    INSERT INTO change_log (op, scope, elem_id, refspec)
+        SELECT 'D', 3, old.id, g.name || '/' || e.name || '/' || old.name
+        FROM entity AS e JOIN "group" AS g ON (g.id = e.group_id)
+        WHERE e.id = old.entity_id;
+END;
+-- past Attribute values kept by rotation, append-only
+-- Storage.delete_tree turns the history of a deleted Attribute into
+-- attributes first, it is only deleted along with its entity
+CREATE TABLE IF NOT EXISTS attribute_history (
+    id INTEGER PRIMARY KEY,
+    attribute_id INTEGER NOT NULL
+        REFERENCES attribute(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    type INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    UNIQUE(attribute_id, version)
+);
+CREATE TRIGGER IF NOT EXISTS history_blob_insert
+AFTER INSERT ON attribute_history WHEN new.type = 2 BEGIN
+    UPDATE blob SET refcount = refcount + 1 WHERE hash = new.data;
+END;
+CREATE TRIGGER IF NOT EXISTS history_blob_delete
+AFTER DELETE ON attribute_history WHEN old.type = 2 BEGIN
+    UPDATE blob SET refcount = refcount - 1 WHERE hash = old.data;
+    DELETE FROM blob WHERE hash = old.data AND refcount <= 0;
+END;
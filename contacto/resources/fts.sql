@@ -0,0 +1,25 @@
+CREATE VIRTUAL TABLE attribute_fts USING fts5(
+    data,
+    content='attribute',
+    content_rowid='id',
+    tokenize='trigram'
+);
+CREATE TRIGGER attribute_fts_insert AFTER INSERT ON attribute
+WHEN new.type = 1 BEGIN
+    INSERT INTO attribute_fts(rowid, data)
+    VALUES (new.id, CAST(new.data AS TEXT));
+END;
+CREATE TRIGGER attribute_fts_delete AFTER DELETE ON attribute
+WHEN old.type = 1 BEGIN
+    INSERT INTO attribute_fts(attribute_fts, rowid, data)
+    VALUES ('delete', old.id, CAST(old.data AS TEXT));
+END;
+CREATE TRIGGER attribute_fts_update AFTER UPDATE OF type, data ON attribute
+BEGIN
+    INSERT INTO attribute_fts(attribute_fts, rowid, data)
+    SELECT 'delete', old.id, CAST(old.data AS TEXT) WHERE old.type = 1;
+    INSERT INTO attribute_fts(rowid, data)
+    SELECT new.id, CAST(new.data AS TEXT) WHERE new.type = 1;
+END;
+INSERT INTO attribute_fts(rowid, data)
+SELECT id, CAST(data AS TEXT) FROM attribute WHERE type = 1;
@@ -4,24 +4,77 @@
 import yaml
 import click
 import os
-from urllib.request import urlopen
+import io
+import mmap
+import struct
 from .helpers import DType, Scope, parse_valspec, attr_val_str, print_error
+from .helpers import BlobHandle, attrdata_to_bytes
+
+# use the LibYAML bindings if PyYAML was built with them
+try:
+    from yaml import CSafeLoader, CSafeDumper
+    LIBYAML = True
+except ImportError:
+    CSafeLoader = CSafeDumper = None
+    LIBYAML = False
+
+# binary snapshot layout, all numbers are little-endian:
+#   header: magic, format version, index size
+#   index:  records of tagged elements, each followed by its UTF-8 name
+#   data:   raw thumbnails and Attribute data, referenced from the index
+SNAPSHOT_MAGIC = b'CONTACTO'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<8sIQ')
+# tag, ID, name size
+SNAPSHOT_GROUP = struct.Struct('<cII')
+# tag, ID, Group ID, name size, thumbnail offset, size (-1 if none)
+SNAPSHOT_ENTITY = struct.Struct('<cIIIQq')
+# tag, ID, Entity ID, name size, type, data offset, size
+SNAPSHOT_ATTRIBUTE = struct.Struct('<cIIIBQQ')
 
 
 class Serial:
     """Serialization handler, accepts a data storage.
+
+    YAML is parsed and emitted by LibYAML if it is available,
+    the pure-Python implementation is used otherwise.
+    Both backends produce the same data and the same output.
     """
-    def __init__(self, storage):
+    def __init__(self, storage, libyaml=True):
         """Constructor, save provided storage
+
+        :param storage: data storage (or a View)
+        :type  storage: class:`contacto.storage.Storage`
+        :param libyaml: use LibYAML if available
+        :type  libyaml: bool, optional
         """
         self.storage = storage
+        self.libyaml = libyaml and LIBYAML
+        self.loader = CSafeLoader if self.libyaml else yaml.SafeLoader
+        self.dumper = CSafeDumper if self.libyaml else yaml.SafeDumper
 
-    def export_yaml(self, file, max_scope=Scope.ATTRIBUTE, max_bin_size=0):
+    @property
+    def backend(self):
+        """Name of the used YAML backend.
+        """
+        return 'LibYAML' if self.libyaml else 'Python'
+
+    def export_yaml(self, file, max_scope=Scope.ATTRIBUTE, max_bin_size=0,
+                    thumb_size=None):
         """Exports storage in YAML format into a file.
 
         Maximum scope may be provided to cut away attributes or even entities.
         If maximum binary size is set, binary data bigger than this limit will
         be dumped into files in the dump file's directory and linked by refs.
+        If thumbnail size is set, binary "thumbnail" attributes are exported
+        as their downscaled variants (see `Storage.make_variants`).
+
+        The document is streamed, one attribute value at a time, and the
+        file is flushed after every group. Output is identical to
+        `yaml.safe_dump` of the whole tree.
+        Groups of a lazy Storage that were not loaded before the export
+        are unloaded once written, so memory use does not grow with
+        the tree.
 
         :param file: file to dump to
         :type  file: class:`io.TextIOWrapper`
@@ -29,45 +82,277 @@ class Serial:
         :type  max_scope: class:`contacto.helpers.Scope`, optional
         :param max_bin_size: maximum binary data size to inline
         :type  max_bin_size: int, optional
+        :param thumb_size: smallest thumbnail variant size (px)
+        :type  thumb_size: int, optional
         :return: success
         :rtype:  bool
         """
-        data = {}
+        dumper = self.dumper(file)
+        unload = set()
+        if getattr(self.storage, 'lazy', False):
+            unload = {group for group in self.storage.groups.values()
+                      if not group.loaded}
         try:
+            dumper.open()
+            dumper.emit(yaml.DocumentStartEvent())
+            self.__emit_mapping_start(dumper)
             # group scope
-            for gname, group in self.storage.groups.items():
-                d_group = {}
-                data[gname] = d_group
+            for gname, group in sorted(self.storage.groups.items()):
+                self.__emit_data(dumper, gname)
+                self.__emit_mapping_start(dumper)
                 # entity scope
-                if max_scope <= Scope.GROUP:
-                    continue
-                for ename, entity in group.entities.items():
-                    d_entity = {}
-                    d_group[ename] = d_entity
+                for ename, entity in self.__scoped(group.entities,
+                                                   max_scope > Scope.GROUP):
+                    self.__emit_data(dumper, ename)
+                    self.__emit_mapping_start(dumper)
                     # attribute scope
-                    if max_scope <= Scope.ENTITY:
-                        continue
-                    for aname, attribute in entity.attributes.items():
-                        value = attribute.data
-                        if attribute.type.is_xref():
-                            value = f"REF:{value}"
-                        elif (attribute.type is DType.BIN
-                              and max_bin_size > 0
-                              and len(value) > max_bin_size):
-                            # dump data to file and reference it
-                            dirp = os.path.dirname(os.path.realpath(file.name))
-                            fname = os.path.join(dirp, f"{attribute.id}.dat")
-                            with open(fname, 'wb') as f:
-                                f.write(value)
-                            value = f"FILE:{fname}"
-                        d_entity[aname] = value
-
-            yaml.safe_dump(data, file)
+                    for aname, attribute in self.__scoped(
+                            entity.attributes, max_scope > Scope.ENTITY):
+                        self.__emit_data(dumper, aname)
+                        self.__emit_data(dumper, self.__export_value(
+                            attribute, file, max_bin_size, thumb_size))
+                    dumper.emit(yaml.MappingEndEvent())
+                dumper.emit(yaml.MappingEndEvent())
+                file.flush()
+                if group in unload:
+                    group.unload()
+            dumper.emit(yaml.MappingEndEvent())
+            dumper.emit(yaml.DocumentEndEvent())
+            dumper.close()
+        except Exception as e:
+            print_error(e)
+            return False
+        finally:
+            dumper.dispose()
+            # XREF targets may have loaded groups written before
+            for group in unload:
+                group.unload()
+        return True
+
+    @staticmethod
+    def __scoped(elems, in_scope):
+        """Name-sorted tree elements, nothing if they are out of scope.
+        """
+        return sorted(elems.items()) if in_scope else []
+
+    @staticmethod
+    def __emit_mapping_start(dumper):
+        """Emits the start of a block mapping (flow if it ends up empty).
+        """
+        dumper.emit(yaml.MappingStartEvent(None, yaml.resolver.BaseResolver
+                                           .DEFAULT_MAPPING_TAG, True,
+                                           flow_style=False))
+
+    @staticmethod
+    def __emit_data(dumper, data):
+        """Represents a scalar and emits it like the YAML serializer would.
+        """
+        node = dumper.represent_data(data)
+        detected = dumper.resolve(yaml.ScalarNode, node.value, (True, False))
+        default = dumper.resolve(yaml.ScalarNode, node.value, (False, True))
+        implicit = node.tag == detected, node.tag == default
+        dumper.emit(yaml.ScalarEvent(None, node.tag, implicit, node.value,
+                                     style=node.style))
+
+    def __export_value(self, attribute, file, max_bin_size, thumb_size):
+        """Exported Attribute value (a valspec for non-TEXT data).
+        """
+        if attribute.type.is_xref():
+            return f"REF:{attribute.data}"
+        if attribute.type is DType.BIN:
+            _, blob = attribute.get(deferred=True)
+            if thumb_size and attribute.name == 'thumbnail' and \
+                    isinstance(blob, BlobHandle):
+                variant = attribute.get_storage().thumbnail_variant(
+                    blob.digest, thumb_size)
+                if variant is not None:
+                    return variant
+            return self.__export_blob(attribute, file, max_bin_size)
+        return attribute.data
+
+    @staticmethod
+    def __export_blob(attribute, file, max_bin_size):
+        """Exports binary Attribute data.
+
+        Data bigger than the maximum binary size are streamed into a file
+        in the dump file's directory, the file is then referenced.
+        """
+        _, blob = attribute.get(deferred=True)
+        if max_bin_size <= 0 or len(blob) <= max_bin_size:
+            return attribute.data
+        dirp = os.path.dirname(os.path.realpath(file.name))
+        fname = os.path.join(dirp, f"{attribute.id}.dat")
+        with open(fname, 'wb') as f:
+            if isinstance(blob, bytes):
+                f.write(blob)
+            else:
+                for chunk in blob.chunks():
+                    f.write(chunk)
+        return f"FILE:{fname}"
+
+    def export_snapshot(self, file):
+        """Exports storage into a binary snapshot file.
+
+        A snapshot is a compact alternative to YAML. It starts with an index
+        of all elements, binary data follow in raw form and are streamed
+        from the DB. XREFs are stored as IDs of their targets.
+
+        :param file: binary file to write to
+        :type  file: class:`io.BufferedWriter`
+        :return: success
+        :rtype:  bool
+        """
+        try:
+            index, sections = self.__snapshot_index()
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                            len(index)))
+            file.write(index)
+            for data in sections:
+                if isinstance(data, BlobHandle):
+                    for chunk in data.chunks():
+                        file.write(chunk)
+                else:
+                    file.write(data)
+            file.flush()
         except Exception as e:
             print_error(e)
             return False
         return True
 
+    def __snapshot_index(self):
+        """Builds the snapshot index and lists the data it references.
+        """
+        index = bytearray()
+        sections = []
+        offset = 0
+
+        def section(data):
+            nonlocal offset
+            sections.append(data)
+            offset += len(data)
+            return offset - len(data), len(data)
+
+        for gname, group in sorted(self.storage.groups.items()):
+            name = gname.encode('utf-8')
+            index += SNAPSHOT_GROUP.pack(b'G', group.id, len(name)) + name
+            for ename, entity in sorted(group.entities.items()):
+                name = ename.encode('utf-8')
+                thumb = entity.get_thumbnail(deferred=True)
+                t_off, t_size = (0, -1) if thumb is None else section(thumb)
+                index += SNAPSHOT_ENTITY.pack(b'E', entity.id, group.id,
+                                              len(name), t_off, t_size)
+                index += name
+                for aname, attr in sorted(entity.attributes.items()):
+                    name = aname.encode('utf-8')
+                    if attr.type is DType.BIN:
+                        data = attr.get(deferred=True)[1]
+                    else:
+                        data = attrdata_to_bytes(attr.type, attr.data)
+                    a_off, a_size = section(data)
+                    # history entries (negative IDs) cannot be referenced
+                    index += SNAPSHOT_ATTRIBUTE.pack(
+                        b'A', max(attr.id, 0), entity.id, len(name),
+                        attr.type, a_off, a_size)
+                    index += name
+        return index, sections
+
+    def import_snapshot(self, file):
+        """Imports a binary snapshot file into the storage.
+
+        The file is memory-mapped if possible, binary data are then
+        passed to the DB directly from the mapping.
+
+        :param file: binary snapshot file
+        :type  file: class:`io.BufferedReader`
+        :return: success
+        :rtype:  bool
+        """
+        try:
+            snapshot = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, io.UnsupportedOperation):
+            # not a regular file (or empty), read it whole
+            snapshot = file.read()
+
+        try:
+            with self.storage.db_conn:
+                self.__import_snapshot(memoryview(snapshot))
+        except Exception as e:
+            # import error, reload in-memory data
+            self.storage.reload()
+            print_error(e)
+            return False
+        finally:
+            if isinstance(snapshot, mmap.mmap):
+                snapshot.close()
+        return True
+
+    def __import_snapshot(self, view):
+        """Imports snapshot data, XREF target IDs are translated to refspecs.
+        """
+        if len(view) < SNAPSHOT_HEADER.size:
+            raise Exception('Not a Contacto snapshot')
+        magic, version, index_size = SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC:
+            raise Exception('Not a Contacto snapshot')
+        if version != SNAPSHOT_VERSION:
+            raise Exception(f"Unsupported snapshot version {version}")
+
+        base = SNAPSHOT_HEADER.size + index_size
+        if base > len(view):
+            raise Exception('Truncated snapshot')
+
+        def data(offset, size):
+            if base + offset + size > len(view):
+                raise Exception('Truncated snapshot')
+            return view[base + offset:base + offset + size]
+
+        groups, entities, attributes = {}, {}, {}
+        thumbnails, records = {}, []
+        pos = SNAPSHOT_HEADER.size
+        while pos < base:
+            tag = view[pos:pos + 1].tobytes()
+            if tag == b'G':
+                _, gid, n_size = SNAPSHOT_GROUP.unpack_from(view, pos)
+                pos += SNAPSHOT_GROUP.size
+                groups[gid] = str(view[pos:pos + n_size], 'utf-8')
+                records.append((groups[gid], None, None, None, None))
+            elif tag == b'E':
+                _, eid, gid, n_size, offset, size = \
+                    SNAPSHOT_ENTITY.unpack_from(view, pos)
+                pos += SNAPSHOT_ENTITY.size
+                key = groups[gid], str(view[pos:pos + n_size], 'utf-8')
+                entities[eid] = key
+                records.append((*key, None, None, None))
+                if size >= 0:
+                    thumbnails[key] = data(offset, size)
+            elif tag == b'A':
+                _, aid, eid, n_size, dtype, offset, size = \
+                    SNAPSHOT_ATTRIBUTE.unpack_from(view, pos)
+                pos += SNAPSHOT_ATTRIBUTE.size
+                key = (*entities[eid], str(view[pos:pos + n_size], 'utf-8'))
+                attributes[aid] = key
+                records.append((*key, DType(dtype), data(offset, size)))
+            else:
+                raise Exception('Corrupt snapshot index')
+            pos += n_size
+
+        def rows():
+            for gname, ename, aname, dtype, a_data in records:
+                if dtype is DType.TEXT:
+                    a_data = str(a_data, 'utf-8')
+                elif dtype is not None and dtype.is_xref():
+                    target = int.from_bytes(a_data, byteorder='little')
+                    if dtype is DType.EXREF:
+                        a_data = entities.get(target) and \
+                            (*entities[target], None)
+                    else:
+                        a_data = attributes.get(target)
+                    if a_data is None:
+                        raise Exception(f"REF target #{target} not found")
+                yield gname, ename, aname, dtype, a_data
+
+        self.storage.bulk_import(rows(), thumbnails)
+
     def dump(self, direct=False, lscope=Scope.GROUP, rscope=Scope.ATTRIBUTE):
         """Dumps storage in a human-readable form to stdout.
 
@@ -137,7 +422,7 @@ class Serial:
         """
         data = None
         try:
-            data = yaml.safe_load(file)
+            data = yaml.load(file, Loader=self.loader)
         except Exception as e:
             print_error(e)
             return False
@@ -155,38 +440,22 @@ class Serial:
     def __import_yamldata(self, data):
         """Imports extracted (and parsed) YAML data.
         """
-        xref_queue = []
+        self.storage.bulk_import(self.__yaml_rows(data))
+
+    def __yaml_rows(self, data):
+        """Flattens parsed YAML data into bulk import rows.
+        """
         for gname, d_group in data.items():
-            group = self.storage.get_group(gname) or \
-                    self.storage.create_group(gname)
-            if d_group is None:
+            if not d_group:
+                yield gname, None, None, None, None
                 continue
             for ename, d_entity in d_group.items():
-                entity = self.storage.get_entity(gname, ename) or \
-                         group.create_entity(ename)
-                if d_entity is None:
+                if not d_entity:
+                    yield gname, ename, None, None, None
                     continue
                 for aname, d_attr in d_entity.items():
-                    atype, adata = self.__parse_yaml_attr(d_attr)
-                    # XREFs may not resolve yet, bypass saving them for now
-                    isXREF = atype.is_xref()
-                    if isXREF:
-                        ref_meta = atype, adata
-                        atype, adata = DType.TEXT, '<XREF>'  # bypass XREFs
-                    attr = self.storage.get_attribute(gname, ename, aname)
-                    if attr is None:
-                        attr = entity.create_attribute(aname, atype, adata)
-                    else:
-                        attr.name, attr.type, attr.data = aname, atype, adata
-                        attr.update()
-                    # queue XREFs for proper processing
-                    if isXREF:
-                        xref_queue.append((*ref_meta, attr))
-        # process XREFs
-        for ref_type, ref_data, attr in xref_queue:
-            attr.type = ref_type
-            attr.data = self.storage.get_from_rspec(ref_data)
-            attr.update()
+                    yield (gname, ename, aname,
+                           *self.__parse_yaml_attr(d_attr))
 
     def __parse_yaml_attr(self, d_attr):
         """Infers attribute value and type from YAML-parsed data.
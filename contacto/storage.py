@@ -12,14 +12,73 @@ Storage manipulation is transactional. For all transformations a safe
 variant is provided, `<transform>_safe`, which handles a single transaction.
 Unsafe transformations should be wrapped in a transaction manually.
 """
+import os
+import sys
 import sqlite3
 import pkgutil
 from abc import ABC, abstractmethod
 from .helpers import DType, bytes_to_attrdata, attrdata_to_bytes, validate_img
-from .helpers import Scope, refspec_scope, print_error
+from .helpers import BlobHandle, blob_digest, refid_to_bytes, fmatch
+from .helpers import Scope, refspec_scope, print_error, downscale_img
 
 
 DML_SCRIPT = 'resources/dml.sql'
+FTS_SCRIPT = 'resources/fts.sql'
+# current DB schema version (PRAGMA user_version)
+SCHEMA_VERSION = 3
+# maximum number of bound parameters per query
+MAX_PARAMS = 500
+# SQL functions of the same arguments always return the same result
+# (lets SQLite use them in indexes), the flag requires Python 3.8+
+DETERMINISTIC = {'deterministic': True} if sys.version_info >= (3, 8) \
+    else {}
+# thumbnails downscaled at once to use worker processes
+VARIANT_POOL_MIN = 4
+# connection tuning profiles (pragma settings)
+PROFILES = {
+    # SQLite defaults, the DB journal mode is left as is
+    'default': {},
+    # concurrent readers and a writer, fast durable commits
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 << 20,
+        'cache_size': -(64 << 10),  # KiB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,  # ms
+    },
+    # large imports, last commits may be lost on power failure
+    'bulk': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'mmap_size': 1 << 30,
+        'cache_size': -(256 << 10),
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+    },
+}
+# attribute data columns (attribute AS a), binary data is only measured
+ATTR_DATA_COLS = 'a.data, b.id, length(b.data)'
+ATTR_BLOB_JOIN = f'LEFT JOIN blob AS b ON (a.type={DType.BIN:d} \
+                   AND b.hash=a.data)'
+# thumbnail columns (entity AS e), the thumbnail is only measured
+THUMB_COLS = 'e.thumbnail, b.id, length(b.data)'
+THUMB_BLOB_JOIN = 'LEFT JOIN blob AS b ON (b.hash=e.thumbnail)'
+# attribute history data columns (attribute_history AS h)
+HISTORY_DATA_COLS = 'h.data, b.id, length(b.data)'
+HISTORY_BLOB_JOIN = f'LEFT JOIN blob AS b ON (h.type={DType.BIN:d} \
+                      AND b.hash=h.data)'
+# history entry name (attribute AS a, attribute_history AS h), see
+# HistoryAttribute
+HISTORY_NAME = "a.name || '_' || (SELECT count(*) FROM attribute_history \
+                AS n WHERE n.attribute_id=h.attribute_id \
+                AND n.version>=h.version)"
+# value of the I-th hex digit of attribute data
+_HEX_DIGIT = "(instr('0123456789ABCDEF', substr(hex(data), {}, 1)) - 1)"
+# XREF target ID decoded from attribute data (see refid_to_bytes)
+REF_ID_EXPR = ' + '.join(f"({_HEX_DIGIT.format(2 * i + 1)} * 16 + "
+                         f"{_HEX_DIGIT.format(2 * i + 2)}) * {256 ** i:d}"
+                         for i in range(4))
 
 
 class StorageElement(ABC):
@@ -34,12 +93,7 @@ class StorageElement(ABC):
         """
         super().__init__()
         self.parent = parent
-
-        if type(name) is not str or name == '':
-            raise Exception("Name must be a non-empty string")
-        if '/' in name:
-            raise Exception("Illegal character '/' in name")
-        self.name = name
+        self.name = check_name(name)
 
     def __str__(self):
         """String representation using scoped name (element refspec).
@@ -152,11 +206,42 @@ class Group(StorageElement):
         """
         super().__init__(parent, name)
         self.id = gid
-        self.entities = {}
+        self._entities = {}
 
     def __str__(self):
         return f"{self.name}"
 
+    @property
+    def entities(self):
+        """Name-indexed Entity dictionary, loaded on first access if lazy.
+        """
+        if self._entities is None:
+            self.get_storage().load_entities(self)
+        return self._entities
+
+    @entities.setter
+    def entities(self, entities):
+        self._entities = entities
+
+    @property
+    def loaded(self):
+        """True if the Entities are in memory (always, unless lazy).
+        """
+        return self._entities is not None
+
+    def unload(self):
+        """Discards the Entities of a Group of a lazy Storage.
+
+        They are read from the DB again on first access. Attributes are
+        unloaded first, so that they are freed without waiting for
+        the garbage collector (they reference their Entity).
+        """
+        if not self.get_storage().lazy or self._entities is None:
+            return
+        for entity in self._entities.values():
+            entity.attributes = None
+        self._entities = None
+
     def create_entity(self, name):
         """Creates a new Entity in this Group.
 
@@ -202,23 +287,19 @@ class Group(StorageElement):
 
     def delete(self):
         """Deletes Group (and its Entities) from tree and DB.
+
+        XREFs targeting the Group's elements are deleted as well,
+        see `Storage.delete_tree`.
         """
-        for entity in self.entities.copy().values():
-            entity.delete()
-        sql = 'DELETE FROM "group" WHERE id=?'
-        self.get_conn().execute(sql, [self.id])
-        self.parent.groups.pop(self.name, None)
+        self.get_storage().delete_tree(self)
 
     def merge(self, other):
         """Merges another Group into self.
+
+        Entities of the same name are merged, the others are moved,
+        see `Storage.merge_tree`.
         """
-        for name, oentity in other.entities.copy().items():
-            if name in self.entities:
-                self.entities[name].merge(oentity)
-            else:
-                e = self.create_entity(name)
-                e.merge(oentity)
-        other.delete()
+        self.get_storage().merge_tree(self, other)
 
 
 class Entity(StorageElement):
@@ -226,6 +307,10 @@ class Entity(StorageElement):
 
     Entity hosts an Attribute dictionary, its name
     and an optional binary thumbnail (image).
+
+    A stored thumbnail is held as a `contacto.helpers.BlobHandle`
+    and read from the DB only when the "thumbnail" member is accessed.
+    Thumbnails are stored as shared blobs, see `Storage.store_blob`.
     """
 
     def __init__(self, eid, name, thumbnail, parent):
@@ -234,8 +319,60 @@ class Entity(StorageElement):
         super().__init__(parent, name)
         self.id = eid
         self.thumbnail = thumbnail
-        self.attributes = {}
-        self.refs = set()
+        self._attributes = {}
+        self._refs = set()
+
+    @property
+    def thumbnail(self):
+        """Thumbnail data, read from the DB on access.
+        """
+        if isinstance(self._thumbnail, BlobHandle):
+            return self._thumbnail.read()
+        return self._thumbnail
+
+    @thumbnail.setter
+    def thumbnail(self, thumbnail):
+        self._thumbnail = thumbnail
+
+    def get_thumbnail(self, deferred=False, size=None):
+        """Gets the Entity thumbnail.
+
+        A downscaled variant may be requested, the full thumbnail is
+        returned if there is no variant as big, see `Storage.make_variants`.
+
+        :param deferred: return a stored thumbnail as a BlobHandle
+        :type  deferred: bool, optional
+        :param size: smallest variant bounding box size (px)
+        :type  size: int, optional
+        :return: thumbnail data, None if there is no thumbnail
+        :rtype:  Union[bytes, class:`contacto.helpers.BlobHandle`, None]
+        """
+        if size and isinstance(self._thumbnail, BlobHandle):
+            variant = self.get_storage().thumbnail_variant(
+                self._thumbnail.digest, size)
+            if variant is not None:
+                return variant
+        return self._thumbnail if deferred else self.thumbnail
+
+    @property
+    def attributes(self):
+        """Name-indexed Attribute dictionary, loaded on first access if lazy.
+        """
+        if self._attributes is None:
+            self.get_storage().load_attributes(self)
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, attributes):
+        self._attributes = attributes
+
+    @property
+    def refs(self):
+        """XREF Attributes targeting this Entity, loaded on first access.
+        """
+        if self._refs is None:
+            self.get_storage().load_refs(self, DType.EXREF)
+        return self._refs
 
     def create_attribute(self, name, dtype, data):
         """Creates a new Attribute for this Entity.
@@ -250,8 +387,14 @@ class Entity(StorageElement):
         :rtype:  class:`contacto.storage.Attribute`
         """
         cur = self.get_conn().cursor()
-        sql = 'INSERT INTO attribute VALUES (NULL, ?, ?, ?, ?)'
-        bin_data = attrdata_to_bytes(dtype, data)
+        sql = 'INSERT INTO attribute (id, name, type, data, entity_id) \
+               VALUES (NULL, ?, ?, ?, ?)'
+        if dtype is DType.BIN:
+            data = self.get_storage().store_blob(data)
+            bin_data = data.digest
+        else:
+            _check_ref_target(dtype, data)
+            bin_data = attrdata_to_bytes(dtype, data)
         cur.execute(sql, (name, dtype, bin_data, self.id))
         aid = cur.lastrowid
 
@@ -277,64 +420,76 @@ class Entity(StorageElement):
         """Reads Entity data from DB.
         """
         cur = self.get_conn().cursor()
-        sql = 'SELECT name, thumbnail FROM entity WHERE id=?'
+        sql = f'SELECT e.name, {THUMB_COLS} FROM entity AS e \
+                {THUMB_BLOB_JOIN} WHERE e.id=?'
         cur.execute(sql, [self.id])
-        self.name, self.thumbnail = cur.fetchone()
+        self.name, *thumb = cur.fetchone()
+        self.thumbnail = self.get_storage().blob_handle(*thumb)
 
     def update(self):
         """Saves Entity data to DB.
+
+        A stored thumbnail is not written again, only its hash is.
+        Its downscaled variants are left for
+        `Storage.make_pending_variants`.
         """
+        storage = self.get_storage()
+        if self._thumbnail is not None:
+            self.thumbnail = storage.store_blob(self._thumbnail)
         sql = 'UPDATE entity SET name=?, thumbnail=? WHERE id=?'
-        self.get_conn().execute(sql, (self.name, self.thumbnail, self.id))
+        thumb = None if self._thumbnail is None else self._thumbnail.digest
+        self.get_conn().execute(sql, (self.name, thumb, self.id))
+        if thumb:
+            storage.variants_pending.add(thumb)
 
     def delete(self):
         """Deletes Entity (and its Attributes) from DB and tree.
+
+        XREFs targeting the Entity or its Attributes are deleted as well,
+        see `Storage.delete_tree`.
         """
-        for attr in self.attributes.copy().values():
-            attr.delete()
-        sql = 'DELETE FROM entity WHERE id=?'
-        self.get_conn().execute(sql, [self.id])
-        self.parent.entities.pop(self.name)
-        # delete refs pointing to me
-        for ref in self.refs.copy():
-            ref.delete()
+        self.get_storage().delete_tree(self)
 
     def merge(self, other):
         """Merges another Entity into self.
+
+        Attributes of the same name are merged, the others are moved,
+        see `Storage.merge_tree`.
         """
-        if other.thumbnail and not self.thumbnail:
-            self.thumbnail = other.thumbnail
-            self.update()
-        # redirect all pointers to us
-        for attr in other.refs.copy():
-            attr.data = self
-            attr.update()
-        for name, oattr in other.attributes.copy().items():
-            if name in self.attributes:
-                self.attributes[name].merge(oattr)
-            else:
-                # create a dummy attribute and merge oattr into it
-                attr = self.create_attribute(name, DType.TEXT, '<MERGE>')
-                attr.merge(oattr)
-        other.delete()
+        self.get_storage().merge_tree(self, other)
 
-    def thumbnail_from_attr(self):
+    def thumbnail_from_attr(self, now=False):
         """Sets a thumbnail from a "thumbnail" attribute.
 
         For convenience, a "thumbnail" attribute may carry an entity's
         thumbnail. This is a notification hook to try querying it for data.
+        While the storage defers thumbnails, the Entity is only noted
+        for `Storage.validate_thumbnails`.
+
+        :param now: set the thumbnail even if thumbnails are deferred
+        :type  now: bool, optional
         """
+        storage = self.get_storage()
+        if storage.thumbs_pending is not None and not now:
+            storage.thumbs_pending.add(self.id)
+            return
         if 'thumbnail' not in self.attributes:
-            if self.thumbnail:
+            # a stored thumbnail is not read, only its handle is checked
+            if self._thumbnail is not None:
                 self.thumbnail = None
                 self.update()
             return
         thumb = self.attributes['thumbnail']
-        ttype, tdata = thumb.get()
-        if ttype is DType.BIN and validate_img(tdata):
-            if self.thumbnail != tdata:
-                self.thumbnail = tdata
-                self.update()
+        ttype, tdata = thumb.get(deferred=True)
+        if ttype is not DType.BIN:
+            return
+        # stored data are compared by their hashes
+        digest = getattr(tdata, 'digest', None)
+        if digest and digest == getattr(self._thumbnail, 'digest', None):
+            return
+        if storage.is_image(tdata):
+            self.thumbnail = tdata
+            self.update()
 
 
 class Attribute(StorageElement):
@@ -351,6 +506,17 @@ class Attribute(StorageElement):
     X-REF attributes register at their targets and are deleted when their
     target is deleted. Hence deleting an Entity or Attribute may cascade.
     These registrations are properly handled on mutations.
+
+    The Attribute an AXREF chain terminates at is resolved once and cached.
+    Changing data of any chain link invalidates the cache of all Attributes
+    resolving through it, following the registrations.
+
+    Stored BIN data is held as a `contacto.helpers.BlobHandle`
+    and read from the DB only when the "data" member is accessed.
+    BIN data are stored as shared blobs, see `Storage.store_blob`.
+
+    Rotated values are kept in the Attribute's history,
+    see `HistoryAttribute`.
     """
 
     def __init__(self, aid, name, dtype, data, parent):
@@ -359,16 +525,81 @@ class Attribute(StorageElement):
         super().__init__(parent, name)
         self.__thumb = name == 'thumbnail'
         self.id = aid
+        self._target = None
         self.type = dtype
         self.data = data
-        self.refs = set()
+        self._refs = set()
+        # history entries, oldest first
+        self._history = []
 
-    def ref_register(self):
+    @property
+    def data(self):
+        """Attribute data, stored binary data is read from the DB on access.
+        """
+        if isinstance(self._data, BlobHandle):
+            return self._data.read()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self.__invalidate()
+
+    @property
+    def refs(self):
+        """XREF Attributes targeting this Attribute, loaded on first access.
+        """
+        if self._refs is None:
+            self.get_storage().load_refs(self, DType.AXREF)
+        return self._refs
+
+    @property
+    def target(self):
+        """The Attribute an AXREF chain terminates at (self if not an AXREF).
+
+        Resolved on first access, the result is cached by all chain links.
+        """
+        if self._target is None:
+            chain, link = set(), self
+            while link._target is None and link.type is DType.AXREF:
+                if link in chain:
+                    raise Exception(f'REF loop detected at {link}')
+                chain.add(link)
+                link = link.data
+            target = link._target or link
+            chain.add(link)
+            for link in chain:
+                link._target = target
+        return self._target
+
+    def __invalidate(self):
+        """Drops cached targets resolved through this Attribute.
+
+        A referrer may only have a cached target if its target has one,
+        so the traversal stops at Attributes without it.
+        """
+        stack = [self]
+        while stack:
+            attr = stack.pop()
+            if attr._target is None:
+                continue
+            attr._target = None
+            stack.extend(attr.refs)
+
+    def ref_register(self, check=True):
         """ Registers a reference to its target.
+
+        Targets that have not loaded their referrers yet are left alone,
+        they will find this reference in the DB once they do.
+
+        :param check: run loop detection first
+        :type  check: bool, optional
         """
         if self.type.is_xref():
-            self.__loop_detect()
-            self.data.refs.add(self)
+            if check:
+                self.__loop_detect()
+            if self.data._refs is not None:
+                self.data._refs.add(self)
 
     def ref_unregister(self):
         """ Unregisters a reference from its target.
@@ -379,55 +610,89 @@ class Attribute(StorageElement):
     def __thumb_hook(self):
         """Notifies the Entity for thumbnail update (if applicable).
         """
-        if self.__thumb:
-            self.parent.thumbnail_from_attr()
-        else:
-            # propagate thumbnail update recursively
-            for ref in self.refs:
-                ref.__thumb_hook()
+        # propagate thumbnail update through referrers
+        stack = [self]
+        while stack:
+            attr = stack.pop()
+            if attr.__thumb:
+                attr.parent.thumbnail_from_attr()
+            else:
+                stack.extend(attr.refs)
 
     def read(self):
         """Updates Attribute data from the DB.
         """
         cur = self.get_conn().cursor()
-        sql = 'SELECT name, type, data FROM attribute WHERE id=?'
+        sql = f'SELECT a.name, a.type, {ATTR_DATA_COLS} FROM attribute AS a \
+                {ATTR_BLOB_JOIN} WHERE a.id=?'
         cur.execute(sql, [self.id])
-        self.name, int_type, bin_data = cur.fetchone()
+        self.name, int_type, *data = cur.fetchone()
         self.type = DType(int_type)
-        self.data = bytes_to_attrdata(self.type, bin_data)
+        storage = self.get_storage()
+        self.data = storage.attrdata_from_row(self.type, *data)
         if self.type.is_xref():
-            storage = self.get_storage()
             self.data = storage.elem_from_refid(self.type, self.data)
 
     def update(self):
         """Saves Attribute data into the DB, checked for loops.
         """
         # check previous data for obsolete XREF registration
-        t, d = self.type, self.data
+        t, d = self.type, self._data
         self.read()  # read original data
         t, self.type = self.type, t  # swap back new data
-        d, self.data = self.data, d
+        d, self._data = self._data, d
 
+        if self.type is DType.BIN:
+            # stored binary data are not written again, only their hash is
+            self.data = self.get_storage().store_blob(self._data)
+            bin_data = self._data.digest
+        else:
+            _check_ref_target(self.type, self.data)
+            bin_data = attrdata_to_bytes(self.type, self.data)
         sql = 'UPDATE attribute SET name=?, type=?, data=? WHERE id=?'
-        bin_data = attrdata_to_bytes(self.type, self.data)
-        self.get_conn().execute(sql, (self.name, self.type, bin_data, self.id))
+        self.get_conn().execute(sql, (self.name, self.type, bin_data,
+                                      self.id))
+        self.__invalidate()
         # unregister old ref is applicable
-        if t.is_xref():
-            d.refs.discard(self)
+        if t.is_xref() and d._refs is not None:
+            d._refs.discard(self)
         self.ref_register()
         self.__thumb_hook()
 
     def delete(self):
         """Deletes Attribute from tree and DB (may cascade!)
+
+        XREFs targeting the Attribute are deleted as well, the history
+        is kept as "A_1", "A_2", ... Attributes, see `Storage.delete_tree`.
         """
-        sql = 'DELETE FROM attribute WHERE id=?'
-        self.get_conn().execute(sql, [self.id])
-        self.parent.attributes.pop(self.name, None)
-        # unregister and delete refs pointing to me
-        self.ref_unregister()
-        for ref in self.refs.copy():
-            ref.delete()
-        self.__thumb_hook()
+        self.get_storage().delete_tree(self)
+
+    def replace(self, dtype, data):
+        """Replaces Attribute data in memory, the DB is left alone.
+
+        XREF registration moves to the new target.
+        """
+        if self.type.is_xref() and self.data._refs is not None:
+            self.data._refs.discard(self)
+        self.type = dtype
+        self.data = data
+        if dtype.is_xref() and data._refs is not None:
+            data._refs.add(self)
+
+    def detach(self):
+        """Removes a deleted Attribute and its history from the tree.
+
+        The Attribute is unregistered from its XREF target, the DB
+        is left alone. Referrers are expected to be detached as well.
+        """
+        attributes = self.parent._attributes
+        if attributes is not None and attributes.get(self.name) is self:
+            del attributes[self.name]
+        # history is kept or deleted by the DB, see `Storage.delete_tree`
+        self.__unlist_history()
+        self._target = None
+        if self.type.is_xref() and self.data._refs is not None:
+            self.data._refs.discard(self)
 
     def merge(self, other):
         """Merges another Attribute into self, checked for loops.
@@ -442,76 +707,232 @@ class Attribute(StorageElement):
             attr.update()
 
         self.type = other.type
-        self.data = other.data
+        self.data = other._data
         self.update()
+        self.__take_history(other)
         other.delete()
 
-    def get(self):
+    def get(self, deferred=False):
         """Gets the actual data the Attribute references.
 
         For non-XREF Attributes this returns own data.
         For XREFs, the REF chain is traced to a non-REF source.
         This may be an Entity or a non-XREF Attribute.
+        The chain is only traced once, see `target`.
 
+        :param deferred: return stored binary data as a BlobHandle
+        :type  deferred: bool, optional
         :return: resolved type and data
-        :rtype:  (class:`contacto.helpers.DType`, Union[str, bytes])
+        :rtype:  (class:`contacto.helpers.DType`,
+                  Union[str, bytes, class:`contacto.helpers.BlobHandle`])
         """
-        if self.type is DType.EXREF:
-            return DType.TEXT, str(self.data)
-        elif self.type is DType.AXREF:
-            return self.data.get()
-        return self.type, self.data
-
-    def rotate(self):
+        target = self.target
+        if target.type is DType.EXREF:
+            return DType.TEXT, str(target.data)
+        if deferred:
+            return target.type, target._data
+        return target.type, target.data
+
+    def rotate(self, keep=None):
         """Rotates the attribute in a logrotate way.
 
-        A single Attribute named "A" is copied into one named "A_1".
-        If "A_1" already exists, it is copied into "A_2" and so on.
-        This helps maintain an attribute value history.
+        The current value of an Attribute named "A" is added to its history,
+        which lists the latest value as "A_1", the one before as "A_2"
+        and so on. This helps maintain an attribute value history.
+        History is append-only, rotation does not shift older values.
+
+        History keeps values as they were, XREFs are stored resolved.
+        "A_1", "A_2", ... Attributes (kept by older versions of Contacto
+        or imported) are moved to the history first.
+
+        :param keep: number of history entries to keep, all if None
+        :type  keep: int, optional
         """
-        self.__rotate(f"{self.name}_1")
+        self.__absorb_history()
+        self.__append_history(self)
+        if keep is not None:
+            self.trim_history(keep)
+        self.list_history()
 
-    def rotate_safe(self):
+    def rotate_safe(self, keep=None):
         """A single-transaction variant of rotate.
         """
         try:
             with self.get_conn():
-                self.rotate()
+                self.rotate(keep)
                 return True
         except Exception as e:
             print_error(e)
             return False
 
-    def __rotate(self, nxt_name):
-        """Recursive rotate, next Attribute name is passed as accumulator.
-        """
-        ent = self.parent
-        # recursively rotate until end of rotate-chain is found
-        if nxt_name in ent.attributes:
-            nxt_attr = ent.attributes[nxt_name]
-            nxt_name_toks = nxt_name.split('_')
-            base = '_'.join(nxt_name_toks[:-1])
-            sfx = int(nxt_name_toks[-1]) + 1
-
-            nxt_attr.__rotate(f"{base}_{sfx}")
+    def trim_history(self, keep):
+        """Deletes all but the latest history entries.
 
-            nxt_attr.type = self.type
-            nxt_attr.data = self.data
-            nxt_attr.update()
+        :param keep: number of history entries to keep
+        :type  keep: int
+        """
+        drop = self._history[:max(len(self._history) - keep, 0)]
+        if not drop:
+            return
+        sql = 'DELETE FROM attribute_history \
+               WHERE attribute_id=? AND version<=?'
+        self.get_conn().execute(sql, (self.id, drop[-1].version))
+        self.__unlist_history()
+        del self._history[:len(drop)]
+        self.list_history()
+
+    def list_history(self):
+        """Lists history entries among the Entity's Attributes.
+
+        Entries are named by their age, "A_1" being the latest.
+        Attributes of the same name take precedence.
+        """
+        attributes = self.parent.attributes
+        age = 0
+        for age, entry in enumerate(reversed(self._history), 1):
+            entry.name = f"{self.name}_{age}"
+            listed = attributes.get(entry.name)
+            if listed is None or getattr(listed, 'owner', None) is self:
+                attributes[entry.name] = entry
+        # unlist names of deleted entries
+        while True:
+            age += 1
+            name = f"{self.name}_{age}"
+            if getattr(attributes.get(name), 'owner', None) is not self:
+                break
+            del attributes[name]
+
+    def __unlist_history(self):
+        """Removes history entries from the Entity's Attributes.
+        """
+        attributes = self.parent.attributes
+        for entry in self._history:
+            if attributes.get(entry.name) is entry:
+                del attributes[entry.name]
+
+    def __append_history(self, attr):
+        """Adds a resolved value of an Attribute to the history
+        as its latest entry.
+        """
+        dtype, data = attr.get(deferred=True)
+        if dtype is DType.BIN:
+            data = self.get_storage().store_blob(data)
+            bin_data = data.digest
         else:
-            ent.create_attribute(nxt_name, self.type, self.data)
+            bin_data = attrdata_to_bytes(dtype, data)
+        version = self._history[-1].version + 1 if self._history else 1
+        sql = 'INSERT INTO attribute_history VALUES (NULL, ?, ?, ?, ?)'
+        cur = self.get_conn().execute(sql, (self.id, version, dtype,
+                                            bin_data))
+        self._history.append(HistoryAttribute(cur.lastrowid, version, dtype,
+                                              data, self))
+
+    def __absorb_history(self):
+        """Moves "A_1", "A_2", ... Attributes to the history.
+        """
+        attributes = self.parent.attributes
+        old = []
+        while True:
+            attr = attributes.get(f"{self.name}_{len(old) + 1}")
+            if attr is None or isinstance(attr, HistoryAttribute):
+                break
+            old.append(attr)
+        for attr in reversed(old):
+            if attr.refs:
+                raise Exception(f"Cannot move {attr} to history, "
+                                f"it is referenced")
+            self.__append_history(attr)
+            attr.delete()
 
-    def __loop_detect(self, stop=None):
-        """Traverses reflinks recursively and detects loops.
+    def __take_history(self, other):
+        """Moves history of another Attribute after own history entries.
         """
-        if self.type is DType.EXREF:
+        if not other._history:
             return
-        elif self.type is DType.AXREF:
-            if stop is self:
-                raise Exception(f'REF loop detected at {self}')
-            elif stop is None:
-                stop = self
-            self.data.__loop_detect(stop)
+        base = self._history[-1].version if self._history else 0
+        sql = 'UPDATE attribute_history SET attribute_id=?, \
+               version=version+? WHERE attribute_id=?'
+        self.get_conn().execute(sql, (self.id, base, other.id))
+        self.adopt_history(other)
+
+    def adopt_history(self, other):
+        """Moves in-memory history entries of another Attribute after own
+        history entries, the DB is left alone.
+        """
+        if not other._history:
+            return
+        base = self._history[-1].version if self._history else 0
+        other.__unlist_history()
+        for entry in other._history:
+            entry.owner, entry.parent = self, self.parent
+            entry.version += base
+        self._history.extend(other._history)
+        other._history = []
+        self.list_history()
+
+    def __loop_detect(self):
+        """Detects loops by resolving the AXREF chain target.
+
+        Only links without a cached target are walked. Changing data of a link
+        drops the cache of all Attributes resolving through it, so a chain
+        leading back here is walked in full. Cached targets then make
+        checks of further references into the same chain O(1).
+        """
+        self.__invalidate()
+        self.target
+
+
+class HistoryAttribute(Attribute):
+    """A past value of an Attribute, kept by rotation.
+
+    History entries are listed among the Entity's Attributes, the latest
+    value of an Attribute "A" as "A_1", the one before as "A_2" and so on.
+    They hold TEXT or BIN data only, XREFs are stored resolved.
+    They are read-only and cannot be referenced, but they may be deleted.
+    Their IDs are negative, not to collide with Attribute IDs.
+    """
+
+    def __init__(self, hid, version, dtype, data, owner):
+        """The constructor linking to the owning Attribute.
+        """
+        super().__init__(-hid, f"{owner.name}_{version}", dtype, data,
+                         owner.parent)
+        self.owner = owner
+        self.version = version
+
+    def read(self):
+        """Updates the entry's data from the DB.
+        """
+        sql = f'SELECT h.type, {HISTORY_DATA_COLS} \
+                FROM attribute_history AS h {HISTORY_BLOB_JOIN} WHERE h.id=?'
+        int_type, *data = self.get_conn().execute(sql, [-self.id]).fetchone()
+        self.type = DType(int_type)
+        self.data = self.get_storage().attrdata_from_row(self.type, *data)
+
+    def update(self):
+        """History entries are read-only.
+        """
+        raise Exception(f"History entry {self} is read-only")
+
+    def delete(self):
+        """Deletes the entry from its Attribute's history.
+        """
+        sql = 'DELETE FROM attribute_history WHERE id=?'
+        self.get_conn().execute(sql, [-self.id])
+        if self.parent.attributes.get(self.name) is self:
+            del self.parent.attributes[self.name]
+        self.owner._history.remove(self)
+        self.owner.list_history()
+
+    def merge(self, other):
+        """History entries are read-only.
+        """
+        raise Exception(f"History entry {self} is read-only")
+
+    def rotate(self, keep=None):
+        """History entries are read-only.
+        """
+        raise Exception(f"History entry {self} is read-only")
 
 
 class Storage:
@@ -521,31 +942,82 @@ class Storage:
     A Storage object is needed for all of Contacto's functionality.
 
     Access its Group children with the "groups" name-indexed dictionary.
+
+    A lazy Storage does not read the tree upfront. Groups, Entities of a Group
+    and Attributes of an Entity are read from the DB on first access instead.
+    This keeps opening a large database and fetching a few elements cheap.
+
+    The connection is tuned by a profile from PROFILES. Use "wal" to let
+    readers work while another process writes, "bulk" for large imports.
     """
 
-    def __init__(self, db_file):
+    def __init__(self, db_file, lazy=False, profile='default'):
         """Initializes the database with a path to the database.
 
         Optionally, provide a ":memory:" string to create DB in-memory.
 
         :param db_file: path to the database (or :memory:)
         :type db_file:  str
+        :param lazy: load the tree on demand
+        :type  lazy: bool, optional
+        :param profile: connection tuning profile name
+        :type  profile: str, optional
         """
         self.db_file = db_file
+        self.lazy = lazy
+        # blob hash -> image validation result, see is_image
+        self.images = {}
+        # IDs of Entities with deferred thumbnails, see defer_thumbnails
+        self.thumbs_pending = None
+        # thumbnail hashes lacking variants, see make_pending_variants
+        self.variants_pending = set()
         # connection
         self.db_conn = sqlite3.connect(db_file)
         # executor
         self.db_cur = self.db_conn.cursor()
+        self.set_profile(profile)
         self.create_db()
         self.set_foreign_keys(True)
+        self.db_conn.create_function('fmatch', 2, _sql_fmatch)
+        self.db_conn.create_function('refid', 1, refid_to_bytes,
+                                     **DETERMINISTIC)
 
-        # load everything from db
+        # load everything from db (or prepare for lazy loading)
         self.reload()
 
     def __del__(self):
         """Closes the DB connection on deletion.
         """
-        self.db_conn.close()
+        try:
+            self.db_conn.close()
+        except sqlite3.ProgrammingError:
+            # collected in another thread, the connection closes on its own
+            pass
+
+    @property
+    def groups(self):
+        """Name-indexed Group dictionary, loaded on first access if lazy.
+        """
+        if self._groups is None:
+            self.load_groups()
+        return self._groups
+
+    @groups.setter
+    def groups(self, groups):
+        self._groups = groups
+
+    def set_profile(self, profile):
+        """Applies a connection tuning profile.
+
+        :param profile: profile name, a key of PROFILES
+        :type  profile: str
+        :raises Exception: the profile does not exist
+        """
+        if profile not in PROFILES:
+            raise Exception(f"Unknown profile '{profile}'")
+        for pragma, value in PROFILES[profile].items():
+            self.db_conn.execute(f"PRAGMA {pragma} = {value}")
+        self.profile = profile
 
     def set_foreign_keys(self, on):
         """Turns foreign keys ON or OFF.
@@ -560,7 +1032,12 @@ class Storage:
         """Discards any existing storage tree and reads it anew from DB.
 
         Constructs the entire tree including Attributes.
+        A lazy Storage only discards the tree, it is read again on demand.
         """
+        if self.lazy:
+            self.groups = None
+            return
+
         # NAME-indexed group dict
         self.groups = {}
         # ID-indexed helper dicts
@@ -579,17 +1056,22 @@ class Storage:
             self.groups[name] = group
 
         # load entities
-        self.db_cur.execute('SELECT * FROM entity')
-        for eid, name, thb, gid in self.db_cur.fetchall():
+        sql = f'SELECT e.id, e.name, {THUMB_COLS}, e.group_id \
+                FROM entity AS e {THUMB_BLOB_JOIN}'
+        self.db_cur.execute(sql)
+        for eid, name, *thumb, gid in self.db_cur.fetchall():
+            thb = self.blob_handle(*thumb)
             entity = Entity(eid, name, thb, groups_by_id[gid])
             entities_by_id[eid] = entity
             groups_by_id[gid].entities[name] = entity
 
         # load attributes
-        self.db_cur.execute('SELECT * FROM attribute')
-        for aid, name, dtype, data, eid in self.db_cur.fetchall():
+        sql = f'SELECT a.id, a.name, a.type, {ATTR_DATA_COLS}, a.entity_id \
+                FROM attribute AS a {ATTR_BLOB_JOIN}'
+        self.db_cur.execute(sql)
+        for aid, name, dtype, *data, eid in self.db_cur.fetchall():
             dtype = DType(dtype)
-            attr_data = bytes_to_attrdata(dtype, data)
+            attr_data = self.attrdata_from_row(dtype, *data)
             ent = entities_by_id[eid]
 
             attribute = Attribute(aid, name, dtype, attr_data, ent)
@@ -602,10 +1084,682 @@ class Storage:
             elif dtype is DType.AXREF:
                 axref_attributes.append(attribute)
 
-        # replace AXREFs using actual data
+        # replace AXREFs using actual data, checked for loops at once
+        self.__raise_loops()
         for attribute in axref_attributes:
             attribute.data = attributes_by_id[attribute.data]
-            attribute.ref_register()
+            attribute.ref_register(check=False)
+
+        self.load_history(attributes_by_id)
+
+    def load_groups(self):
+        """Reads all Groups from DB, leaving their Entities unloaded.
+        """
+        self.groups = {}
+        sql = 'SELECT id, name FROM "group"'
+        for gid, name in self.db_conn.execute(sql).fetchall():
+            group = Group(gid, name, self)
+            group.entities = None
+            self.groups[name] = group
+
+    def load_entities(self, group):
+        """Reads Entities of a Group from DB, leaving Attributes unloaded.
+
+        :param group: Group to load
+        :type  group: class:`contacto.storage.Group`
+        """
+        group.entities = {}
+        sql = f'SELECT e.id, e.name, {THUMB_COLS} FROM entity AS e \
+                {THUMB_BLOB_JOIN} WHERE e.group_id=?'
+        rows = self.db_conn.execute(sql, [group.id]).fetchall()
+        for eid, name, *thumb in rows:
+            thb = self.blob_handle(*thumb)
+            entity = Entity(eid, name, thb, group)
+            entity.attributes = None
+            entity._refs = None
+            group.entities[name] = entity
+
+    def load_attributes(self, entity):
+        """Reads Attributes of an Entity from DB.
+
+        XREF targets are resolved (and loaded) as well.
+        The dictionary is attached before resolving so that XREFs pointing
+        back into this Entity find it.
+
+        :param entity: Entity to load
+        :type  entity: class:`contacto.storage.Entity`
+        """
+        entity.attributes = {}
+        xref_attributes = []
+        sql = f'SELECT a.id, a.name, a.type, {ATTR_DATA_COLS} \
+                FROM attribute AS a {ATTR_BLOB_JOIN} WHERE a.entity_id=?'
+        rows = self.db_conn.execute(sql, [entity.id]).fetchall()
+        for aid, name, dtype, *data in rows:
+            dtype = DType(dtype)
+            attr_data = self.attrdata_from_row(dtype, *data)
+            attribute = Attribute(aid, name, dtype, attr_data, entity)
+            attribute._refs = None
+            entity.attributes[name] = attribute
+            if dtype.is_xref():
+                xref_attributes.append(attribute)
+
+        for attribute in xref_attributes:
+            attribute.data = self.elem_from_refid(attribute.type,
+                                                  attribute.data)
+            # the DB holds no loops, skip detection
+            attribute.ref_register(check=False)
+
+        self.load_history({attr.id: attr for attr
+                           in entity.attributes.values()}, entity)
+
+    def load_history(self, attributes, entity=None):
+        """Reads history entries of loaded Attributes from DB.
+
+        :param attributes: ID-indexed Attributes
+        :type  attributes: dict
+        :param entity: read history of this Entity's Attributes only
+        :type  entity: class:`contacto.storage.Entity`, optional
+        """
+        sql = f'SELECT h.id, h.attribute_id, h.version, h.type, \
+                    {HISTORY_DATA_COLS} FROM attribute_history AS h \
+                {HISTORY_BLOB_JOIN}'
+        params = []
+        if entity is not None:
+            sql += ' JOIN attribute AS a ON (a.id=h.attribute_id) \
+                     WHERE a.entity_id=?'
+            params.append(entity.id)
+        sql += ' ORDER BY h.attribute_id, h.version'
+        owners = set()
+        for hid, aid, version, dtype, *data in \
+                self.db_conn.execute(sql, params).fetchall():
+            dtype = DType(dtype)
+            data = self.attrdata_from_row(dtype, *data)
+            owner = attributes[aid]
+            owner._history.append(HistoryAttribute(hid, version, dtype,
+                                                   data, owner))
+            owners.add(owner)
+        for owner in owners:
+            owner.list_history()
+
+    def load_refs(self, elem, dtype):
+        """Reads XREF Attributes targeting an Entity or an Attribute from DB.
+
+        :param elem: XREF target
+        :type  elem: Union[class:`contacto.storage.Entity`,
+                           class:`contacto.storage.Attribute`]
+        :param dtype: XREF type targeting elem
+        :type  dtype: class:`contacto.helpers.DType`
+        """
+        sql = 'SELECT id FROM attribute WHERE ref_id=? AND type=?'
+        rows = self.db_conn.execute(sql, (elem.id, dtype)).fetchall()
+        refs = set()
+        for aid, in rows:
+            ref = self.elem_from_refid(DType.AXREF, aid)
+            if ref is not None:
+                refs.add(ref)
+        elem._refs = refs
+
+    def delete_tree(self, elem):
+        """Deletes a tree element with its subtree and all XREFs
+        transitively referencing any of its elements.
+
+        The doomed Attributes are found by a single recursive query
+        using the XREF target index and deleted by a single statement, then
+        the subtree's Entities and the element itself follow.
+        History of doomed Attributes of Entities left in the tree is kept
+        as "A_1", "A_2", ... Attributes (logged as inserts), history
+        of the subtree goes with it.
+        The in-memory tree is patched in one pass over the loaded part
+        of the subtree and the doomed referrers, elements not loaded yet
+        are left alone.
+
+        :param elem: element to delete
+        :type  elem: Union[class:`contacto.storage.Group`,
+                           class:`contacto.storage.Entity`,
+                           class:`contacto.storage.Attribute`]
+        """
+        conn = self.db_conn
+        # subtree Attributes and Entities, Entities left in the tree
+        if isinstance(elem, Group):
+            attrs = 'SELECT a.id FROM attribute AS a \
+                     JOIN entity AS e ON (e.id=a.entity_id) \
+                     WHERE e.group_id=:id'
+            ents = 'SELECT id FROM entity WHERE group_id=:id'
+            survivors = 'e.group_id!=:id'
+            rest = ['DELETE FROM entity WHERE group_id=:id',
+                    'DELETE FROM "group" WHERE id=:id']
+        elif isinstance(elem, Entity):
+            attrs = 'SELECT id FROM attribute WHERE entity_id=:id'
+            ents = 'SELECT :id AS id'
+            survivors = 'e.id!=:id'
+            rest = ['DELETE FROM entity WHERE id=:id']
+        else:
+            attrs = 'SELECT :id'
+            ents = None
+            survivors = '1'
+            rest = []
+        params = {'id': elem.id}
+        exrefs = ''
+        if ents:
+            exrefs = f'UNION SELECT id FROM attribute \
+                       WHERE ref_id IN ({ents}) AND type={DType.EXREF:d}'
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS delete_attribute \
+                      (id INTEGER PRIMARY KEY)')
+        try:
+            conn.execute(f'INSERT INTO temp.delete_attribute \
+                           WITH RECURSIVE doomed(id) AS ( \
+                               {attrs} {exrefs} \
+                               UNION SELECT r.id FROM doomed AS d \
+                               JOIN attribute AS r ON (r.ref_id=d.id \
+                                   AND r.type={DType.AXREF:d})) \
+                           SELECT id FROM doomed', params)
+            # doomed Attributes of Entities left in the tree
+            sql = f'SELECT g.name, e.name, a.name \
+                    FROM temp.delete_attribute AS t \
+                    JOIN attribute AS a ON (a.id=t.id) \
+                    JOIN entity AS e ON (e.id=a.entity_id) \
+                    JOIN "group" AS g ON (g.id=e.group_id) WHERE {survivors}'
+            orphaned = conn.execute(sql, params).fetchall()
+            # their "thumbnail" Attributes are gone
+            sql = f'UPDATE entity SET thumbnail=NULL \
+                    WHERE thumbnail IS NOT NULL AND id IN ( \
+                        SELECT e.id FROM temp.delete_attribute AS t \
+                        JOIN attribute AS a ON (a.id=t.id) \
+                        JOIN entity AS e ON (e.id=a.entity_id) \
+                        WHERE a.name=\'thumbnail\' AND {survivors})'
+            conn.execute(sql, params)
+            # their history is kept as "A_1", "A_2", ... Attributes,
+            # entries hidden by Attributes of the same name are dropped
+            last = conn.execute('SELECT max(id) FROM attribute').fetchone()
+            sql = f'INSERT OR IGNORE INTO attribute \
+                        (name, type, data, entity_id) \
+                    SELECT {HISTORY_NAME}, h.type, h.data, a.entity_id \
+                    FROM temp.delete_attribute AS t \
+                    JOIN attribute AS a ON (a.id=t.id) \
+                    JOIN entity AS e ON (e.id=a.entity_id) \
+                    JOIN attribute_history AS h ON (h.attribute_id=a.id) \
+                    WHERE {survivors} ORDER BY a.id, h.version DESC'
+            conn.execute(sql, params)
+            sql = f'SELECT g.name, e.name, a.id, a.name, a.type, \
+                        {ATTR_DATA_COLS} FROM attribute AS a \
+                    JOIN entity AS e ON (e.id=a.entity_id) \
+                    JOIN "group" AS g ON (g.id=e.group_id) \
+                    {ATTR_BLOB_JOIN} WHERE a.id>?'
+            kept = conn.execute(sql, [last[0] or 0]).fetchall()
+            conn.execute('DELETE FROM attribute WHERE id IN \
+                          (SELECT id FROM temp.delete_attribute)')
+            for sql in rest:
+                conn.execute(sql, params)
+        finally:
+            conn.execute('DELETE FROM temp.delete_attribute')
+
+        for group_name, entity_name, name in orphaned:
+            entity = self.__loaded_entity(group_name, entity_name)
+            if entity is None:
+                continue
+            if name == 'thumbnail':
+                entity.thumbnail = None
+            attr = (entity._attributes or {}).get(name)
+            if attr is not None and not isinstance(attr, HistoryAttribute):
+                attr.detach()
+        for attr in _loaded_attributes(elem):
+            attr.detach()
+        for group_name, entity_name, aid, name, dtype, *data in kept:
+            entity = self.__loaded_entity(group_name, entity_name)
+            if entity is None or entity._attributes is None:
+                continue
+            dtype = DType(dtype)
+            entity._attributes[name] = Attribute(
+                aid, name, dtype, self.attrdata_from_row(dtype, *data), entity)
+        if isinstance(elem, Group):
+            self.groups.pop(elem.name, None)
+        elif isinstance(elem, Entity):
+            elem.parent.entities.pop(elem.name, None)
+
+    def merge_tree(self, elem, other):
+        """Merges a Group or an Entity into another element of its type.
+
+        Entities and Attributes of the same name are merged, the others
+        are moved along with their subtrees. A merged Attribute takes
+        the other's data and history and a merged Entity takes the other's
+        thumbnail if it has none. XREFs targeting the other's merged
+        elements are redirected to their counterparts. Checked for loops.
+
+        Merged pairs are collected into temp tables and every step is
+        a single statement over all of them. The in-memory tree is then
+        patched, elements not loaded yet are left alone.
+
+        :param elem: element to merge into
+        :type  elem: Union[class:`contacto.storage.Group`,
+                           class:`contacto.storage.Entity`]
+        :param other: element to merge, deleted afterwards
+        :type  other: Union[class:`contacto.storage.Group`,
+                            class:`contacto.storage.Entity`]
+        """
+        conn = self.db_conn
+        if isinstance(elem, Group):
+            entities, others = elem.entities, other.entities
+            pairs = [(oent, entities[name]) for name, oent in others.items()
+                     if name in entities]
+        else:
+            pairs = [(other, elem)]
+        # both or neither of merged Entities have Attributes loaded
+        for oent, ent in pairs:
+            if oent._attributes is None and ent._attributes is not None:
+                self.load_attributes(oent)
+            elif ent._attributes is None and oent._attributes is not None:
+                self.load_attributes(ent)
+
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS merge_entity \
+                      (o INTEGER PRIMARY KEY, s INTEGER UNIQUE, \
+                       s_ref BLOB)')
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS merge_attribute \
+                      (o INTEGER PRIMARY KEY, s INTEGER UNIQUE, \
+                       s_ref BLOB, base INTEGER)')
+        try:
+            sql = 'INSERT INTO temp.merge_entity VALUES (?, ?, ?)'
+            conn.executemany(sql, ((o.id, s.id, refid_to_bytes(s.id))
+                                   for o, s in pairs))
+            conn.execute('INSERT INTO temp.merge_attribute \
+                          SELECT o.id, s.id, refid(s.id), \
+                              (SELECT coalesce(max(h.version), 0) \
+                               FROM attribute_history AS h \
+                               WHERE h.attribute_id=s.id) \
+                          FROM temp.merge_entity AS m \
+                          JOIN attribute AS o ON (o.entity_id=m.o) \
+                          JOIN attribute AS s \
+                              ON (s.entity_id=m.s AND s.name=o.name)')
+            # XREFs to redirect, read before the tree changes
+            sql = f'SELECT r.id, g.name, e.name, r.name FROM attribute AS r \
+                    JOIN entity AS e ON (e.id=r.entity_id) \
+                    JOIN "group" AS g ON (g.id=e.group_id) \
+                    WHERE r.ref_id IN (SELECT o FROM temp.{{}}) \
+                        AND r.type={{:d}}'
+            redirects = conn.execute(sql.format('merge_attribute',
+                                                DType.AXREF)).fetchall()
+            redirects += conn.execute(sql.format('merge_entity',
+                                                 DType.EXREF)).fetchall()
+            # moved "thumbnail" Attributes
+            sql = 'SELECT id FROM attribute WHERE name=\'thumbnail\' \
+                   AND entity_id IN (SELECT o FROM temp.merge_entity) \
+                   AND id NOT IN (SELECT o FROM temp.merge_attribute)'
+            touched = {aid for aid, in conn.execute(sql)}
+
+            conn.execute('UPDATE entity SET thumbnail=( \
+                              SELECT o.thumbnail FROM temp.merge_entity AS m \
+                              JOIN entity AS o ON (o.id=m.o) \
+                              WHERE m.s=entity.id) \
+                          WHERE thumbnail IS NULL AND id IN ( \
+                              SELECT m.s FROM temp.merge_entity AS m \
+                              JOIN entity AS o ON (o.id=m.o) \
+                              WHERE o.thumbnail IS NOT NULL)')
+            conn.execute('UPDATE attribute SET (type, data)=( \
+                              SELECT o.type, o.data \
+                              FROM temp.merge_attribute AS m \
+                              JOIN attribute AS o ON (o.id=m.o) \
+                              WHERE m.s=attribute.id) \
+                          WHERE id IN (SELECT s FROM temp.merge_attribute)')
+            for dtype, table in ((DType.AXREF, 'merge_attribute'),
+                                 (DType.EXREF, 'merge_entity')):
+                conn.execute(f'UPDATE attribute SET data=( \
+                                   SELECT s_ref FROM temp.{table} \
+                                   WHERE o=attribute.ref_id) \
+                               WHERE ref_id IN (SELECT o FROM temp.{table}) \
+                                   AND type={dtype:d}')
+            conn.execute('UPDATE attribute_history SET (attribute_id, \
+                              version)=(SELECT s, version+base \
+                                        FROM temp.merge_attribute \
+                                        WHERE o=attribute_id) \
+                          WHERE attribute_id IN \
+                              (SELECT o FROM temp.merge_attribute)')
+            conn.execute('DELETE FROM attribute WHERE id IN \
+                          (SELECT o FROM temp.merge_attribute)')
+            conn.execute('UPDATE attribute SET entity_id=( \
+                              SELECT s FROM temp.merge_entity \
+                              WHERE o=attribute.entity_id) \
+                          WHERE entity_id IN \
+                              (SELECT o FROM temp.merge_entity)')
+            conn.execute('DELETE FROM entity WHERE id IN \
+                          (SELECT o FROM temp.merge_entity)')
+            if isinstance(elem, Group):
+                sql = 'UPDATE entity SET group_id=? WHERE group_id=?'
+                conn.execute(sql, (elem.id, other.id))
+                conn.execute('DELETE FROM "group" WHERE id=?', [other.id])
+
+            merged = {aid for aid, in
+                      conn.execute('SELECT s FROM temp.merge_attribute')}
+            self.__raise_loops(merged)
+            touched |= merged | {aid for aid, *_ in redirects}
+            thumbnails = self.__bulk_thumbnails(touched)
+        finally:
+            conn.execute('DELETE FROM temp.merge_entity')
+            conn.execute('DELETE FROM temp.merge_attribute')
+
+        # merged elements of the other by their counterparts
+        targets = dict(pairs)
+        moved = []
+        for oent, ent in pairs:
+            for name, oattr in (oent._attributes or {}).items():
+                if isinstance(oattr, HistoryAttribute):
+                    continue
+                attr = ent._attributes.get(name)
+                if attr is None or isinstance(attr, HistoryAttribute):
+                    moved.append(oattr)
+                else:
+                    targets[oattr] = attr
+        # loaded Entities that may have a new thumbnail
+        notified = [ent for _, ent in pairs]
+        for _, group_name, entity_name, name in redirects:
+            entity = self.__loaded_entity(group_name, entity_name)
+            attr = entity and (entity._attributes or {}).get(name)
+            if attr is None or isinstance(attr, HistoryAttribute):
+                continue
+            if attr.data in targets:
+                attr.replace(attr.type, targets[attr.data])
+                notified.append(entity)
+        for oattr, attr in targets.items():
+            if isinstance(oattr, Entity):
+                continue
+            data = oattr._data
+            if oattr.type.is_xref():
+                data = targets.get(data, data)
+            attr.replace(oattr.type, data)
+            attr.adopt_history(oattr)
+            oattr.detach()
+        for oattr in moved:
+            ent = targets[oattr.parent]
+            del oattr.parent._attributes[oattr.name]
+            oattr.parent = ent
+            ent._attributes[oattr.name] = oattr
+            for entry in oattr._history:
+                entry.parent = ent
+            oattr.list_history()
+        for oent, ent in pairs:
+            if oent._thumbnail and not ent._thumbnail:
+                ent.thumbnail = oent._thumbnail
+            oent.parent.entities.pop(oent.name, None)
+        if isinstance(elem, Group):
+            for name, oent in other.entities.items():
+                oent.parent = elem
+                elem.entities[name] = oent
+            self.groups.pop(other.name, None)
+        for entity in notified:
+            if entity.id in thumbnails:
+                entity.read()
+
+    def __loaded_entity(self, group_name, name):
+        """Gets an Entity by its refspec if it has been read from DB.
+        """
+        group = (self._groups or {}).get(group_name)
+        return group and (group._entities or {}).get(name)
+
+    def blob_handle(self, digest, bid, size):
+        """Creates a handle to a stored blob, if there is one.
+
+        :param digest: blob hash, None if there is no blob
+        :type  digest: Union[bytes, None]
+        :param bid: blob ID
+        :type  bid: int
+        :param size: data size
+        :type  size: int
+        :return: data handle
+        :rtype:  Union[class:`contacto.helpers.BlobHandle`, None]
+        """
+        if digest is None:
+            return None
+        return BlobHandle(self.db_conn, 'blob', 'data', bid, size, digest)
+
+    def store_blob(self, data):
+        """Stores binary data as a blob shared by content.
+
+        Data are hashed and only written if no blob has the same hash.
+        Blobs are reference-counted by triggers, a blob is deleted once
+        no Attribute or thumbnail holds its hash.
+
+        :param data: binary data or a handle to a stored blob
+        :type  data: Union[bytes, class:`contacto.helpers.BlobHandle`]
+        :raises Exception: the handle refers to a deleted blob
+        :return: handle of the stored blob
+        :rtype:  class:`contacto.helpers.BlobHandle`
+        """
+        sql = 'SELECT id FROM blob WHERE hash=?'
+        if isinstance(data, BlobHandle) and data.conn is self.db_conn:
+            if not self.db_conn.execute(sql, [data.digest]).fetchone():
+                raise Exception('Binary data no longer stored')
+            return data
+        if isinstance(data, BlobHandle):
+            data = data.read()
+        digest = blob_digest(data)
+        row = self.db_conn.execute(sql, [digest]).fetchone()
+        if row:
+            bid, = row
+        else:
+            sql = 'INSERT INTO blob (hash, data) VALUES (?, ?)'
+            bid = self.db_conn.execute(sql, (digest, data)).lastrowid
+        return self.blob_handle(digest, bid, len(data))
+
+    def is_image(self, data):
+        """Checks if binary data are an image, see `helpers.validate_img`.
+
+        Each distinct blob is validated once. Results are cached by hash,
+        in memory and in the "image" column of stored blobs.
+
+        :param data: binary data or a handle to a stored blob
+        :type  data: Union[bytes, class:`contacto.helpers.BlobHandle`]
+        :return: true if data is an image
+        :rtype:  bool
+        """
+        handle = isinstance(data, BlobHandle)
+        digest = data.digest if handle else blob_digest(data)
+        if digest in self.images:
+            return self.images[digest]
+        sql = 'SELECT image FROM blob WHERE hash=?'
+        row = self.db_conn.execute(sql, [digest]).fetchone()
+        if row and row[0] is not None:
+            valid = bool(row[0])
+        else:
+            valid = validate_img(data.read() if handle else data)
+            sql = 'UPDATE blob SET image=? WHERE hash=?'
+            self.db_conn.execute(sql, (valid, digest))
+        self.images[digest] = valid
+        return valid
+
+    def defer_thumbnails(self, on):
+        """Turns deferred thumbnail updates ON or OFF.
+
+        While ON, Entities only note that their "thumbnail" Attribute may
+        have changed, so an Entity is validated once however many times
+        it is touched. Call `validate_thumbnails` before committing,
+        turning it OFF drops the Entities not validated yet.
+
+        :param on: deferred mode
+        :type  on: bool
+        """
+        self.thumbs_pending = set() if on else None
+
+    def validate_thumbnails(self):
+        """Updates thumbnails of the Entities noted in deferred mode.
+
+        Entities deleted since are skipped, see `defer_thumbnails`.
+        Not transactional, nothing is committed here.
+        """
+        pending = self.thumbs_pending or ()
+        for eid in sorted(pending):
+            entity = self.elem_from_refid(DType.EXREF, eid)
+            if entity:
+                entity.thumbnail_from_attr(now=True)
+        if self.thumbs_pending is not None:
+            self.thumbs_pending = set()
+
+    def make_variants(self, digests=None, workers=None):
+        """Makes missing downscaled variants of Entity thumbnails.
+
+        Variants of each thumbnail blob are kept in the thumbnail_variant
+        table, see `contacto.helpers.downscale_img`. Blobs that turn out
+        not to be images are marked so and skipped afterwards.
+        Many blobs are downscaled in a pool of worker processes.
+        Not transactional, nothing is committed here.
+
+        :param digests: thumbnail blob hashes, all thumbnails if None
+        :type  digests: Iterable, optional
+        :param workers: number of worker processes, 0 to use none,
+                        the number of CPUs if None
+        :type  workers: int, optional
+        :return: number of blobs downscaled
+        :rtype:  int
+        """
+        sql = 'SELECT hash FROM blob AS b WHERE image IS NOT 0 \
+               AND EXISTS (SELECT 1 FROM entity WHERE thumbnail=b.hash) \
+               AND NOT EXISTS (SELECT 1 FROM thumbnail_variant \
+                               WHERE hash=b.hash)'
+        if digests is None:
+            todo = [digest for digest, in self.db_conn.execute(sql)]
+        else:
+            todo = []
+            sql += ' AND hash IN ({})'
+            for chunk in _chunks(list(digests)):
+                marks = ','.join('?' * len(chunk))
+                todo.extend(digest for digest, in self.db_conn.execute(
+                    sql.format(marks), chunk))
+        if not todo:
+            return 0
+
+        pool = None
+        if workers != 0 and len(todo) >= VARIANT_POOL_MIN:
+            # imported on use, most commands make a variant or none
+            import concurrent.futures
+            workers = workers or os.cpu_count() or 1
+            pool = concurrent.futures.ProcessPoolExecutor(workers)
+        try:
+            sql = 'SELECT data FROM blob WHERE hash=?'
+            # read a few blobs per worker at once, images may be big
+            for chunk in _chunks(todo, 4 * (workers if pool else 1)):
+                blobs = [self.db_conn.execute(sql, [digest]).fetchone()[0]
+                         for digest in chunk]
+                results = pool.map(downscale_img, blobs) if pool else \
+                    map(downscale_img, blobs)
+                for digest, variants in zip(chunk, results):
+                    self.__store_variants(digest, variants)
+        finally:
+            if pool:
+                pool.shutdown()
+        return len(todo)
+
+    def make_pending_variants(self, workers=None):
+        """Makes downscaled variants of thumbnails set since the last call.
+
+        Entity updates only note their thumbnails, so that writes do not
+        wait for downscaling. Call this once the writes are committed,
+        thumbnails rolled back since are skipped.
+        Not transactional, nothing is committed here.
+
+        :param workers: number of worker processes, see `make_variants`
+        :type  workers: int, optional
+        :return: number of blobs downscaled
+        :rtype:  int
+        """
+        digests, self.variants_pending = self.variants_pending, set()
+        if not digests:
+            return 0
+        return self.make_variants(sorted(digests), workers)
+
+    def __store_variants(self, digest, variants):
+        """Stores variants of a blob, marks the blob as (not) an image.
+        """
+        sql = 'INSERT OR REPLACE INTO thumbnail_variant \
+               (hash, size, format, data) VALUES (?, ?, ?, ?)'
+        self.db_conn.executemany(sql, ((digest, *variant)
+                                       for variant in variants or ()))
+        sql = 'UPDATE blob SET image=? WHERE hash=? AND image IS NOT ?'
+        image = variants is not None
+        self.db_conn.execute(sql, (image, digest, image))
+        self.images[digest] = image
+
+    def thumbnail_variant(self, digest, size):
+        """Gets the smallest downscaled variant of a thumbnail blob
+        fitting a bounding box size or bigger, see `make_variants`.
+
+        :param digest: thumbnail blob hash
+        :type  digest: bytes
+        :param size: bounding box size (px)
+        :type  size: int
+        :return: variant image data, None if there is none
+        :rtype:  Union[bytes, None]
+        """
+        sql = 'SELECT data FROM thumbnail_variant \
+               WHERE hash=? AND size>=? ORDER BY size LIMIT 1'
+        row = self.db_conn.execute(sql, (digest, size)).fetchone()
+        return row and row[0]
+
+    def blob_stats(self):
+        """Summarizes binary data storage and space saved by sharing blobs.
+
+        :return: blob count, reference count, stored, referenced
+                 and saved bytes
+        :rtype:  dict
+        """
+        sql = 'SELECT count(*), total(refcount), total(length(data)), \
+                      total(refcount * length(data)) FROM blob'
+        blobs, refs, stored, referenced = \
+            self.db_conn.execute(sql).fetchone()
+        return {
+            'blobs': blobs,
+            'references': int(refs),
+            'stored': int(stored),
+            'referenced': int(referenced),
+            'saved': int(referenced - stored)
+        }
+
+    def changes(self, since=0):
+        """Generates changes logged after a sequence number, oldest first.
+
+        Changes are logged by DB triggers: "I"nserts, "U"pdates and
+        "D"eletes of tree elements, with the element's refspec at the time
+        of the change. Renaming an element logs the element only.
+        Deleting one (see `delete_tree`) logs its children and the XREFs
+        deleted along, before the element itself. History of a deleted
+        Attribute is kept as Attributes, logged as inserts. Only rows removed
+        by a DB cascade (e.g. plain SQL deleting a Group) are not logged.
+
+        :param since: sequence number of the last seen change
+        :type  since: int, optional
+        :return: sequence number, operation, element scope, ID, refspec
+        :rtype:  generator
+        """
+        sql = 'SELECT seq, op, scope, elem_id, refspec FROM change_log \
+               WHERE seq > ? ORDER BY seq'
+        for seq, op, scope, eid, rspec in self.db_conn.execute(sql, [since]):
+            yield seq, op, Scope(scope), eid, rspec
+
+    def last_change(self):
+        """Sequence number of the last logged change, 0 if there is none.
+
+        :return: sequence number
+        :rtype:  int
+        """
+        sql = 'SELECT max(seq) FROM change_log'
+        return self.db_conn.execute(sql).fetchone()[0] or 0
+
+    def attrdata_from_row(self, dtype, data, bid, size):
+        """Parses Attribute data read using ATTR_DATA_COLS.
+
+        Binary data is not read but referenced by a handle.
+        XREFs are parsed into target IDs.
+
+        :param dtype: data type
+        :type  dtype: class:`contacto.helpers.DType`
+        :param data: packed data (blob hash for binary data)
+        :type  data: bytes
+        :param bid: blob ID (binary data only)
+        :type  bid: Union[int, None]
+        :param size: blob size (binary data only)
+        :type  size: Union[int, None]
+        :return: parsed attribute data
+        :rtype:  Union[class:`contacto.helpers.BlobHandle`, str, int]
+        """
+        if dtype is DType.BIN:
+            return self.blob_handle(data, bid, size)
+        return bytes_to_attrdata(dtype, data)
 
     def get_group(self, name):
         """Gets a Group by its name.
@@ -657,6 +1811,275 @@ class Storage:
         script = pkgutil.get_data(__name__, DML_SCRIPT).decode('utf-8')
         self.db_cur.executescript(script)
         self.db_conn.commit()
+        self.migrate()
+        self.fts = self.create_fts()
+
+    def migrate(self):
+        """Upgrades DB data created by an older version of Contacto.
+
+        The DB schema version is kept in the "user_version" pragma.
+        Version 1 moves binary data into shared blobs,
+        version 2 indexes XREF targets,
+        version 3 caches image validation of blobs.
+        """
+        version, = self.db_cur.execute('PRAGMA user_version').fetchone()
+        if version >= SCHEMA_VERSION:
+            return
+        with self.db_conn:
+            if version < 1:
+                self.__migrate_blobs()
+            if version < 2:
+                self.__migrate_refs()
+            if version < 3:
+                self.__migrate_images()
+            self.db_cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION:d}")
+
+    def __migrate_blobs(self):
+        """Replaces binary data and thumbnails with hashes of shared blobs.
+
+        Blob reference counts are set by the triggers.
+        """
+        self.db_conn.create_function('blob_digest', 1, blob_digest,
+                                     **DETERMINISTIC)
+        self.db_cur.execute(f'INSERT OR IGNORE INTO blob (hash, data) \
+                              SELECT blob_digest(data), data FROM attribute \
+                              WHERE type={DType.BIN:d}')
+        self.db_cur.execute(f'UPDATE attribute SET data=blob_digest(data) \
+                              WHERE type={DType.BIN:d}')
+        self.db_cur.execute('INSERT OR IGNORE INTO blob (hash, data) \
+                             SELECT blob_digest(thumbnail), thumbnail \
+                             FROM entity WHERE thumbnail IS NOT NULL')
+        self.db_cur.execute('UPDATE entity \
+                             SET thumbnail=blob_digest(thumbnail) \
+                             WHERE thumbnail IS NOT NULL')
+
+    def __migrate_refs(self):
+        """Adds the XREF target ID column ref_id and its index.
+
+        The column is set from the attribute data of existing XREFs
+        and kept up to date by triggers.
+        """
+        xrefs = f'({DType.AXREF:d}, {DType.EXREF:d})'
+        cols = self.db_cur.execute('PRAGMA table_info(attribute)')
+        if 'ref_id' not in {col[1] for col in cols}:
+            self.db_cur.execute('ALTER TABLE attribute \
+                                 ADD COLUMN ref_id INTEGER')
+            self.db_cur.execute(f'UPDATE attribute SET ref_id={REF_ID_EXPR} \
+                                  WHERE type IN {xrefs}')
+        self.db_cur.execute(f'CREATE TRIGGER IF NOT EXISTS \
+                              attribute_ref_insert \
+                              AFTER INSERT ON attribute \
+                              WHEN new.type IN {xrefs} BEGIN \
+                                  UPDATE attribute SET ref_id={REF_ID_EXPR} \
+                                  WHERE id=new.id; \
+                              END')
+        self.db_cur.execute(f'CREATE TRIGGER IF NOT EXISTS \
+                              attribute_ref_update \
+                              AFTER UPDATE OF type, data ON attribute \
+                              WHEN new.type IN {xrefs} \
+                                  OR old.type IN {xrefs} BEGIN \
+                                  UPDATE attribute SET ref_id=CASE \
+                                      WHEN type IN {xrefs} \
+                                      THEN {REF_ID_EXPR} END \
+                                  WHERE id=new.id; \
+                              END')
+        self.db_cur.execute('CREATE INDEX IF NOT EXISTS attribute_ref \
+                             ON attribute(ref_id, type) \
+                             WHERE ref_id IS NOT NULL')
+        self.db_cur.execute('DROP INDEX IF EXISTS attribute_axref')
+        self.db_cur.execute('DROP INDEX IF EXISTS attribute_exref')
+
+    def __migrate_images(self):
+        """Adds the blob column image, caching `is_image` results.
+
+        It is NULL until the blob is validated, then 1 for images, 0 else.
+        """
+        cols = self.db_cur.execute('PRAGMA table_info(blob)')
+        if 'image' not in {col[1] for col in cols}:
+            self.db_cur.execute('ALTER TABLE blob ADD COLUMN image INTEGER')
+
+    def create_fts(self):
+        """Creates the full-text index over TEXT Attribute values.
+
+        The index is optional, it requires SQLite with the FTS5 extension
+        and its trigram tokenizer (SQLite 3.34+).
+        It is kept in sync with the attribute table by triggers.
+
+        :return: True if the index is available
+        :rtype:  bool
+        """
+        sql = 'SELECT 1 FROM sqlite_master WHERE name=?'
+        if self.db_cur.execute(sql, ['attribute_fts']).fetchone():
+            return True
+        script = pkgutil.get_data(__name__, FTS_SCRIPT).decode('utf-8')
+        try:
+            self.db_cur.executescript(f"BEGIN;{script}COMMIT;")
+        except sqlite3.OperationalError:
+            self.db_conn.rollback()
+            return False
+        return True
+
+    def match_attribute_ids(self, needle, fuzzy):
+        """Finds Attributes resolving to a TEXT value matching a needle.
+
+        Matches have the same semantics as in
+        `contacto.view.View.set_attr_value_filter`, EXREFs resolve to
+        their target's refspec and AXREFs resolving to a match match too.
+
+        Fuzzy search is answered by the full-text index where possible
+        (it requires an ASCII needle of at least 3 characters).
+        Otherwise TEXT values are scanned.
+
+        :param needle: search needle
+        :type  needle: str
+        :param fuzzy: use fuzzy search for the needle
+        :type  fuzzy: bool
+        :return: matching Attribute IDs
+        :rtype:  set
+        """
+        def match(val):
+            return fmatch(needle, val) if fuzzy else needle == val
+
+        # the index folds case character by character, casefold() may
+        # change the length of non-ASCII text (e.g. "ß" folds to "ss")
+        ascii_needle = len(needle.encode()) == len(needle)
+        if fuzzy and (not self.fts or len(needle) < 3 or not ascii_needle):
+            sql = 'SELECT id FROM attribute \
+                   WHERE type=? AND fmatch(?, CAST(data AS TEXT))'
+            rows = self.db_conn.execute(sql, (DType.TEXT, needle))
+            ids = {aid for aid, in rows}
+        elif self.fts and len(needle) >= 3:
+            # candidates, the index case folding differs from casefold()
+            sql = 'SELECT a.id, a.data FROM attribute_fts AS f \
+                   JOIN attribute AS a ON (a.id=f.rowid) \
+                   WHERE attribute_fts MATCH ?'
+            phrase = '"{}"'.format(needle.replace('"', '""'))
+            rows = self.db_conn.execute(sql, [phrase])
+            ids = {aid for aid, val in rows if match(val.decode('utf-8'))}
+            if fuzzy:
+                # non-ASCII values (more bytes than characters) may match
+                # only after casefold(), they are scanned
+                sql = 'SELECT id FROM attribute WHERE type=? \
+                       AND length(data) <> length(CAST(data AS TEXT)) \
+                       AND fmatch(?, CAST(data AS TEXT))'
+                rows = self.db_conn.execute(sql, (DType.TEXT, needle))
+                ids.update(aid for aid, in rows)
+        else:
+            sql = 'SELECT id FROM attribute WHERE type=? AND data=?'
+            rows = self.db_conn.execute(sql, (DType.TEXT, needle.encode()))
+            ids = {aid for aid, in rows}
+
+        # entity references resolve to refspecs
+        ids.update(aid for aid, rspec in self.exref_refspecs()
+                   if match(rspec))
+        return ids | self.axref_closure(ids)
+
+    def match_history_ids(self, needle, fuzzy):
+        """Finds Attribute history entries with a TEXT value matching
+        a needle.
+
+        Matches have the same semantics as in `match_attribute_ids`,
+        history entries hold resolved values, not XREFs.
+        Their values are scanned.
+
+        :param needle: search needle
+        :type  needle: str
+        :param fuzzy: use fuzzy search for the needle
+        :type  fuzzy: bool
+        :return: matching history entry IDs (rows of attribute_history)
+        :rtype:  set
+        """
+        if fuzzy:
+            sql = 'SELECT id FROM attribute_history \
+                   WHERE type=? AND fmatch(?, CAST(data AS TEXT))'
+            params = (DType.TEXT, needle)
+        else:
+            sql = 'SELECT id FROM attribute_history WHERE type=? AND data=?'
+            params = (DType.TEXT, needle.encode())
+        return {hid for hid, in self.db_conn.execute(sql, params)}
+
+    def exref_refspecs(self):
+        """Lists all EXREF Attributes with their target refspecs.
+
+        :return: EXREF Attribute IDs and target refspecs
+        :rtype:  list
+        """
+        sql = f'SELECT a.id, g.name, e.name FROM attribute AS a \
+                JOIN entity AS e ON (e.id=a.ref_id) \
+                JOIN "group" AS g ON (g.id=e.group_id) \
+                WHERE a.type={DType.EXREF:d}'
+        return [(aid, f"{gname}/{ename}") for aid, gname, ename
+                in self.db_conn.execute(sql)]
+
+    def axref_closure(self, ids):
+        """Finds AXREF Attributes transitively referencing given Attributes.
+
+        :param ids: referenced Attribute IDs
+        :type  ids: Iterable
+        :return: referencing Attribute IDs
+        :rtype:  set
+        """
+        found = set()
+        frontier = set(ids)
+        sql = f'SELECT id FROM attribute WHERE ref_id IN ({{}}) \
+                AND type={DType.AXREF:d}'
+        while frontier:
+            nxt = set()
+            for chunk in _chunks(list(frontier)):
+                marks = ','.join('?' * len(chunk))
+                rows = self.db_conn.execute(sql.format(marks), chunk)
+                nxt.update(aid for aid, in rows)
+            frontier = nxt - found
+            found |= frontier
+        return found
+
+    def backlinks(self, elem, transitive=False):
+        """Lists XREF Attributes referencing an Entity or an Attribute.
+
+        Answered by the XREF target index, the tree is not loaded.
+
+        :param elem: referenced element
+        :type  elem: Union[class:`contacto.storage.Entity`,
+                           class:`contacto.storage.Attribute`]
+        :param transitive: include AXREFs referencing the referrers,
+                           recursively
+        :type  transitive: bool
+        :return: sorted refspecs of referencing Attributes
+        :rtype:  list
+        """
+        dtype = DType.EXREF if isinstance(elem, Entity) else DType.AXREF
+        chain = ''
+        if transitive:
+            chain = f'UNION SELECT r.id FROM refs \
+                      JOIN attribute AS r ON (r.ref_id=refs.id \
+                          AND r.type={DType.AXREF:d})'
+        sql = f'WITH RECURSIVE refs(id) AS ( \
+                    SELECT id FROM attribute \
+                    WHERE ref_id=? AND type={dtype:d} {chain}) \
+                SELECT g.name, e.name, a.name FROM refs \
+                JOIN attribute AS a ON (a.id=refs.id) \
+                JOIN entity AS e ON (e.id=a.entity_id) \
+                JOIN "group" AS g ON (g.id=e.group_id)'
+        rows = self.db_conn.execute(sql, [elem.id])
+        return sorted('/'.join(row) for row in rows)
+
+    def attribute_tree(self, ids):
+        """Names of Attributes arranged in a tree.
+
+        :param ids: Attribute IDs
+        :type  ids: Iterable
+        :return: Group name -> Entity name -> set of Attribute names
+        :rtype:  dict
+        """
+        tree = {}
+        sql = 'SELECT g.name, e.name, a.name FROM attribute AS a \
+               JOIN entity AS e ON (e.id=a.entity_id) \
+               JOIN "group" AS g ON (g.id=e.group_id) WHERE a.id IN ({})'
+        for chunk in _chunks(list(ids)):
+            marks = ','.join('?' * len(chunk))
+            for g, e, a in self.db_conn.execute(sql.format(marks), chunk):
+                tree.setdefault(g, {}).setdefault(e, set()).add(a)
+        return tree
 
     def create_group(self, name):
         """Creates a new Group.
@@ -685,6 +2108,252 @@ class Storage:
             print_error(e)
             return None
 
+    def bulk_import(self, rows, thumbnails=None):
+        """Imports many tree elements at once, creating or updating them.
+
+        Rows are (group, entity, attribute, type, data) tuples, trailing
+        members may be None to create bare Groups or Entities.
+        XREF data are parsed refspecs and may point to elements imported
+        later in the same batch.
+        Entity thumbnails may be set as well, "thumbnail" Attributes
+        still take precedence.
+
+        Rows are written in batches, XREFs are resolved in a single pass
+        after all data is written. Loop detection and thumbnail updates
+        run once at the end, then the tree is read again.
+        Wrap the import in a transaction, nothing is committed here.
+
+        :param rows: imported rows
+        :type  rows: Iterable
+        :param thumbnails: (group, entity) -> thumbnail data
+        :type  thumbnails: dict, optional
+        :raises Exception: bad data, unresolved REF or REF loop
+        :return: number of imported Attributes
+        :rtype:  int
+        """
+        groups, entities, attributes, xrefs, blobs = {}, {}, {}, {}, {}
+
+        def blob(data):
+            digest = blob_digest(data)
+            blobs[digest] = data
+            return digest
+
+        for gname, ename, aname, dtype, data in rows:
+            groups[check_name(gname)] = None
+            if ename is None:
+                continue
+            entities[gname, check_name(ename)] = None
+            if aname is None:
+                continue
+            key = gname, ename, check_name(aname)
+            if dtype is None:
+                raise Exception(f"Bad value of {'/'.join(key)}")
+            if dtype.is_xref():
+                # XREFs may not resolve yet, save a dangling ID for now
+                xrefs[key] = dtype, data
+                attributes[key] = dtype, refid_to_bytes(0)
+            elif dtype is DType.BIN:
+                xrefs.pop(key, None)
+                attributes[key] = dtype, blob(data)
+            else:
+                xrefs.pop(key, None)
+                attributes[key] = dtype, attrdata_to_bytes(dtype, data)
+        thumbnails = {key: blob(thumb)
+                      for key, thumb in (thumbnails or {}).items()}
+
+        conn = self.db_conn
+        sql = 'INSERT OR IGNORE INTO blob (hash, data) VALUES (?, ?)'
+        conn.executemany(sql, blobs.items())
+        digests = list(blobs)
+        blobs.clear()
+        sql = 'INSERT OR IGNORE INTO "group" (name) VALUES (?)'
+        conn.executemany(sql, ((gname,) for gname in groups))
+        sql = 'SELECT name, id FROM "group"'
+        gids = {gname: gid for gname, gid in conn.execute(sql)
+                if gname in groups}
+
+        sql = 'INSERT OR IGNORE INTO entity (name, group_id) VALUES (?, ?)'
+        conn.executemany(sql, ((ename, gids[gname])
+                               for gname, ename in entities))
+        eids = {}
+        sql = 'SELECT group_id, name, id FROM entity WHERE group_id IN ({})'
+        names = {gid: gname for gname, gid in gids.items()}
+        for chunk in _chunks(list(names)):
+            marks = ','.join('?' * len(chunk))
+            for gid, ename, eid in conn.execute(sql.format(marks), chunk):
+                if (names[gid], ename) in entities:
+                    eids[names[gid], ename] = eid
+
+        sql = 'UPDATE entity SET thumbnail=? WHERE id=?'
+        conn.executemany(sql, ((thumb, eids[key]) for key, thumb
+                               in thumbnails.items()))
+
+        self.__skip_history(attributes, eids)
+        # updated attributes keep their IDs, XREFs to them stay valid
+        sql = 'UPDATE attribute SET type=?, data=? \
+               WHERE entity_id=? AND name=?'
+        conn.executemany(sql, ((dtype, data, eids[gname, ename], aname)
+                               for (gname, ename, aname), (dtype, data)
+                               in attributes.items()))
+        sql = 'INSERT OR IGNORE INTO attribute (name, type, data, entity_id) \
+               VALUES (?, ?, ?, ?)'
+        conn.executemany(sql, ((aname, dtype, data, eids[gname, ename])
+                               for (gname, ename, aname), (dtype, data)
+                               in attributes.items()))
+        aids = {}
+        sql = 'SELECT entity_id, name, id FROM attribute \
+               WHERE entity_id IN ({})'
+        names = {eid: key for key, eid in eids.items()}
+        for chunk in _chunks(list(names)):
+            marks = ','.join('?' * len(chunk))
+            for eid, aname, aid in conn.execute(sql.format(marks), chunk):
+                if (*names[eid], aname) in attributes:
+                    aids[(*names[eid], aname)] = aid
+
+        self.__bulk_xrefs({aids[key]: ref for key, ref in xrefs.items()})
+        imported = set(aids.values())
+        self.__raise_loops(imported)
+        self.__bulk_thumbnails(imported)
+        self.make_variants(digests)
+        self.reload()
+        return len(imported)
+
+    def __skip_history(self, attributes, eids):
+        """Drops imported "A_1", "A_2", ... Attributes equal to the history
+        entries listed under their names, as exported.
+
+        Importing an export again then leaves the history alone instead of
+        adding its entries as Attributes, to be rotated into it again.
+        Attributes of such names stored in the DB are updated as usual.
+        """
+        sql = f'SELECT v.entity_id, v.name, v.type, v.data FROM ( \
+                    SELECT a.entity_id, {HISTORY_NAME} AS name, \
+                        h.type, h.data FROM attribute_history AS h \
+                    JOIN attribute AS a ON (a.id=h.attribute_id) \
+                    WHERE a.entity_id IN ({{}})) AS v \
+                LEFT JOIN attribute AS r \
+                    ON (r.entity_id=v.entity_id AND r.name=v.name) \
+                WHERE r.id IS NULL'
+        names = {eid: key for key, eid in eids.items()}
+        for chunk in _chunks(list(names)):
+            marks = ','.join('?' * len(chunk))
+            for eid, aname, dtype, data in \
+                    self.db_conn.execute(sql.format(marks), chunk):
+                key = (*names[eid], aname)
+                if attributes.get(key) == (dtype, data):
+                    del attributes[key]
+
+    def __bulk_xrefs(self, xrefs):
+        """Resolves imported XREFs to target IDs using a single query.
+        """
+        conn = self.db_conn
+        conn.execute('CREATE TEMP TABLE import_xref \
+                      (id INTEGER, type INTEGER, g TEXT, e TEXT, a TEXT)')
+        try:
+            sql = 'INSERT INTO temp.import_xref VALUES (?, ?, ?, ?, ?)'
+            conn.executemany(sql, ((aid, dtype, *p_rspec) for aid,
+                                   (dtype, p_rspec) in xrefs.items()))
+            sql = f'SELECT x.id, x.type, x.g, x.e, x.a, \
+                        CASE x.type WHEN {DType.EXREF:d} THEN e.id \
+                        ELSE a.id END \
+                    FROM temp.import_xref AS x \
+                    LEFT JOIN "group" AS g ON (g.name=x.g) \
+                    LEFT JOIN entity AS e ON (e.group_id=g.id AND e.name=x.e) \
+                    LEFT JOIN attribute AS a \
+                        ON (a.entity_id=e.id AND a.name=x.a)'
+            resolved = []
+            for aid, dtype, g, e, a, target in conn.execute(sql):
+                if target is None:
+                    rspec = '/'.join(n for n in (g, e, a) if n is not None)
+                    raise Exception(f"REF target {rspec} not found")
+                resolved.append((dtype, refid_to_bytes(target), aid))
+        finally:
+            conn.execute('DROP TABLE temp.import_xref')
+        sql = 'UPDATE attribute SET type=?, data=? WHERE id=?'
+        conn.executemany(sql, resolved)
+
+    def __axref_graph(self):
+        """Reads all AXREFs as a referrer ID -> target ID dictionary.
+        """
+        sql = f'SELECT id, ref_id FROM attribute \
+                WHERE ref_id IS NOT NULL AND type={DType.AXREF:d}'
+        return dict(self.db_conn.execute(sql))
+
+    def check_loops(self, ids=None):
+        """Finds all REF loops in the DB.
+
+        Each Attribute has at most one AXREF target, so the reference graph
+        is walked once, each chain ending at a loop, a non-AXREF Attribute
+        or a chain walked before.
+
+        :param ids: only find loops reachable from these Attribute IDs
+        :type  ids: Iterable, optional
+        :return: sorted refspecs of all Attributes forming loops
+        :rtype:  list
+        """
+        graph = self.__axref_graph()
+        done = set()
+        looped = []
+        for aid in graph if ids is None else ids:
+            path = {}
+            while aid in graph and aid not in done:
+                if aid in path:
+                    # the loop is the rest of the path
+                    looped.extend(list(path)[path[aid]:])
+                    break
+                path[aid] = len(path)
+                aid = graph[aid]
+            done.update(path)
+        return sorted(self.__attr_refspec(aid) for aid in looped)
+
+    def __raise_loops(self, ids=None):
+        """Raises if there are REF loops in the DB, see `check_loops`.
+
+        :param ids: only find loops reachable from these Attribute IDs
+        :type  ids: Iterable, optional
+        :raises Exception: all Attributes forming loops are reported
+        """
+        looped = self.check_loops(ids)
+        if looped:
+            raise Exception(f"REF loop detected at {', '.join(looped)}")
+
+    def __bulk_thumbnails(self, ids):
+        """Updates thumbnails of Entities whose "thumbnail" Attribute
+        resolves through any of the given Attributes.
+
+        :return: IDs of updated Entities
+        :rtype:  set
+        """
+        graph = self.__axref_graph()
+        conn = self.db_conn
+        updated = set()
+        sql = 'SELECT id, entity_id FROM attribute WHERE name=?'
+        for aid, eid in conn.execute(sql, ['thumbnail']).fetchall():
+            touched = aid in ids
+            while aid in graph:
+                aid = graph[aid]
+                touched |= aid in ids
+            if not touched:
+                continue
+            sql = f'SELECT a.type, {ATTR_DATA_COLS} FROM attribute AS a \
+                    {ATTR_BLOB_JOIN} WHERE a.id=?'
+            dtype, digest, *blob = conn.execute(sql, [aid]).fetchone()
+            if dtype == DType.BIN and \
+                    self.is_image(self.blob_handle(digest, *blob)):
+                sql = 'UPDATE entity SET thumbnail=? \
+                       WHERE id=? AND thumbnail IS NOT ?'
+                if conn.execute(sql, (digest, eid, digest)).rowcount:
+                    updated.add(eid)
+        return updated
+
+    def __attr_refspec(self, aid):
+        """Refspec of an Attribute read from the DB.
+        """
+        sql = 'SELECT g.name, e.name, a.name FROM attribute AS a \
+               JOIN entity AS e ON (e.id=a.entity_id) \
+               JOIN "group" AS g ON (g.id=e.group_id) WHERE a.id=?'
+        return '/'.join(self.db_conn.execute(sql, [aid]).fetchone())
+
     def get_from_rspec(self, p_rspec):
         """Gets a tree element from a parsed refspec.
         Parsed refspec is a triplet of None|element names scoping the tree.
@@ -722,10 +2391,58 @@ class Storage:
         if dtype == DType.EXREF:
             sql = 'SELECT g.name, e.name FROM entity as e \
                    LEFT JOIN "group" as g ON (g.id=e.group_id) WHERE e.id=?'
-            self.db_cur.execute(sql, [elem_id])
-            return self.get_entity(*self.db_cur.fetchone())
+            row = self.db_conn.execute(sql, [elem_id]).fetchone()
+            return row and self.get_entity(*row)
         sql = 'SELECT g.name, e.name, a.name FROM attribute as a \
                LEFT JOIN entity as e ON (e.id=a.entity_id) \
                LEFT JOIN "group" as g ON (g.id=e.group_id) WHERE a.id=?'
-        self.db_cur.execute(sql, [elem_id])
-        return self.get_attribute(*self.db_cur.fetchone())
+        row = self.db_conn.execute(sql, [elem_id]).fetchone()
+        return row and self.get_attribute(*row)
+
+
+def _check_ref_target(dtype, data):
+    """Raises if an AXREF would target a history entry.
+    """
+    if dtype is DType.AXREF and isinstance(data, HistoryAttribute):
+        raise Exception(f"History entry {data} cannot be referenced")
+
+
+def check_name(name):
+    """Validates a tree element name.
+
+    :param name: element name
+    :type  name: str
+    :raises Exception: the name is not a valid element name
+    :return: the validated name
+    :rtype:  str
+    """
+    if type(name) is not str or name == '':
+        raise Exception("Name must be a non-empty string")
+    if '/' in name:
+        raise Exception("Illegal character '/' in name")
+    return name
+
+
+def _chunks(seq, size=MAX_PARAMS):
+    """Splits a sequence into chunks (used to bind long lists of values).
+    """
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _loaded_attributes(elem):
+    """Lists Attributes of a subtree that have been read from DB.
+    """
+    if isinstance(elem, Attribute):
+        return [elem]
+    entities = [elem] if isinstance(elem, Entity) else \
+        (elem._entities or {}).values()
+    return [attr for entity in entities
+            for attr in (entity._attributes or {}).values()
+            if not isinstance(attr, HistoryAttribute)]
+
+
+def _sql_fmatch(needle, haystack):
+    """fmatch() exposed to SQL, NULL never matches.
+    """
+    return haystack is not None and fmatch(needle, haystack)
@@ -4,8 +4,10 @@ It creates induced subgraphs from the tree by filtering out elements.
 These subgraphs may then be viewed as search results.
 """
 import copy
-from .helpers import DType, fmatch
-from .storage import Group, Entity, Attribute
+from .storage import HISTORY_NAME
+
+# history entries (attribute_history AS h) of an Attribute, named by age
+HISTORY_JOIN = 'JOIN attribute_history AS h ON (h.attribute_id=a.id)'
 
 
 class View:
@@ -16,11 +18,16 @@ class View:
     to contexts that do not modify the tree, such as serialization.
 
     To filter the tree, set your filters first using the provided methods.
+
+    Index, name and value filters are compiled into a single SQL query
+    so only the matching part of the tree is visited (and loaded by a lazy
+    Storage). Custom value predicates are evaluated in Python afterwards.
     """
 
     def __init__(self, storage):
         """Initialize with a storage containing the full tree
         """
+        self.storage = storage
         self.source = storage.groups
         self.reset()
 
@@ -30,7 +37,10 @@ class View:
         Also discards any set filters.
         """
         self.index_filters = [None, None, None]
+        self.name_filters = [[], [], []]
+        self.value_filters = []
         self.value_predicates = [None, None, None]
+        self.since = None
         self.groups = self.source
 
     def empty(self):
@@ -40,7 +50,10 @@ class View:
         :rtype:  bool
         """
         return self.index_filters == [None, None, None] and \
-            self.value_predicates == [None, None, None]
+            self.name_filters == [[], [], []] and \
+            not self.value_filters and \
+            self.value_predicates == [None, None, None] and \
+            self.since is None
 
     def set_index_filters(self, filters):
         """Sets string needles that match exactly on an element's name.
@@ -59,16 +72,14 @@ class View:
         This means a case-insensitive substring search.
         Example: "abc" matches an element named "zAbcDeF"
 
+        May be called multiple times, stacked filters are joined with AND.
+
         :param filters: parsed generic refspec (G/E/A)
         :type filters:  tuple
         """
-        def sel(filt):
+        for needles, filt in zip(self.name_filters, filters):
             if filt:
-                return lambda x: fmatch(filt, x.name)
-            return None
-
-        preds = [sel(filt) for filt in filters]
-        self.set_value_predicates(preds)
+                needles.append(filt)
 
     def set_attr_value_filter(self, needle, fuzzy):
         """Sets a string needle that matches on a TEXT Attribute's value.
@@ -77,6 +88,8 @@ class View:
         May be specified both as exact and fuzzy search.
         An empty string is not considered a valid value filter.
 
+        XREFs match on the value they resolve to.
+
         :param needle: search needle
         :type needle:  str
         :param fuzzy: use fuzzy search for the needle
@@ -84,16 +97,19 @@ class View:
         """
         if not needle:
             return
+        self.value_filters.append((needle, fuzzy))
+
+    def set_change_filter(self, since):
+        """Matches elements changed after a change log sequence number.
 
-        def pred(x):
-            dtype, val = x.get()
-            if dtype is not DType.TEXT:
-                return False
-            if fuzzy:
-                return fmatch(needle, val)
-            return needle == val
+        A changed Group or Entity matches with all of its children,
+        a changed Attribute matches alone. Deleted elements do not match,
+        see `contacto.storage.Storage.changes`.
 
-        self.set_value_predicates((None, None, pred))
+        :param since: sequence number of the last seen change
+        :type  since: int
+        """
+        self.since = since
 
     def set_value_predicates(self, preds):
         """Sets generic predicates that determine if an element is matched.
@@ -102,6 +118,8 @@ class View:
         This method may be called multiple times to stack multiple predicates
         on a single element. Stacked predicates are joined with logical AND.
 
+        These are evaluated in Python on elements the other filters matched.
+
         Example predicates:
 
         `L(attr): attr is binary`
@@ -121,62 +139,136 @@ class View:
             for new_p, old_p in zip(preds, self.value_predicates)
         ]
 
+    def query(self):
+        """Compiles index, name and value filters into an SQL query.
+
+        The query selects names of matched elements (G, E, A).
+        Entity and Attribute names are NULL for matched Groups without
+        Entities and matched Entities without Attributes, respectively.
+        These are only selected if no filters apply to deeper tree levels.
+
+        Attribute history entries are matched by name, as listed in the tree
+        (see `contacto.storage.HistoryAttribute`), and by value.
+
+        :return: SQL query and its parameters
+        :rtype:  (str, list)
+        """
+        storage = self.storage
+        sql, params = self.__query_arm('a.name', '', 'a.id',
+                                       storage.match_attribute_ids)
+        h_sql, h_params = self.__query_arm(HISTORY_NAME, HISTORY_JOIN, 'h.id',
+                                           storage.match_history_ids)
+        sql = f"{sql} UNION ALL {h_sql}"
+        params += h_params
+        return f"{sql} ORDER BY 4, 5, 6", params
+
+    def __query_arm(self, aname, join, id_col, match_ids):
+        """Compiles filters into a query selecting Attributes named by
+        an expression, joined with another table. Value filters select
+        rows by an ID column, matching IDs are found by a Storage method.
+        """
+        cols = ['g.name', 'e.name', aname]
+        conds, params = [], []
+        for col, ind, needles in zip(cols, self.index_filters,
+                                     self.name_filters):
+            if ind:
+                conds.append(f"{col}=?")
+                params.append(ind)
+            for needle in needles:
+                conds.append(f"fmatch(?, {col})")
+                params.append(needle)
+
+        if self.value_filters:
+            ids = None
+            for needle, fuzzy in self.value_filters:
+                found = match_ids(needle, fuzzy)
+                ids = found if ids is None else ids & found
+            # IDs come from the DB, they are safe to inline
+            conds.append(f"{id_col} IN \
+                           ({','.join(str(int(i)) for i in ids)})")
+
+        if self.since is not None:
+            changed = 'SELECT elem_id FROM change_log WHERE seq>? AND scope='
+            conds.append(f"(g.id IN ({changed}1) OR e.id IN ({changed}2) \
+                           OR a.id IN ({changed}3))")
+            params.extend([self.since] * 3)
+
+        deep_e = join or self.__level_filtered(2)
+        deep_g = deep_e or self.__level_filtered(1)
+        sql = f'SELECT g.name, e.name, {aname}, g.id, e.id, a.id \
+                FROM "group" AS g \
+                {"" if deep_g else "LEFT"} JOIN entity AS e \
+                    ON (e.group_id=g.id) \
+                {"" if deep_e else "LEFT"} JOIN attribute AS a \
+                    ON (a.entity_id=e.id) {join} \
+                {"WHERE " + " AND ".join(conds) if conds else ""}'
+        return sql, params
+
+    def __level_filtered(self, level):
+        """True if any filter applies to elements of a tree level (G=0).
+        """
+        return bool(self.index_filters[level] or self.name_filters[level] or
+                    self.value_predicates[level] or
+                    (level == 2 and self.value_filters))
+
     def filter(self):
         """Generates an induced subgraph from the current tree
         using the saved filters
         """
         if self.empty():
             return
-        ind_g, ind_e, ind_a = self.index_filters  # strings
         val_g, val_e, val_a = self.value_predicates  # predicates
+        memo = {}
+
+        def accept(pred, elem):
+            if elem not in memo:
+                memo[elem] = not pred or pred(elem)
+            return memo[elem]
+
+        sql, params = self.query()
+        rows = self.storage.db_conn.execute(sql, params).fetchall()
 
         grps = {}
-        iter_groups = self.groups
-        # group index filter
-        if ind_g:
-            if ind_g not in iter_groups:
-                self.groups = {}
-                return
-            iter_groups = {ind_g: iter_groups[ind_g]}
-        for gname, group in iter_groups.items():
-            # group value filter
-            if val_g and not val_g(group):
+        for gname, ename, aname, *_ in rows:
+            # names are NULL only where deeper levels are not filtered
+            group = self.source[gname]
+            if not accept(val_g, group):
                 continue
-            iter_entities = group.entities
-            # entity index filter
-            if ind_e:
-                if ind_e not in iter_entities:
-                    continue
-                iter_entities = {ind_e: iter_entities[ind_e]}
-            ents = {}
-            for ename, entity in iter_entities.items():
-                # entity value filter
-                if val_e and not val_e(entity):
+            path = [group]
+            if ename is not None:
+                entity = group.entities[ename]
+                if not accept(val_e, entity):
                     continue
-                iter_attributes = entity.attributes
-                # attribute index filter
-                if ind_a:
-                    if ind_a not in iter_attributes:
+                path.append(entity)
+                if aname is not None:
+                    attribute = entity.attributes[aname]
+                    if not accept(val_a, attribute):
                         continue
-                    iter_attributes = {ind_a: iter_attributes[ind_a]}
-                attrs = {}
-                for aname, attr in iter_attributes.items():
-                    # attribute value filter
-                    if val_a and not val_a(attr):
-                        continue
-                    attrs[aname] = copy.copy(attr)
-                nofilt = len(iter_attributes) == 0 and not val_a
-                if len(attrs) > 0 or nofilt:
-                    ent = copy.copy(entity)
-                    ent.attributes = attrs
-                    for attr in attrs.values():
-                        attr.parent = ent
-                    ents[ename] = ent
-            nofilt = len(iter_entities) == 0 and not (val_e or ind_a or val_a)
-            if len(ents) > 0 or nofilt:
-                grp = copy.copy(group)
-                grp.entities = ents
-                for ent in ents.values():
-                    ent.parent = grp
-                grps[gname] = grp
+                    path.append(attribute)
+            self.__induce(grps, path)
         self.groups = grps
+
+    @staticmethod
+    def __induce(grps, path):
+        """Adds copies of elements on a tree path to an induced subgraph.
+        """
+        group = path[0]
+        if group.name not in grps:
+            grp = copy.copy(group)
+            grp.entities = {}
+            grps[group.name] = grp
+        grp = grps[group.name]
+        if len(path) < 2:
+            return
+        entity = path[1]
+        if entity.name not in grp.entities:
+            ent = copy.copy(entity)
+            ent.attributes = {}
+            ent.parent = grp
+            grp.entities[entity.name] = ent
+        ent = grp.entities[entity.name]
+        if len(path) < 3:
+            return
+        attr = copy.copy(path[2])
+        attr.parent = ent
+        ent.attributes[attr.name] = attr
@@ -7,21 +7,69 @@ C) Keeping a text attribute <ATTR> up to date:
     Add a text attribute "<ATTR>_textsource"
 
 The plugin may back up old attribute data using logrotate-like rotation
-This history creates attributes like <ATTR>_1, <ATTR>_2, etc.
+This history is listed as attributes <ATTR>_1, <ATTR>_2, etc.
+(at most HISTORY_KEEP of them, if set).
 This feature is enabled per-attribute:
     Append an asterisk to the source attribute.
     MYATTR_source  <- history disabled
     MYATTR_source* <- history enabled
+
+Sources are fetched concurrently by a bounded thread pool, with a limit
+of concurrent requests per host and a timeout per request.
+Fetched data are written in short transactions, in batches.
+
+Source metadata (ETag, Last-Modified, content hash, fetch time) are kept
+in the "watchdog_source" table. Sources are revalidated by conditional
+requests, unchanged sources are neither downloaded nor written.
+A source is not refreshed more often than its minimum interval:
+    Add a text attribute "<ATTR>_interval" with the interval in seconds.
+    MYATTR_interval: 3600 <- refreshed at most once an hour
 """
 
 
-import sys
-from contacto.helpers import DType, print_error
-from urllib.request import urlopen
+import time
+import threading
+from collections import namedtuple
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+from contacto.helpers import DType, BlobHandle, blob_digest, print_error
 
 
 binsrc_id = '_source'
 txtsrc_id = '_textsource'
+interval_id = '_interval'
+
+# fetching limits
+MAX_WORKERS = 16
+MAX_PER_HOST = 4
+TIMEOUT = 10  # seconds
+# fetched sources written per transaction
+BATCH_SIZE = 50
+# minimum refresh interval of sources without an interval attribute
+DEFAULT_INTERVAL = 0  # seconds
+# rotated values kept per attribute, all if None
+HISTORY_KEEP = None
+
+META_TABLE = '''
+CREATE TABLE IF NOT EXISTS watchdog_source (
+    attribute_id INTEGER PRIMARY KEY
+        REFERENCES attribute(id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    hash BLOB,
+    fetched_at REAL NOT NULL
+)'''
+
+# a tracked source and its stored metadata (None if never fetched)
+Source = namedtuple('Source', 'path aid url name text history meta')
+# stored source metadata
+Meta = namedtuple('Meta', 'url etag last_modified hash fetched_at')
+# fetch result, data is None if the source was not modified
+Fetched = namedtuple('Fetched', 'data hash etag last_modified')
 
 
 def plugin_init(storage):
@@ -30,16 +78,71 @@ def plugin_init(storage):
     :param storage: Storage object
     :type storage:  class:`contacto.storage.Storage`
     """
+    with storage.db_conn:
+        storage.db_conn.execute(META_TABLE)
+    sources = due_sources(storage, time.time())
+    ok = True
+    batch = []
+    for source, result in fetch_all(sources):
+        if isinstance(result, Exception):
+            print_error(f"Watchdog: failed fetching {source.url}\n{result}")
+            ok = False
+            continue
+        batch.append((source, result))
+        if len(batch) >= BATCH_SIZE:
+            ok &= apply_batch(storage, batch)
+            batch = []
+    return apply_batch(storage, batch) and ok
+
+
+def due_sources(storage, now):
+    """Lists sources due for a refresh
+
+    :param storage: Storage object
+    :type storage:  class:`contacto.storage.Storage`
+    :param now: current time (UNIX timestamp)
+    :type now:  float
+    :return: tracked sources
+    :rtype:  list
+    """
+    sql = 'SELECT attribute_id, url, etag, last_modified, hash, fetched_at \
+           FROM watchdog_source'
+    metas = {aid: Meta(*meta)
+             for aid, *meta in storage.db_conn.execute(sql)}
+    sources = []
     for entity, attrs in attr_filter(storage.groups):
-        try:
-            with entity.get_conn():
-                for attr_data in attrs:
-                    attr_process(*attr_data)
-        except Exception as e:
-            msg = f"Watchdog: failed processing entity {entity}\n{str(e)}"
-            print_error(msg)
-            return False
-    return True
+        for attr, name, text, history in attrs:
+            meta = metas.get(attr.id)
+            if meta and (meta.url != attr.data or
+                         name not in entity.attributes):
+                # the source has moved or its target attribute is gone,
+                # forget its metadata so that the data are fetched again
+                meta = None
+            if meta and now - meta.fetched_at < interval(entity, name):
+                continue
+            path = entity.parent.name, entity.name
+            sources.append(Source(path, attr.id, attr.data, name, text,
+                                  history, meta))
+    return sources
+
+
+def interval(entity, name):
+    """Minimum refresh interval of an attribute's source in seconds
+
+    :param entity: entity owning the attribute
+    :type entity:  class:`contacto.storage.Entity`
+    :param name: name of the target attribute
+    :type name:  str
+    :return: refresh interval
+    :rtype:  float
+    """
+    attr = entity.attributes.get(f"{name}{interval_id}")
+    if attr is None or attr.type is not DType.TEXT:
+        return DEFAULT_INTERVAL
+    try:
+        return float(attr.data)
+    except ValueError:
+        return DEFAULT_INTERVAL
 
 
 # yields attribute data per entity
@@ -77,34 +180,164 @@ def attr_filter(groups):
                 yield entity, data
 
 
-def attr_process(attribute, name, text, history):
-    """Process a source indentifier attribute
+def fetch_all(sources):
+    """Fetches sources concurrently, results are generated as they come
+
+    Sources are submitted alternating between hosts, so that workers
+    waiting for a busy host do not hold up the others.
+
+    :param sources: tracked sources
+    :type sources:  list
+    :return: sources with fetch results or the exception fetching raised
+    :rtype:  generator
+    """
+    by_host = {}
+    for source in sources:
+        by_host.setdefault(urlsplit(source.url).netloc, []).append(source)
+    limits = {host: threading.BoundedSemaphore(MAX_PER_HOST)
+              for host in by_host}
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {}
+        for host_sources in zip_longest(*by_host.values()):
+            for source in filter(None, host_sources):
+                limit = limits[urlsplit(source.url).netloc]
+                futures[pool.submit(fetch, source, limit)] = source
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def fetch(source, host_limit):
+    """Fetches a source, holding a slot of its host
 
-    :param attribute: source tracking attribute
-    :type attribute: class:`contacto.storage.Attribute`
+    Known sources are revalidated using their ETag and Last-Modified.
+    Sources without metadata reported as not modified (e.g. by a cache)
+    are fetched again, bypassing caches.
+
+    :param source: tracked source
+    :type source:  class:`Source`
+    :param host_limit: host concurrency limit
+    :type  host_limit: class:`threading.BoundedSemaphore`
+    :return: fetch result
+    :rtype:  class:`Fetched`
+    """
+    meta = source.meta
+    headers = {}
+    if meta and meta.etag:
+        headers['If-None-Match'] = meta.etag
+    if meta and meta.last_modified:
+        headers['If-Modified-Since'] = meta.last_modified
+    try:
+        return download(source, host_limit, headers)
+    except HTTPError as e:
+        if e.code != 304:
+            raise
+        if meta is not None:
+            return Fetched(None, meta.hash, meta.etag, meta.last_modified)
+    return download(source, host_limit, {'Cache-Control': 'no-cache'})
+
+
+def download(source, host_limit, headers):
+    """Downloads a source, holding a slot of its host
+
+    :param source: tracked source
+    :type source:  class:`Source`
+    :param host_limit: host concurrency limit
+    :type  host_limit: class:`threading.BoundedSemaphore`
+    :param headers: request headers
+    :type  headers: dict
+    :raises HTTPError: error or not modified (304) response
+    :return: fetch result
+    :rtype:  class:`Fetched`
+    """
+    request = Request(source.url, headers=headers)
+    with host_limit, urlopen(request, timeout=TIMEOUT) as f:
+        data = f.read()
+        digest = blob_digest(data)
+        if source.text:
+            charset = f.headers.get_content_charset() or 'utf-8'
+            data = data.decode(charset)
+        return Fetched(data, digest, f.headers.get('ETag'),
+                       f.headers.get('Last-Modified'))
+
+
+def apply_batch(storage, batch):
+    """Writes fetched data and source metadata in a single transaction
+
+    Data of sources that have not changed since they were last written
+    are skipped.
+
+    :param storage: Storage object
+    :type storage:  class:`contacto.storage.Storage`
+    :param batch: sources with fetch results
+    :type batch:  list
+    :return: success
+    :rtype:  bool
+    """
+    if not batch:
+        return True
+    now = time.time()
+    sql = 'INSERT OR REPLACE INTO watchdog_source VALUES (?, ?, ?, ?, ?, ?)'
+    try:
+        with storage.db_conn:
+            for source, fetched in batch:
+                entity = storage.get_entity(*source.path)
+                if entity is None:
+                    continue
+                changed = not source.meta or \
+                    source.meta.hash != fetched.hash or \
+                    source.name not in entity.attributes
+                if fetched.data is not None and changed:
+                    attr_process(entity, source.name, source.text,
+                                 source.history, fetched.data)
+                storage.db_conn.execute(sql, (
+                    source.aid, source.url, fetched.etag,
+                    fetched.last_modified, fetched.hash, now))
+    except Exception as e:
+        print_error(f"Watchdog: failed writing a batch\n{str(e)}")
+        # in-memory data may be corrupt
+        storage.reload()
+        return False
+    return True
+
+
+def attr_process(ent, name, text, history, data):
+    """Writes fetched source data into a target attribute
+
+    :param ent: entity owning the source tracking attribute
+    :type ent:  class:`contacto.storage.Entity`
     :param name: name of the target attribute
     :type name:  str
     :param text: True if the source provides TEXT data
     :type  text: bool
     :param history: True if target attribute should be rotated
     :type history:  bool
+    :param data: fetched data
+    :type data:  Union[str, bytes]
     """
-    ent = attribute.parent
-    mode = 'r' if text else 'rb'
     dtype = DType.TEXT if text else DType.BIN
-    with urlopen(attribute.data, mode) as f:
-        data = f.read()
-
     if name not in ent.attributes:
         ent.create_attribute(name, dtype, data)
         return
 
     attr = ent.attributes[name]
-    if attr.type == dtype and attr.data == data:
+    if attr.type == dtype and unchanged(attr, data):
         # nothing changed, do not update
         return
 
     if history:
-        attr.rotate()
+        attr.rotate(HISTORY_KEEP)
     attr.type, attr.data = dtype, data
     attr.update()
+
+
+def unchanged(attr, data):
+    """Compares attribute data, stored binary data by their hash only
+    """
+    _, old = attr.get(deferred=True)
+    if isinstance(old, BlobHandle):
+        return old.digest == blob_digest(data)
+    return old == data
@@ -35,9 +35,11 @@ def mkdb(name):
 
 
 def rmdb():
-    path = fixture(db)
-    if os.path.exists(path):
-        path.unlink()
+    # WAL files are left behind by connections using the "wal" profile
+    for suffix in ('', '-wal', '-shm'):
+        path = fixture(f"{db}{suffix}")
+        if os.path.exists(path):
+            path.unlink()
 
 
 def mkstor():
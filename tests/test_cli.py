@@ -2,7 +2,13 @@ from click.testing import CliRunner
 from contacto.cli import main_cmd
 from helpers import fixture, db, mkdb, rmdb, yml_fixture
 from os.path import exists
+import pathlib
+import subprocess
+import sqlite3
+import sys
+import os
 import pytest
+from PIL import Image
 
 
 @pytest.fixture
@@ -30,6 +36,9 @@ def test_no_db(runner):
     result = run(runner, 'get')
     assert not result.exit_code and exists(db)
 
+    result = run(runner, f"-o {db} -p wal get", False)
+    assert not result.exit_code
+
 
 def test_get(runner, tinybin):
     result = run(runner, 'get Does/Not/Exist')
@@ -74,6 +83,11 @@ def test_set(runner):
     assert not result.exit_code
     result = run(runner, 'get -f Friends/Albatros/url_bin')
     assert not result.exit_code and result.output.count('BINARY') == 2
+    result = run(runner, 'set -R -k 1 Friends/Albatros/url_bin text')
+    assert not result.exit_code
+    result = run(runner, 'get Friends/Albatros/url_bin_1')
+    assert not result.exit_code and 'BINARY' in result.output
+    assert not run(runner, 'get Friends/Albatros/url_bin_2').output
 
     assert run(runner, 'set //url_bin 123').exit_code == 2
 
@@ -83,6 +97,16 @@ def test_set(runner):
     result = run(runner, 'set Family/Mom/catpic REF:Family/Dad/catpic')
     assert result.exit_code and 'REF loop' in result.output
 
+    # TEXT values are updated
+    assert not run(runner, 'set Family/Dad/age 46').exit_code
+    assert run(runner, 'get -r Family/Dad/age').output == '46\n'
+
+    # rotated values are matched by value
+    assert not run(runner, 'set -R Family/Dad/age 47').exit_code
+    result = run(runner, 'get -v 46 Family/Dad')
+    assert not result.exit_code and result.output == 'age_1: 46\n'
+    result = run(runner, 'get -Vv 4 Family/Dad')
+    assert result.output == 'age  : 47\nage_1: 46\n'
 
 
 def test_del(runner):
@@ -112,6 +136,57 @@ def test_merge(runner):
     assert not run(runner, 'merge Friends Family').exit_code
 
 
+def batch(runner, arg, lines):
+    return runner.invoke(main_cmd, f"-o {db} batch {arg}",
+                         input=''.join(f"{line}\n" for line in lines))
+
+
+def test_batch(runner):
+    result = batch(runner, '-n 2', [
+        '# comment',
+        'set\tFamily/Sister/age\t18',
+        'set\tFriends/Bob',
+        'set\tFriends/Bob/age\t30',
+        '',
+        'set\tFriends/Bob/mom\tREF:Family/Mom',
+        'del\tFamily/Dad/web',
+        'del\tFamily/Dad/web',
+        'merge\tFamily\tFamily/Dad',
+        'get\tFamily',
+    ])
+    assert result.exit_code == 1
+    for n in (2, 8, 9, 10):
+        assert f"line {n}:" in result.output
+    assert '8 operations, 4 failed' in result.output
+    assert run(runner, 'get -r Friends/Bob/age').output == '30\n'
+    assert run(runner, 'get -r Friends/Bob/mom').output == 'Family/Mom\n'
+    assert not run(runner, 'get Family/Sister').output
+    assert not run(runner, 'get Family/Dad/web').output
+
+    result = batch(runner, '-R -k 1', ['set\tFamily/Dad/age\t46'])
+    assert not result.exit_code
+    assert run(runner, 'get -r Family/Dad/age_1').output == '45\n'
+
+
+def test_batch_json(runner):
+    result = batch(runner, '-f json', [
+        '{"op": "set", "refspec": "Family/Sister/age", "value": "18",'
+        ' "recursive": true}',
+        '{"op": "set", "refspec": "Family/Sister/size", "value": 18}',
+        '{"op": "merge", "src": "Family/Mom", "dst": "Family/Dad"}',
+        '{"op": "del", "refspec": "Friends"}',
+        '["del", "Family"]',
+        '{"op": "set"',
+    ])
+    assert result.exit_code == 1
+    assert all(f"line {n}:" in result.output for n in (2, 5, 6))
+    assert run(runner, 'get -r Family/Sister/age').output == '18\n'
+    assert not run(runner, 'get Family/Mom').output
+    assert not run(runner, 'get Friends').output
+
+    assert not batch(runner, '-f json', []).exit_code
+
+
 def test_import(runner):
     cmd = f"import {yml_fixture('test')}"
 
@@ -131,8 +206,103 @@ def test_export(runner):
     result = run(runner, 'get Family/Dad/age')
     assert not result.exit_code and result.output == '45\n'
 
+    result = run(runner, f'export -Pv {tmp}')
+    assert not result.exit_code and 'YAML backend: Python' in result.output
+    assert not run(runner, f'import -P {tmp}').exit_code
+
+    assert not run(runner, f'export -f snapshot {tmp}').exit_code
+    rmdb()
+    assert run(runner, f'import {tmp}').exit_code
+    assert not run(runner, f'import -f snapshot {tmp}').exit_code
+    result = run(runner, 'get Family/Dad/age')
+    assert not result.exit_code and result.output == '45\n'
+
+
+def test_changes(runner):
+    result = run(runner, 'changes -l')
+    assert not result.exit_code
+    since = int(result.output)
+    assert not run(runner, 'set Family/Dad/shoe 46').exit_code
+    result = run(runner, f'changes -s {since}')
+    assert result.output == f"{since + 1}\tI\tFamily/Dad/shoe\n"
+
+    tmp = yml_fixture('temp')
+    assert not run(runner, f'export -s {since} {tmp}').exit_code
+    with open(tmp) as f:
+        assert f.read() == "Family:\n  Dad:\n    shoe: '46'\n"
+    assert run(runner, f'export -f snapshot -s {since} {tmp}').exit_code
+
 
-def test_plugin_cmd(runner):
+def test_backlinks(runner):
+    result = run(runner, 'backlinks Family/Mom')
+    assert not result.exit_code and result.output == 'Family/Dad/spouse\n'
+    result = run(runner, 'backlinks -t Family/Mom/catpic')
+    assert not result.exit_code
+    assert result.output == 'Family/Dad/catpic\nFamily/Dad/thumbnail\n'
+    assert run(runner, 'backlinks Family').exit_code == 1
+    assert run(runner, 'backlinks Family/Nobody').exit_code == 1
+
+
+def test_thumbnails(runner, tmp_path):
+    # as left by an older version
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.execute('DELETE FROM thumbnail_variant')
+    conn.close()
+    result = run(runner, 'thumbnails -j 0')
+    assert not result.exit_code and result.output.startswith('Downscaled 1 ')
+
+    # commands setting thumbnails make their variants once done
+    cat = tmp_path / 'cat.jpg'
+    Image.open(fixture('cat.jpg')).save(cat, quality=50)
+    assert not run(runner, f"set -r G/E/thumbnail FILE:{cat}").exit_code
+    result = run(runner, 'thumbnails -j 0')
+    assert not result.exit_code and result.output.startswith('Downscaled 0 ')
+    assert run(runner, 'thumbnails').output.startswith('Downscaled 0 ')
+    tmp = yml_fixture('temp')
+    assert not run(runner, f'export -t 64 {tmp}').exit_code
+    assert run(runner, f'export -f snapshot -t 64 {tmp}').exit_code
+
+
+def test_stats(runner):
+    result = run(runner, 'stats')
+    assert not result.exit_code and 'Saved:' in result.output
+
+
+def test_plugin_cmd(runner, tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
     assert not run(runner, 'plugin -l').exit_code
     result = run(runner, 'plugin')
     assert not result.exit_code and result.output.startswith('Plugin summary')
+
+
+def imported_modules(tmp_path, arg):
+    root = pathlib.Path(__file__).parents[1]
+    path = os.pathsep.join([str(root), str(root / 'plugins')])
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path), PYTHONPATH=path)
+    cmd = [sys.executable, '-X', 'importtime', '-m', 'contacto',
+           '-o', str(db), *arg.split()]
+    result = subprocess.run(cmd, env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    assert not result.returncode
+    modules = {line.split('|')[-1].strip()
+               for line in result.stderr.splitlines()
+               if line.startswith('import time:')}
+    return modules, result.stdout
+
+
+@pytest.mark.parametrize('arg', ['--help', 'plugin -l', 'set -r G/E/a 1'])
+def test_import_time(runner, tmp_path, arg):
+    # heavy dependencies are imported by the commands using them only
+    modules, output = imported_modules(tmp_path, arg)
+    assert 'contacto.cli' in modules
+    heavy = {'PIL', 'yaml', 'urllib.request', 'copy', 'contacto.serial',
+             'contacto.view', 'contacto_watchdog'}
+    assert not modules & heavy
+    if arg == 'plugin -l':
+        assert 'watchdog' in output
+
+
+def test_import_time_get(runner, tmp_path):
+    modules, _ = imported_modules(tmp_path, 'get')
+    assert {'yaml', 'contacto.serial', 'contacto.view'} <= modules
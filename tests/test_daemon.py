@@ -0,0 +1,122 @@
+import contacto.daemon as daemon
+from contacto.cli import main_cmd
+from contacto.storage import Storage
+from helpers import mkdb, db, fixture
+import os
+import socket
+import threading
+import pytest
+from PIL import Image
+
+
+def test_split_args():
+    assert daemon.split_args(['-o', 'a.db', '-p', 'wal', 'get', '-r']) == \
+        ('a.db', 'get', ['-r'])
+    assert daemon.split_args(['--open=a.db', 'set', 'G']) == \
+        ('a.db', 'set', ['G'])
+    assert daemon.split_args(['-oa.db', '--help']) == ('a.db', None, [])
+    assert daemon.reads_stdin('set', ['-ri', 'G/E/a'])
+    assert daemon.reads_stdin('set', ['--stdin', 'G/E/a'])
+    assert not daemon.reads_stdin('set', ['-r', 'G/E/a', 'info'])
+    assert not daemon.reads_stdin('get', ['-i'])
+
+
+@pytest.fixture
+def server():
+    mkdb('test')
+    ready, servers = threading.Event(), []
+
+    def serve():
+        # the Storage is used by the serving thread only
+        servers.append(daemon.Server(Storage(str(db), lazy=True), main_cmd))
+        servers[0].serve(ready.set)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    assert ready.wait(10)
+    yield servers[0]
+    daemon.stop(str(db))
+    thread.join(10)
+
+
+def request(*args):
+    return daemon.request(str(db), ['-o', str(db), *args])
+
+
+def test_server(server):
+    code, out, _ = request('get', '-r', 'Family/Dad/age')
+    assert (code, out) == (0, b'45\n')
+    assert request('set', 'Family/Dad/shoe', '46')[0] == 0
+    assert request('get', '-r', 'Family/Dad/shoe')[1] == b'46\n'
+    code, out, err = request('set', 'Family/Nobody/age', '1')
+    assert code == 1 and b'does not exist' in out + err
+    assert request('get', '--nope')[0] == 2
+    assert request('stats')[0] == 2
+
+    # changes made by other connections are picked up
+    other = Storage(str(db))
+    attr = other.get_attribute('Family', 'Dad', 'age')
+    attr.data = '47'
+    assert attr.update_safe()
+    assert request('get', '-r', 'Family/Dad/age')[1] == b'47\n'
+
+    assert daemon.forward(['-o', str(db), 'stats']) is None
+    with pytest.raises(FileExistsError):
+        daemon.Server(other, main_cmd).serve()
+
+
+def test_variants(server, tmp_path):
+    cat = tmp_path / 'cat.jpg'
+    Image.open(fixture('cat.jpg')).save(cat, quality=50)
+    assert request('set', '-r', 'G/E/thumbnail', f"FILE:{cat}")[0] == 0
+    # made after answering, before the next request
+    assert request('get', 'G')[0] == 0
+    sql = 'SELECT count(*) FROM thumbnail_variant'
+    assert Storage(str(db)).db_conn.execute(sql).fetchone()[0] == 4
+
+
+def test_client_cwd(server, tmp_path):
+    # relative paths resolve in the working directory of the client
+    (tmp_path / 'note.bin').write_bytes(b'note')
+    cwd = os.getcwd()
+    for name, value in (('note', 'FILE:note.bin'),
+                        ('url', 'URL:file:note.bin')):
+        sock = daemon.connect(daemon.socket_path(str(db)))
+        args = ['-o', str(db), 'set', f"Family/Dad/{name}", value]
+        res = daemon.exchange(sock, {'args': args, 'cwd': str(tmp_path)})
+        assert res['code'] == 0
+    assert os.getcwd() == cwd
+    dad = Storage(str(db)).get_entity('Family', 'Dad')
+    assert dad.attributes['note'].get()[1] == b'note'
+    assert dad.attributes['url'].get()[1] == b'note'
+
+
+@pytest.mark.parametrize('answer', [b'garbage\n', b''])
+def test_bad_response(answer):
+    mkdb('test')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(daemon.socket_path(str(db)))
+    listener.listen()
+
+    def answer_once():
+        conn, _ = listener.accept()
+        with conn, conn.makefile('rwb') as f:
+            f.readline()
+            f.write(answer)
+
+    thread = threading.Thread(target=answer_once)
+    thread.start()
+    try:
+        # the command runs locally instead
+        assert daemon.forward(['-o', str(db), 'get']) is None
+    finally:
+        thread.join(10)
+        listener.close()
+        os.unlink(daemon.socket_path(str(db)))
+
+
+def test_no_server():
+    mkdb('test')
+    assert request('get') is None
+    assert daemon.forward(['-o', str(db), 'get']) is None
+    assert not daemon.stop(str(db))
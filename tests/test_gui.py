@@ -0,0 +1,132 @@
+from helpers import mkdb, db
+from contacto.storage import Storage, Entity
+from click.testing import CliRunner
+import os
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+from PyQt5 import QtCore  # noqa: E402
+import contacto.gui as gui  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def model(app):
+    mkdb('test')
+    return gui.TreeModel(Storage(str(db), lazy=True))
+
+
+def fetch(model, parent=QtCore.QModelIndex()):
+    while model.canFetchMore(parent):
+        model.fetchMore(parent)
+    return [model.index(row, 0, parent).data()
+            for row in range(model.rowCount(parent))]
+
+
+def child(model, parent, name):
+    fetch(model, parent)
+    for row in range(model.rowCount(parent)):
+        index = model.index(row, 0, parent)
+        if index.data() == name:
+            return index
+    return None
+
+
+def test_fetch(model, monkeypatch):
+    root = QtCore.QModelIndex()
+    stor = model.root.elem
+    # nothing is read before the view asks for it
+    assert model.rowCount(root) == 0 and model.canFetchMore(root)
+    assert model.hasChildren(root)
+    assert fetch(model, root) == sorted(stor.groups)
+    assert not model.canFetchMore(root)
+    assert not any(group.loaded for group in stor.groups.values())
+
+    # children are added in batches
+    monkeypatch.setattr(gui, 'FETCH_BATCH', 1)
+    family = child(model, root, 'Family')
+    assert family is not None
+    model.fetchMore(family)
+    assert stor.groups['Family'].loaded and not stor.groups['Main'].loaded
+    assert model.rowCount(family) == 1 and model.canFetchMore(family)
+    assert fetch(model, family) == ['Dad', 'Mom']
+    assert model.rowCount(family.siblingAtColumn(1)) == 0
+
+    # attributes are leaves
+    age = child(model, child(model, family, 'Dad'), 'age')
+    assert not model.hasChildren(age) and not model.canFetchMore(age)
+    model.fetchMore(age)
+    assert model.rowCount(age) == 0
+
+    # empty nodes are known to be so once fetched
+    bare = child(model, root, 'BareGrp')
+    assert model.hasChildren(bare)
+    assert fetch(model, bare) == [] and not model.hasChildren(bare)
+
+
+def test_index_parent(model):
+    root = QtCore.QModelIndex()
+    assert not model.index(0, 0, root).isValid()
+    fetch(model, root)
+    assert not model.index(model.rowCount(root), 0, root).isValid()
+    assert not model.index(0, len(gui.HEADERS), root).isValid()
+
+    family = child(model, root, 'Family')
+    dad = child(model, family, 'Dad')
+    age = child(model, dad, 'age')
+    assert not model.parent(root).isValid()
+    assert not model.parent(family).isValid()
+    for index, parent in ((dad, family), (age, dad)):
+        assert model.parent(index) == parent
+        assert model.index(index.row(), 0, parent) == index
+        assert model.index(index.row(), 2, parent).parent() == parent
+    assert model.node(age).elem is \
+        model.root.elem.get_attribute('Family', 'Dad', 'age')
+
+
+def test_data(model):
+    root = QtCore.QModelIndex()
+    family = child(model, root, 'Family')
+    dad = child(model, family, 'Dad')
+    row = [model.index(dad.row(), col, family).data() for col in range(3)]
+    assert row == ['Dad', 'Entity', None]
+    age = child(model, dad, 'age')
+    row = [model.index(age.row(), col, dad).data() for col in range(3)]
+    assert row == ['age', 'Attr (text)', '45']
+    assert model.headerData(0, QtCore.Qt.Horizontal) == gui.HEADERS[0]
+
+    # entity icons use the thumbnail variant of the icon size
+    icon = dad.data(QtCore.Qt.DecorationRole)
+    assert max(icon.availableSizes()[0].width(),
+               icon.availableSizes()[0].height()) == gui.ICON_SIZE
+    assert child(model, family, 'Mom').data(QtCore.Qt.DecorationRole) \
+        is None
+    big = gui.TreeModel(model.root.elem, icon_size=256)
+    dad = child(big, child(big, root, 'Family'), 'Dad')
+    size = dad.data(QtCore.Qt.DecorationRole).availableSizes()[0]
+    assert max(size.width(), size.height()) == 256
+
+
+def test_icon_size_option(app, monkeypatch):
+    mkdb('test')
+    shown = []
+    monkeypatch.setattr(gui.GUI, 'run', lambda self: shown.append(self))
+    result = CliRunner().invoke(gui.main, ['--icon-size', '256', str(db)])
+    assert result.exit_code == 0 and len(shown) == 1
+    window = shown[0]
+    assert window.storage.db_file == str(db)
+    assert window.tree.iconSize() == QtCore.QSize(256, 256)
+
+    # the model asks for the variant of the chosen size
+    sizes = []
+    get_thumbnail = Entity.get_thumbnail
+    monkeypatch.setattr(Entity, 'get_thumbnail', lambda self, size=None:
+                        sizes.append(size) or get_thumbnail(self, size=size))
+    model = window.model
+    dad = child(model, child(model, QtCore.QModelIndex(), 'Family'), 'Dad')
+    assert dad.data(QtCore.Qt.DecorationRole) and sizes == [256]
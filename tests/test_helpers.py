@@ -1,3 +1,5 @@
+import os
+import sys
 import contacto.helpers as hlp
 from helpers import fixture
 import pytest
@@ -29,3 +31,44 @@ def test_valspec_parse():
     with pytest.raises(Exception):
         hlp.parse_valspec("REF:Group/Entity//")
         hlp.parse_valspec("REF:Group")
+
+
+def test_downscale_img():
+    from PIL import Image
+    import io
+    variants = hlp.downscale_img(fixture('cat.jpg').read_bytes())
+    assert [size for size, _, _ in variants] == list(hlp.THUMB_SIZES)
+    for size, fmt, data in variants:
+        img = Image.open(io.BytesIO(data))
+        assert img.format == fmt and max(img.size) == size
+    assert hlp.downscale_img(fixture('cat.jpg').read_bytes(), [1000])[0][0]
+    assert hlp.downscale_img(b'junk') is None
+
+
+def test_find_plugins(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    plugins = tmp_path / 'plugins'
+    plugins.mkdir()
+    (plugins / 'contacto_broken.py').write_text('raise ImportError')
+    monkeypatch.setattr(sys, 'path', [str(plugins)])
+
+    def settle(mtime):
+        # long before the timestamp granularity guard
+        os.utime(plugins, (mtime, mtime))
+
+    # directories modified just now are not cached
+    assert hlp.find_plugins() == {'broken': 'contacto_broken'}
+    assert not os.path.exists(hlp.plugin_manifest_path())
+    settle(1000)
+    assert 'broken' in hlp.find_plugins()
+    assert os.path.exists(hlp.plugin_manifest_path())
+    # listed without importing them or scanning the path again
+    with monkeypatch.context() as m:
+        m.setattr(hlp.pkgutil, 'iter_modules', None)
+        assert 'broken' in hlp.find_plugins()
+    assert 'contacto_broken' not in sys.modules
+
+    (plugins / 'contacto_new.py').write_text('')
+    settle(2000)
+    assert set(hlp.find_plugins()) == {'broken', 'new'}
+    assert list(hlp.get_plugins(['new'])) == ['new']
@@ -1,5 +1,12 @@
-from helpers import mkstor, yml_fixture
-from contacto.serial import Serial
+from helpers import mkstor, mkdb, db, yml_fixture, fixture
+from contacto.serial import Serial, LIBYAML
+from contacto.helpers import DType, Scope
+from contacto.storage import Storage
+import io
+import os
+import yaml
+import pytest
+
 
 def test_import_export():
     stor = mkstor()
@@ -19,3 +26,180 @@ def test_import_export():
     
     for gname in stor.groups.keys():
         assert gname in stor2.groups
+
+
+def safe_dump_tree(stor, max_scope):
+    data = {}
+    for gname, group in stor.groups.items():
+        d_group = data[gname] = {}
+        if max_scope <= Scope.GROUP:
+            continue
+        for ename, entity in group.entities.items():
+            d_entity = d_group[ename] = {}
+            if max_scope <= Scope.ENTITY:
+                continue
+            for aname, attr in entity.attributes.items():
+                value = attr.data
+                if attr.type.is_xref():
+                    value = f"REF:{value}"
+                d_entity[aname] = value
+    return yaml.safe_dump(data)
+
+
+def test_streamed_export():
+    stor = mkstor()
+    buf = io.StringIO()
+    assert Serial(stor).export_yaml(buf) and buf.getvalue() == '{}\n'
+
+    with open(yml_fixture('test'), 'r') as f:
+        assert Serial(stor).import_yaml(f)
+    ent = stor.get_entity('Main', 'TestEntity')
+    ent.create_attribute_safe('unicode', DType.TEXT,
+                              'Žluťoučký kůň 🐴')
+    ent.create_attribute_safe('lines', DType.TEXT, 'a\nb: c\n  - d')
+    ent.create_attribute_safe('yes', DType.TEXT, 'yes')
+
+    for scope in (Scope.GROUP, Scope.ENTITY, Scope.ATTRIBUTE):
+        buf = io.StringIO()
+        assert Serial(stor).export_yaml(buf, max_scope=scope)
+        assert buf.getvalue() == safe_dump_tree(stor, scope)
+
+
+def test_lazy_export():
+    mkdb('test')
+    buf = io.StringIO()
+    assert Serial(Storage(str(db))).export_yaml(buf)
+    stor = Storage(str(db), lazy=True)
+    dad = stor.get_entity('Family', 'Dad')
+    lazy_buf = io.StringIO()
+    assert Serial(stor).export_yaml(lazy_buf)
+    assert lazy_buf.getvalue() == buf.getvalue()
+    # groups loaded by the export are released, the others are kept
+    assert {gname for gname, group in stor.groups.items()
+            if group.loaded} == {'Family'}
+    assert stor.get_entity('Family', 'Dad') is dad
+
+
+def test_history_round_trip():
+    stor = mkstor()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    attr = ent.create_attribute_safe('A', DType.TEXT, 'v1')
+    for value in ('v2', 'v3'):
+        assert attr.rotate_safe()
+        attr.data = value
+        assert attr.update_safe()
+    buf = io.StringIO()
+    assert Serial(stor).export_yaml(buf)
+    assert yaml.safe_load(buf.getvalue())['G']['E'] == \
+        {'A': 'v3', 'A_1': 'v2', 'A_2': 'v1'}
+
+    # importing the export again leaves the history alone
+    buf.seek(0)
+    assert Serial(stor).import_yaml(buf)
+    attr = stor.get_attribute('G', 'E', 'A')
+    assert attr.rotate_safe()
+    ent = stor.get_entity('G', 'E')
+    assert {name: a.data for name, a in ent.attributes.items()} == \
+        {'A': 'v3', 'A_1': 'v3', 'A_2': 'v2', 'A_3': 'v1'}
+    sql = 'SELECT count(*) FROM attribute'
+    assert stor.db_conn.execute(sql).fetchone()[0] == 1
+
+
+def test_thumbnail_export():
+    stor = mkstor()
+    thumb = fixture('cat.jpg').read_bytes()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    assert ent.create_attribute_safe('thumbnail', DType.BIN, thumb)
+    assert ent.create_attribute_safe('pic', DType.BIN, thumb)
+    with stor.db_conn:
+        stor.make_pending_variants()
+    buf = io.StringIO()
+    assert Serial(stor).export_yaml(buf, thumb_size=64)
+    data = yaml.safe_load(buf.getvalue())['G']['E']
+    assert data['pic'] == thumb
+    assert data['thumbnail'] == ent.get_thumbnail(size=64) != thumb
+
+
+def tree_data(stor):
+    return {
+        gname: {
+            ename: {aname: (attr.type, attr.get()) for aname, attr
+                    in entity.attributes.items()}
+            for ename, entity in group.entities.items()
+        }
+        for gname, group in stor.groups.items()
+    }
+
+
+@pytest.mark.skipif(not LIBYAML, reason='PyYAML built without LibYAML')
+def test_backend_equivalence(tmp_path):
+    assert Serial(mkstor()).backend == 'LibYAML'
+    assert Serial(mkstor(), libyaml=False).backend == 'Python'
+
+    stors, dumps = [], []
+    for libyaml in (False, True):
+        stor = mkstor()
+        ser = Serial(stor, libyaml)
+        # BIN (FILE:, URL:), REF: and unicode data
+        with open(yml_fixture('test'), 'r') as f:
+            assert ser.import_yaml(f)
+        ent = stor.get_entity('Main', 'TestEntity')
+        ent.create_attribute_safe('unicode', DType.TEXT,
+                              'Žluťoučký kůň 🐴')
+        ent.create_attribute_safe('yes', DType.TEXT, 'yes')
+
+        # oversized BIN data is exported into FILE: refs
+        path = tmp_path / str(libyaml)
+        path.mkdir()
+        with open(path / 'dump.yml', 'w') as f:
+            assert ser.export_yaml(f, max_bin_size=16)
+        dumps.append((path / 'dump.yml').read_text())
+        stors.append(stor)
+        # reimport the export with the same backend
+        stor = mkstor()
+        with open(path / 'dump.yml', 'r') as f:
+            assert Serial(stor, libyaml).import_yaml(f)
+        assert tree_data(stor) == tree_data(stors[-1])
+
+    assert tree_data(stors[0]) == tree_data(stors[1])
+    assert dumps[0] == dumps[1].replace(str(True), str(False))
+    assert sorted(os.listdir(tmp_path / 'False')) == \
+        sorted(os.listdir(tmp_path / 'True'))
+
+
+def test_snapshot(tmp_path):
+    thumb = fixture('cat.jpg').read_bytes()
+    stor = mkstor()
+    with open(yml_fixture('test'), 'r') as f:
+        assert Serial(stor).import_yaml(f)
+    ent = stor.get_entity('Main', 'TestEntity')
+    ent.create_attribute_safe('unicode', DType.TEXT,
+                              'Žluťoučký kůň 🐴')
+    ent.thumbnail = thumb
+    assert ent.update_safe()
+
+    path = tmp_path / 'snap.bin'
+    with open(path, 'wb') as f:
+        assert Serial(stor).export_snapshot(f)
+    # binary data are stored raw
+    assert thumb in path.read_bytes()
+
+    for source in (lambda: open(path, 'rb'),
+                   lambda: io.BytesIO(path.read_bytes())):
+        stor2 = mkstor()
+        with source() as f:
+            assert Serial(stor2).import_snapshot(f)
+        assert tree_data(stor2) == tree_data(stor)
+        assert stor2.get_entity('Main', 'TestEntity').thumbnail == thumb
+        dad = stor2.get_entity('Family', 'Dad')
+        assert dad.thumbnail == stor.get_entity('Family', 'Dad').thumbnail
+        assert dad.attributes['spouse'].data is dad.parent.entities['Mom']
+
+    # reimport updates in place
+    with open(path, 'rb') as f:
+        assert Serial(stor2).import_snapshot(f)
+    assert tree_data(stor2) == tree_data(stor)
+
+    data = path.read_bytes()
+    for bad in (b'', b'NOTASNAPSHOT' * 2, data[:-1]):
+        assert not Serial(mkstor()).import_snapshot(io.BytesIO(bad))
@@ -1,7 +1,9 @@
 import contacto.storage as storage
-from contacto.helpers import DType
-from helpers import mkstor, fixture
+from contacto.helpers import DType, BlobHandle, attr_val_str, size_str
+from contacto.helpers import refid_to_bytes
+from helpers import mkstor, mkdb, fixture, db
 import pytest
+import sqlite3
 
 
 @pytest.fixture
@@ -106,3 +108,635 @@ def test_storage(stor):
     stor.reload()
     for name in names:
         assert stor.get_group(name)
+
+
+def test_lazy_storage():
+    mkdb('test')
+    stor = storage.Storage(str(db), lazy=True)
+    assert stor._groups is None
+    fam = stor.get_group('Family')
+    assert fam._entities is None and stor.get_group('Friends')
+
+    web = stor.get_attribute('Family', 'Dad', 'web')
+    assert web.get() == (DType.TEXT, 'https://github.com')
+    assert stor.get_group('Friends')._entities is None
+
+    # XREF targets are loaded on demand, referrers are read from DB
+    dad, mom = fam.entities['Dad'], fam.entities['Mom']
+    assert dad.attributes['spouse'].data is mom
+    assert dad.attributes['spouse'] in mom.refs
+
+    # cascade reaches referrers that were never loaded
+    stor = storage.Storage(str(db), lazy=True)
+    assert stor.get_attribute('Family', 'Mom', 'catpic').delete_safe()
+    eager = storage.Storage(str(db))
+    assert not eager.get_attribute('Family', 'Dad', 'catpic')
+    assert not eager.get_attribute('Family', 'Dad', 'thumbnail')
+    assert not eager.get_entity('Family', 'Dad').thumbnail
+
+
+def test_deferred_blobs(stor):
+    thumb = fixture('cat.jpg').read_bytes()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    assert ent.create_attribute_safe('thumbnail', DType.BIN, thumb)
+    stor.reload()
+
+    ent = stor.get_entity('G', 'E')
+    attr = ent.attributes['thumbnail']
+    _, handle = attr.get(deferred=True)
+    assert isinstance(handle, BlobHandle) and len(handle) == len(thumb)
+    assert isinstance(ent._thumbnail, BlobHandle)
+
+    # size is known without reading the data
+    handle.read = None
+    assert attr_val_str(attr, False) == f"<BINARY, {size_str(thumb)}>"
+    del handle.read
+
+    assert b''.join(handle.chunks(1000)) == thumb
+    assert attr.data == thumb and ent.thumbnail == thumb
+    assert attr_val_str(attr, True) == thumb
+
+    # renaming keeps stored data in place
+    attr.name = 'thumbnail2'
+    assert attr.update_safe() and attr.data == thumb
+
+    # a thumbnail without its attribute is dropped without reading it
+    sql = "UPDATE attribute SET name='pic' WHERE name='thumbnail'"
+    stor.db_conn.execute(sql)
+    stor.reload()
+    ent = stor.get_entity('G', 'E')
+    assert 'thumbnail' not in ent.attributes
+    ent._thumbnail.read = None
+    ent.thumbnail_from_attr()
+    assert ent._thumbnail is None
+
+
+def test_bulk_import(stor):
+    thumb = fixture('cat.jpg').read_bytes()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    old = ent.create_attribute_safe('old', DType.TEXT, 'old')
+    ref = ent.create_attribute_safe('ref', DType.AXREF, old)
+
+    rows = [
+        ('Bare', None, None, None, None),
+        ('G', 'Bare', None, None, None),
+        # forward references resolve after all data is written
+        ('G', 'E', 'thumbnail', DType.AXREF, ('H', 'F', 'pic')),
+        ('G', 'E', 'spouse', DType.EXREF, ('H', 'F', None)),
+        ('G', 'E', 'old', DType.TEXT, 'new'),
+        ('H', 'F', 'pic', DType.BIN, thumb),
+    ]
+    with stor.db_conn:
+        assert stor.bulk_import(rows) == 3 + 1
+    assert stor.get_group('Bare') and stor.get_entity('G', 'Bare')
+    ent = stor.get_entity('G', 'E')
+    assert ent.thumbnail == thumb
+    assert ent.attributes['spouse'].data is stor.get_entity('H', 'F')
+    # updated attributes keep their identity
+    assert ent.attributes['old'].id == old.id
+    assert ent.attributes['ref'].get() == (DType.TEXT, 'new')
+
+    bad = [
+        [('G', 'E', 'ref2', DType.AXREF, ('G', 'E', 'nope'))],
+        [('G', 'E', 'old', DType.AXREF, ('G', 'E', 'ref'))],
+        [('G', 'E/F', None, None, None)],
+    ]
+    for rows in bad:
+        with pytest.raises(Exception):
+            with stor.db_conn:
+                stor.bulk_import(rows)
+        stor.reload()
+        assert stor.get_attribute('G', 'E', 'old').data == 'new'
+        assert not stor.get_attribute('G', 'E', 'ref2')
+
+
+def blob_rows(stor):
+    sql = 'SELECT hash, refcount FROM blob'
+    return dict(stor.db_conn.execute(sql).fetchall())
+
+
+def test_shared_blobs(stor):
+    thumb = fixture('cat.jpg').read_bytes()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    pic = ent.create_attribute_safe('pic', DType.BIN, thumb)
+    # the entity thumbnail shares the blob as well
+    assert ent.create_attribute_safe('thumbnail', DType.BIN, thumb)
+    assert ent.thumbnail == thumb
+    assert blob_rows(stor) == {pic.get(deferred=True)[1].digest: 3}
+
+    # history copies the hash only
+    assert pic.rotate_safe() and pic.rotate_safe()
+    assert list(blob_rows(stor).values()) == [5]
+    stats = stor.blob_stats()
+    assert stats['blobs'] == 1 and stats['stored'] == len(thumb)
+    assert stats['saved'] == 4 * len(thumb)
+
+    pic.data = b'other'
+    assert pic.update_safe()
+    assert sorted(blob_rows(stor).values()) == [1, 4]
+    assert ent.delete_safe()
+    assert not blob_rows(stor) and not stor.blob_stats()['stored']
+
+
+def test_image_cache(tmp_path, monkeypatch):
+    thumb = fixture('cat.jpg').read_bytes()
+    validated = []
+
+    def validate_img(data):
+        validated.append(data)
+        return data == thumb
+
+    monkeypatch.setattr(storage, 'validate_img', validate_img)
+    path = str(tmp_path / 'img.db')
+    stor = storage.Storage(path)
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    pic = ent.create_attribute_safe('pic', DType.BIN, thumb)
+    assert ent.create_attribute_safe('thumbnail', DType.AXREF, pic)
+    assert ent.thumbnail == thumb
+    # updates and rotations of the same blob are not validated again
+    for _ in range(3):
+        pic.data = b'other' if pic.data == thumb else thumb
+        assert pic.rotate_safe() and pic.update_safe()
+    assert pic.data == b'other' and ent.thumbnail == thumb
+    assert not stor.is_image(b'other')
+    assert len(validated) == 2
+
+    # results are kept in the DB
+    stor = storage.Storage(path)
+    assert stor.is_image(thumb) and len(validated) == 2
+    ent = stor.get_entity('G', 'E')
+    ent.attributes['pic'].data = b'new'
+    assert ent.attributes['pic'].update_safe()
+    assert len(validated) == 3
+
+
+def test_deferred_thumbnails(stor):
+    thumb = fixture('cat.jpg').read_bytes()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    ent2 = stor.get_group('G').create_entity_safe('E2')
+    stor.defer_thumbnails(True)
+    with stor.db_conn:
+        for e in (ent, ent2):
+            e.create_attribute('thumbnail', DType.BIN, thumb)
+        assert not ent.thumbnail and stor.thumbs_pending == {ent.id, ent2.id}
+        ent2.delete()
+        stor.validate_thumbnails()
+    assert ent.thumbnail == thumb and not stor.thumbs_pending
+
+    # pending Entities are dropped with deferred mode
+    ent3 = stor.get_group('G').create_entity_safe('E3')
+    assert ent3.create_attribute_safe('thumbnail', DType.BIN, thumb)
+    stor.defer_thumbnails(False)
+    assert not ent3.thumbnail and stor.thumbs_pending is None
+
+
+def variant_rows(stor):
+    sql = 'SELECT hash, size FROM thumbnail_variant'
+    return stor.db_conn.execute(sql).fetchall()
+
+
+def test_thumbnail_variants(stor):
+    from PIL import Image
+    import io
+    thumb = fixture('cat.jpg').read_bytes()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    assert ent.create_attribute_safe('thumbnail', DType.BIN, thumb)
+    digest = ent.get_thumbnail(deferred=True).digest
+    # variants are made after the write
+    assert not variant_rows(stor) and stor.variants_pending == {digest}
+    assert ent.get_thumbnail(size=64) == thumb
+    with stor.db_conn:
+        assert stor.make_pending_variants() == 1
+    assert sorted(variant_rows(stor)) == [(digest, 64), (digest, 256)]
+    assert not stor.variants_pending
+    small = ent.get_thumbnail(size=32)
+    assert max(Image.open(io.BytesIO(small)).size) == 64
+    assert ent.get_thumbnail(size=100) == stor.thumbnail_variant(digest, 256)
+    assert ent.get_thumbnail(size=1000) == thumb
+
+    # variants go with the blob
+    assert ent.attributes['thumbnail'].delete_safe()
+    assert not ent.thumbnail and not variant_rows(stor)
+
+    # bulk jobs downscale in worker processes
+    images = []
+    for quality in range(50, 50 + storage.VARIANT_POOL_MIN):
+        bio = io.BytesIO()
+        Image.open(io.BytesIO(thumb)).save(bio, 'JPEG', quality=quality)
+        images.append(bio.getvalue())
+    rows = [('H', f"E{i}", 'thumbnail', DType.BIN, img)
+            for i, img in enumerate(images + [b'junk'])]
+    with stor.db_conn:
+        stor.bulk_import(rows)
+    assert len(variant_rows(stor)) == 2 * len(images)
+    assert not stor.is_image(b'junk')
+    with stor.db_conn:
+        stor.db_conn.execute('DELETE FROM thumbnail_variant')
+        assert stor.make_variants(workers=0) == len(images)
+        assert not stor.make_variants()
+
+
+def test_blob_migration(tmp_path):
+    thumb = fixture('cat.jpg').read_bytes()
+    path = str(tmp_path / 'old.db')
+    # schema version 0 stores binary data inline
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE "group" (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE entity (id INTEGER PRIMARY KEY, name TEXT,
+                             thumbnail BLOB, group_id INTEGER);
+        CREATE TABLE attribute (id INTEGER PRIMARY KEY, name TEXT,
+                                type INTEGER, data BLOB, entity_id INTEGER);
+        INSERT INTO "group" VALUES (1, 'G');
+    ''')
+    conn.execute('INSERT INTO entity VALUES (1, ?, ?, 1)', ['E', thumb])
+    for aid, name in enumerate(['thumbnail', 'thumbnail_1', 'text']):
+        dtype = DType.TEXT if name == 'text' else DType.BIN
+        data = b'text' if name == 'text' else thumb
+        conn.execute('INSERT INTO attribute VALUES (?, ?, ?, ?, 1)',
+                     (aid, name, dtype, data))
+    conn.commit()
+    conn.close()
+
+    stor = storage.Storage(path)
+    ent = stor.get_entity('G', 'E')
+    assert ent.thumbnail == thumb
+    assert ent.attributes['thumbnail_1'].data == thumb
+    assert ent.attributes['text'].data == 'text'
+    assert list(blob_rows(stor).values()) == [3]
+    assert stor.blob_stats()['saved'] == 2 * len(thumb)
+    version = stor.db_conn.execute('PRAGMA user_version').fetchone()[0]
+    assert version == storage.SCHEMA_VERSION
+    # reopening does not migrate again
+    assert storage.Storage(path).get_entity('G', 'E').thumbnail == thumb
+
+
+def test_ref_migration(tmp_path):
+    path = str(tmp_path / 'old.db')
+    # XREF targets are only stored packed in the attribute data
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE "group" (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE entity (id INTEGER PRIMARY KEY, name TEXT,
+                             thumbnail BLOB, group_id INTEGER);
+        CREATE TABLE attribute (id INTEGER PRIMARY KEY, name TEXT,
+                                type INTEGER, data BLOB, entity_id INTEGER);
+        INSERT INTO "group" VALUES (1, 'G');
+        INSERT INTO entity VALUES (70000, 'E', NULL, 1);
+    ''')
+    rows = [(1, 'text', DType.TEXT, b'text'),
+            (300, 'ex', DType.EXREF, refid_to_bytes(70000)),
+            (2, 'ax', DType.AXREF, refid_to_bytes(300))]
+    conn.executemany('INSERT INTO attribute VALUES (?, ?, ?, ?, 70000)',
+                     rows)
+    conn.commit()
+    conn.close()
+
+    stor = storage.Storage(path, lazy=True)
+    sql = 'SELECT id, ref_id FROM attribute ORDER BY id'
+    assert stor.db_conn.execute(sql).fetchall() == \
+        [(1, None), (2, 300), (300, 70000)]
+    ent = stor.get_entity('G', 'E')
+    assert ent.refs == {ent.attributes['ex']}
+    assert ent.attributes['ex'].refs == {ent.attributes['ax']}
+    assert stor.backlinks(ent, transitive=True) == ['G/E/ax', 'G/E/ex']
+
+    # the column follows inserts and updates of the migrated DB
+    ax = ent.attributes['ax']
+    ax.type, ax.data = DType.TEXT, 'text'
+    ax.update_safe()
+    ent.create_attribute_safe('ax2', DType.AXREF, ent.attributes['text'])
+    assert stor.db_conn.execute(sql).fetchall() == \
+        [(1, None), (2, None), (300, 70000), (301, 1)]
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_backlinks(lazy):
+    mkdb('test')
+    stor = storage.Storage(str(db), lazy=lazy)
+    dad = stor.get_entity('Family', 'Dad')
+    mom = stor.get_entity('Family', 'Mom')
+    catpic = mom.attributes['catpic']
+    assert stor.backlinks(mom) == ['Family/Dad/spouse']
+    assert stor.backlinks(catpic) == ['Family/Dad/catpic']
+    assert stor.backlinks(catpic, transitive=True) == \
+        ['Family/Dad/catpic', 'Family/Dad/thumbnail']
+    assert stor.backlinks(dad) == []
+    assert dad.attributes['spouse'].delete_safe()
+    assert stor.backlinks(mom) == []
+
+
+def test_profiles(tmp_path):
+    path = str(tmp_path / 'wal.db')
+    stor = storage.Storage(path, profile='wal')
+    pragma = stor.db_conn.execute
+    assert pragma('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert pragma('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert pragma('PRAGMA temp_store').fetchone()[0] == 2  # MEMORY
+    assert pragma('PRAGMA busy_timeout').fetchone()[0] == 10000
+
+    # a reader is not blocked by an open write transaction
+    stor.create_group_safe('G')
+    stor.db_conn.execute('INSERT INTO "group" VALUES (NULL, ?)', ['H'])
+    reader = storage.Storage(path, lazy=True, profile='wal')
+    assert list(reader.groups) == ['G']
+    stor.db_conn.commit()
+
+    with pytest.raises(Exception):
+        storage.Storage(path, profile='nope')
+
+
+def test_changes(stor):
+    assert stor.last_change() == 0
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    attr = ent.create_attribute_safe('a', DType.TEXT, 'x')
+    since = stor.last_change()
+    assert [c[1:] for c in stor.changes()] == [
+        ('I', storage.Scope.GROUP, ent.parent.id, 'G'),
+        ('I', storage.Scope.ENTITY, ent.id, 'G/E'),
+        ('I', storage.Scope.ATTRIBUTE, attr.id, 'G/E/a'),
+    ]
+
+    # saving unchanged data is not a change
+    assert attr.update_safe() and ent.update_safe()
+    attr.data = 'y'
+    assert attr.update_safe() and ent.delete_safe()
+    changes = list(stor.changes(since))
+    assert [seq for seq, *_ in changes] == \
+        list(range(since + 1, since + 4))
+    assert [(op, rspec) for _, op, _, _, rspec in changes] == [
+        ('U', 'G/E/a'), ('D', 'G/E/a'), ('D', 'G/E')]
+
+    # subtree deletes log the children and referrers first
+    grp = stor.create_group_safe('H')
+    ent = grp.create_entity_safe('E')
+    attr = ent.create_attribute_safe('a', DType.TEXT, 'x')
+    ref = stor.get_group('G').create_entity_safe('R')
+    ax = ref.create_attribute_safe('ax', DType.AXREF, attr)
+    ex = ref.create_attribute_safe('ex', DType.EXREF, ent)
+    since = stor.last_change()
+    assert grp.delete_safe()
+    changes = [c[1:] for c in stor.changes(since)]
+    assert sorted(changes[:3]) == sorted([
+        ('D', storage.Scope.ATTRIBUTE, attr.id, 'H/E/a'),
+        ('D', storage.Scope.ATTRIBUTE, ax.id, 'G/R/ax'),
+        ('D', storage.Scope.ATTRIBUTE, ex.id, 'G/R/ex')])
+    assert changes[3:] == [
+        ('D', storage.Scope.ENTITY, ent.id, 'H/E'),
+        ('D', storage.Scope.GROUP, grp.id, 'H')]
+
+    # cascaded deletes are implied by their parent's
+    since = stor.last_change()
+    ent = stor.get_group('G').create_entity_safe('F')
+    ent.create_attribute_safe('a', DType.TEXT, 'x')
+    stor.db_conn.execute('DELETE FROM "group"')
+    assert [c[1:] for c in stor.changes(since)][2:] == [
+        ('D', storage.Scope.GROUP, ent.parent.id, 'G')]
+
+
+def test_xref_cache(stor):
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    base = ent.create_attribute_safe('base', DType.TEXT, 'base')
+    other = ent.create_attribute_safe('other', DType.TEXT, 'other')
+    chain = [base]
+    for i in range(5):
+        chain.append(ent.create_attribute_safe(f"r{i}", DType.AXREF,
+                                               chain[-1]))
+    head = chain[-1]
+    assert head.get() == (DType.TEXT, 'base')
+    assert all(link._target is base for link in chain)
+    # the chain end may become a link too
+    base.type, base.data = DType.AXREF, other
+    assert base.update_safe()
+    assert head.get() == (DType.TEXT, 'other')
+    base.type, base.data = DType.TEXT, 'base'
+    assert base.update_safe()
+
+    # update: a link is retargeted, then replaced by data
+    chain[2].data = other
+    assert chain[2].update_safe()
+    assert head.get() == (DType.TEXT, 'other')
+    assert chain[1].get() == (DType.TEXT, 'base')
+    chain[2].type, chain[2].data = DType.TEXT, 'mid'
+    assert chain[2].update_safe()
+    assert head.get() == (DType.TEXT, 'mid')
+
+    # rotate: history keeps resolved values
+    assert chain[3].rotate_safe()
+    assert ent.attributes['r2_1'].get() == (DType.TEXT, 'mid')
+    assert not ent.create_attribute_safe('ref', DType.AXREF,
+                                         ent.attributes['r2_1'])
+    chain[2].data = 'newer'
+    assert chain[2].update_safe()
+    assert ent.attributes['r2_1'].get() == (DType.TEXT, 'mid')
+    assert head.get() == (DType.TEXT, 'newer')
+
+    # merge: referrers are redirected to the merge target
+    assert other.merge_safe(chain[2])
+    assert head.get() == (DType.TEXT, 'newer') and head.target is other
+    assert other.merge_safe(ent.create_attribute_safe('x', DType.EXREF, ent))
+    assert head.get() == (DType.TEXT, 'G/E')
+
+    # delete: cached referrers are deleted along
+    assert other.delete_safe()
+    assert 'r4' not in ent.attributes and head._target is None
+
+
+def test_lazy_xref_cache():
+    mkdb('test')
+    stor = storage.Storage(str(db), lazy=True)
+    dad = stor.get_entity('Family', 'Dad')
+    thumb = dad.attributes['thumbnail']
+    link = thumb.data
+    assert thumb.get() == link.get() and thumb.target is link.data
+    # the link has not loaded its referrers, they are found in DB
+    assert link._refs is None
+    link.type, link.data = DType.TEXT, 'no cat'
+    assert link.update_safe()
+    assert thumb.get() == (DType.TEXT, 'no cat')
+
+
+def test_loops(stor):
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    chain = [ent.create_attribute_safe('a0', DType.TEXT, 'x')]
+    for i in range(1, 4):
+        chain.append(ent.create_attribute_safe(f"a{i}", DType.AXREF,
+                                               chain[-1]))
+    assert chain[-1].get() == (DType.TEXT, 'x')
+    # cached chains are checked as well
+    chain[0].type, chain[0].data = DType.AXREF, chain[2]
+    assert not chain[0].update_safe()
+    assert stor.get_attribute('G', 'E', 'a0').type is DType.TEXT
+    assert stor.check_loops() == []
+
+    # all loops in the DB are reported at once
+    other = ent.create_attribute_safe('b0', DType.AXREF, chain[0])
+    sql = 'UPDATE attribute SET type=?, data=? WHERE id=?'
+    stor.db_conn.execute(sql, (DType.AXREF, refid_to_bytes(chain[2].id),
+                               chain[0].id))
+    stor.db_conn.execute(sql, (DType.AXREF, refid_to_bytes(other.id),
+                               other.id))
+    loops = ['G/E/a0', 'G/E/a1', 'G/E/a2', 'G/E/b0']
+    assert stor.check_loops() == loops
+    assert stor.check_loops([chain[3].id]) == loops[:3]
+    with pytest.raises(Exception, match=', '.join(loops)):
+        stor.reload()
+
+
+def test_history(tmp_path):
+    stor = storage.Storage(str(tmp_path / 'history.db'))
+    thumb = fixture('cat.jpg').read_bytes()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    attr = ent.create_attribute_safe('A', DType.TEXT, 'v0')
+    for i in range(1, 6):
+        assert attr.rotate_safe()
+        attr.data = f"v{i}"
+        assert attr.update_safe()
+    # history is append-only, entries are named by age
+    versions = 'SELECT version FROM attribute_history ORDER BY id'
+    assert [v for v, in stor.db_conn.execute(versions)] == [1, 2, 3, 4, 5]
+    assert [ent.attributes[f"A_{i}"].data for i in range(1, 6)] == \
+        ['v4', 'v3', 'v2', 'v1', 'v0']
+    assert not ent.attributes['A_1'].update_safe()
+    assert not ent.create_attribute_safe('R', DType.AXREF,
+                                         ent.attributes['A_1'])
+
+    # retention and deletion of single entries
+    assert attr.rotate_safe(keep=3)
+    assert 'A_4' not in ent.attributes
+    assert ent.attributes['A_2'].delete_safe()
+    assert [ent.attributes[f"A_{i}"].data for i in (1, 2)] == ['v5', 'v3']
+
+    # history is stored, views of it are listed when loaded
+    stor.db_conn.commit()
+    for lazy in (False, True):
+        loaded = storage.Storage(stor.db_file, lazy=lazy)
+        assert loaded.get_attribute('G', 'E', 'A_2').data == 'v3'
+
+    # binary data are shared, XREFs are kept resolved
+    pic = ent.create_attribute_safe('pic', DType.BIN, thumb)
+    ref = ent.create_attribute_safe('ref', DType.AXREF, pic)
+    assert ref.rotate_safe() and pic.rotate_safe()
+    assert ent.attributes['ref_1'].get() == (DType.BIN, thumb)
+    assert list(blob_rows(stor).values()) == [3]
+
+    # merging moves history, deleting deletes it
+    other = ent.create_attribute_safe('B', DType.TEXT, 'b0')
+    assert other.rotate_safe()
+    assert attr.merge_safe(other)
+    assert [ent.attributes[f"A_{i}"].data for i in (1, 2, 3)] == \
+        ['b0', 'v5', 'v3']
+    assert 'B_1' not in ent.attributes
+
+    # deleting keeps the history as Attributes, logged as inserts
+    since = stor.last_change()
+    assert ref.delete_safe() and pic.delete_safe() and attr.delete_safe()
+    assert not stor.db_conn.execute(versions).fetchall()
+    kept = {'A_1': 'b0', 'A_2': 'v5', 'A_3': 'v3',
+            'pic_1': thumb, 'ref_1': thumb}
+    assert {n: a.data for n, a in ent.attributes.items()} == kept
+    assert not any(isinstance(a, storage.HistoryAttribute)
+                   for a in ent.attributes.values())
+    assert list(blob_rows(stor).values()) == [2]
+    assert [(op, rspec) for _, op, _, _, rspec in stor.changes(since)] == \
+        [('I', 'G/E/ref_1'), ('D', 'G/E/ref'), ('I', 'G/E/pic_1'),
+         ('D', 'G/E/pic'), ('I', 'G/E/A_1'), ('I', 'G/E/A_2'),
+         ('I', 'G/E/A_3'), ('D', 'G/E/A')]
+    stor.db_conn.commit()
+    loaded = storage.Storage(stor.db_file).get_entity('G', 'E')
+    assert {n: a.data for n, a in loaded.attributes.items()} == kept
+
+    # history goes with its Entity
+    assert ent.attributes['A_1'].rotate_safe()
+    assert stor.db_conn.execute(versions).fetchall()
+    assert ent.delete_safe()
+    assert not stor.db_conn.execute(versions).fetchall()
+    assert not blob_rows(stor)
+
+
+def test_history_absorption(stor):
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    attr = ent.create_attribute_safe('A', DType.TEXT, 'v2')
+    # history kept as Attributes by older versions
+    ent.create_attribute_safe('A_1', DType.TEXT, 'v1')
+    ent.create_attribute_safe('A_2', DType.TEXT, 'v0')
+    assert attr.rotate_safe()
+    assert [ent.attributes[f"A_{i}"].data for i in (1, 2, 3)] == \
+        ['v2', 'v1', 'v0']
+    sql = 'SELECT count(*) FROM attribute'
+    assert stor.db_conn.execute(sql).fetchone()[0] == 1
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_delete_tree(tmp_path, lazy):
+    path = str(tmp_path / 'tree.db')
+    stor = storage.Storage(path)
+    doomed = stor.create_group_safe('G').create_entity_safe('E')
+    pic = doomed.create_attribute_safe('pic', DType.BIN,
+                                       fixture('cat.jpg').read_bytes())
+    ent = stor.create_group_safe('H').create_entity_safe('F')
+    keep = ent.create_attribute_safe('keep', DType.TEXT, 'x')
+    doomed.create_attribute_safe('out', DType.AXREF, keep)
+    ent.create_attribute_safe('ex', DType.EXREF, doomed)
+    ent.create_attribute_safe('ax', DType.AXREF, pic)
+    ent.create_attribute_safe('ax2', DType.AXREF, ent.attributes['ax'])
+    ent.create_attribute_safe('thumbnail', DType.AXREF,
+                              ent.attributes['ax2'])
+    assert ent.thumbnail
+
+    stor = storage.Storage(path, lazy=lazy)
+    ent = stor.get_entity('H', 'F')
+    keep = ent.attributes['keep']
+    assert keep.refs and ent.thumbnail
+    assert stor.get_group('G').delete_safe()
+    assert 'G' not in stor.groups
+    assert set(ent.attributes) == {'keep'} and not keep.refs
+    assert not ent.thumbnail
+
+    stor = storage.Storage(path)
+    assert set(stor.groups) == {'H'}
+    assert set(stor.get_entity('H', 'F').attributes) == {'keep'}
+    assert not stor.get_entity('H', 'F').thumbnail
+    assert not blob_rows(stor)
+    deleted = [rspec for _, op, _, _, rspec in stor.changes() if op == 'D']
+    assert set(deleted) >= {'H/F/ex', 'H/F/ax', 'H/F/ax2', 'H/F/thumbnail',
+                            'G/E/pic', 'G/E', 'G'}
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_merge_tree(tmp_path, lazy):
+    path = str(tmp_path / 'tree.db')
+    stor = storage.Storage(path)
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    ent.create_attribute_safe('a', DType.TEXT, 'a1').rotate_safe()
+    other = stor.create_group_safe('H').create_entity_safe('E')
+    attr = other.create_attribute_safe('a', DType.TEXT, 'b1')
+    attr.rotate_safe()
+    attr.data = 'b2'
+    assert attr.update_safe()
+    other.create_attribute_safe('m', DType.AXREF, attr)
+    other.create_attribute_safe('thumbnail', DType.BIN,
+                                fixture('cat.jpg').read_bytes())
+    other.parent.create_entity_safe('F')
+    ref = stor.create_group_safe('R').create_entity_safe('X')
+    ref.create_attribute_safe('ax', DType.AXREF, attr)
+    ref.create_attribute_safe('ex', DType.EXREF, other)
+    ref.create_attribute_safe('moved', DType.AXREF, other.attributes['m'])
+
+    stor = storage.Storage(path, lazy=lazy)
+    ref = stor.get_entity('R', 'X')
+    assert ref.attributes['ax'].get() == (DType.TEXT, 'b2')
+    assert stor.get_group('G').merge_safe(stor.get_group('H'))
+    for stor in (stor, storage.Storage(path)):
+        assert set(stor.groups) == {'G', 'R'}
+        grp, ref = stor.get_group('G'), stor.get_entity('R', 'X')
+        ent = grp.entities['E']
+        assert set(grp.entities) == {'E', 'F'}
+        assert ent.thumbnail == fixture('cat.jpg').read_bytes()
+        assert [ent.attributes[n].data for n in ('a', 'a_1', 'a_2')] == \
+            ['b2', 'b1', 'a1']
+        assert ent.attributes['m'].data is ent.attributes['a']
+        assert ref.attributes['ax'].data is ent.attributes['a']
+        assert ref.attributes['ax'] in ent.attributes['a'].refs
+        assert ref.attributes['ex'].data is ent
+        assert ref.attributes['moved'].get() == (DType.TEXT, 'b2')
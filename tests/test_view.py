@@ -1,6 +1,7 @@
 from helpers import mkstor, yml_fixture
 from contacto.serial import Serial
 from contacto.view import View
+from contacto.helpers import DType, fmatch
 import pytest
 
 
@@ -64,3 +65,108 @@ def test_all(view):
     view.filter()
     assert 'Friends' in view.groups and len(view.groups) == 1
     assert 'Nappo Bappo' in view.groups['Friends'].entities
+
+
+def found(view):
+    return {
+        str(attr)
+        for grp in view.groups.values()
+        for ent in grp.entities.values()
+        for attr in ent.attributes.values()
+    }
+
+
+def scan(stor, needle, fuzzy):
+    res = set()
+    for grp in stor.groups.values():
+        for ent in grp.entities.values():
+            for attr in ent.attributes.values():
+                dtype, val = attr.get()
+                if dtype is DType.TEXT and \
+                        (fmatch(needle, val) if fuzzy else needle == val):
+                    res.add(str(attr))
+    return res
+
+
+def test_indexed_value_filters(view):
+    stor = view.storage
+    assert stor.fts
+    # plain values, AXREF chains and EXREF refspecs
+    queries = [('GITHUB', True), ('family/mo', True), ('Las Vegas', False),
+               ('45', False), ('Family/Mom', False), ('ab', True)]
+    for needle, fuzzy in queries:
+        view.reset()
+        view.set_attr_value_filter(needle, fuzzy)
+        view.filter()
+        assert found(view) == scan(stor, needle, fuzzy)
+    assert 'Family/Dad/web' in scan(stor, 'github', True)
+
+    # the index follows value changes
+    web = stor.get_attribute('Family', 'Mom', 'web')
+    web.data = 'https://gitlab.com'
+    assert web.update_safe()
+    assert stor.match_attribute_ids('github', True) == set()
+    assert stor.match_attribute_ids('gitlab', True) == {
+        web.id, stor.get_attribute('Family', 'Dad', 'web').id}
+    assert web.delete_safe()
+    assert stor.match_attribute_ids('gitlab', True) == set()
+
+
+def test_indexed_casefold(view):
+    stor = view.storage
+    assert stor.fts
+    mom = stor.get_entity('Family', 'Mom')
+    street = mom.create_attribute_safe('street', DType.TEXT, 'Hauptstraße')
+    city = mom.create_attribute_safe('city', DType.TEXT, 'İstanbul')
+    # casefold() changes the length, unlike the index case folding
+    for needle, attr in (('STRASSE', street), ('i̇stanbul', city)):
+        assert stor.match_attribute_ids(needle, True) == {attr.id}
+        assert scan(stor, needle, True) == {str(attr)}
+
+
+def test_query_plan(view):
+    view.set_index_filters(('Family', 'Dad', 'age'))
+    sql, params = view.query()
+    conn = view.storage.db_conn
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    assert not any(row[-1].startswith('SCAN') for row in plan)
+
+    view.filter()
+    assert found(view) == {'Family/Dad/age'}
+
+
+def test_custom_predicates(view):
+    view.set_value_predicates((None, lambda e: e.name.startswith('B'), None))
+    view.filter()
+    assert set(view.groups) == {'BareEntGrp'}
+    assert 'BareEnt' in view.groups['BareEntGrp'].entities
+
+    view.reset()
+    view.set_index_filters(('BareGrp', None, None))
+    view.filter()
+    assert set(view.groups) == {'BareGrp'}
+
+    view.reset()
+    view.set_name_filters((None, 'a', None))
+    view.set_value_predicates((None, None, lambda a: a.type is DType.BIN))
+    view.filter()
+    assert found(view) == {'Friends/Albatros/url_bin'}
+
+
+def test_change_filter(view):
+    stor = view.storage
+    since = stor.last_change()
+    view.set_change_filter(since)
+    assert not view.empty()
+    view.filter()
+    assert not view.groups
+
+    age = stor.get_attribute('Family', 'Dad', 'age')
+    age.data = '46'
+    assert age.update_safe()
+    ent = stor.get_group('Friends').create_entity_safe('New')
+    ent.create_attribute_safe('a', DType.TEXT, 'x')
+    assert stor.create_group_safe('Empty')
+    view.filter()
+    assert found(view) == {'Family/Dad/age', 'Friends/New/a'}
+    assert not view.groups['Empty'].entities
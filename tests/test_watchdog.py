@@ -0,0 +1,226 @@
+from helpers import mkstor, fixture
+from contacto.helpers import DType
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import functools
+import hashlib
+import os
+import pathlib
+import sys
+import threading
+import time
+import pytest
+from urllib.request import urlopen
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'plugins'))
+import contacto_watchdog as watchdog  # noqa: E402
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    handler = functools.partial(QuietHandler, directory=str(tmp_path))
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield tmp_path, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_watchdog(server, monkeypatch):
+    root, url = server
+    thumb = fixture('cat.jpg').read_bytes()
+    (root / 'cat.jpg').write_bytes(thumb)
+    (root / 'bio.txt').write_text('Žluťoučký kůň', encoding='utf-8')
+
+    stor = mkstor()
+    grp = stor.create_group_safe('G')
+    for i in range(20):
+        ent = grp.create_entity_safe(f"E{i}")
+        ent.create_attribute_safe('thumbnail_source', DType.TEXT,
+                                  f"{url}/cat.jpg")
+        ent.create_attribute_safe('bio_textsource*', DType.TEXT,
+                                  f"{url}/bio.txt")
+    ent.create_attribute_safe('gone_source', DType.TEXT, f"{url}/gone")
+
+    monkeypatch.setattr(watchdog, 'BATCH_SIZE', 7)
+    # one source is missing, the rest is applied
+    assert not watchdog.plugin_init(stor)
+    for ent in grp.entities.values():
+        assert ent.thumbnail == thumb
+        assert ent.attributes['bio'].get() == \
+            (DType.TEXT, 'Žluťoučký kůň')
+    assert 'gone' not in ent.attributes
+
+    ent.attributes['gone_source'].delete_safe()
+    (root / 'bio.txt').write_text('new bio', encoding='utf-8')
+    # Last-Modified has a resolution of seconds
+    mtime = time.time() + 10
+    os.utime(root / 'bio.txt', (mtime, mtime))
+    assert watchdog.plugin_init(stor)
+    assert ent.attributes['bio'].data == 'new bio'
+    assert ent.attributes['bio_1'].data == 'Žluťoučký kůň'
+    # unchanged data is not rotated
+    assert watchdog.plugin_init(stor)
+    assert 'bio_2' not in ent.attributes
+
+
+def test_host_limit(server, monkeypatch):
+    root, url = server
+    (root / 'a.txt').write_text('a')
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def counting_urlopen(*args, **kwargs):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.01)
+        try:
+            return urlopen(*args, **kwargs)
+        finally:
+            with lock:
+                active -= 1
+
+    monkeypatch.setattr(watchdog, 'urlopen', counting_urlopen)
+    monkeypatch.setattr(watchdog, 'MAX_PER_HOST', 2)
+    source = watchdog.Source(('G', 'E'), 1, f"{url}/a.txt", 'a', True,
+                             False, None)
+    results = list(watchdog.fetch_all([source] * 30))
+    assert len(results) == 30 and all(r.data == 'a' for _, r in results)
+    assert peak == 2
+
+
+class ETagHandler(QuietHandler):
+    """Serves files with an ETag, revalidates using If-None-Match only"""
+    sent = []
+
+    def send_head(self):
+        path = pathlib.Path(self.translate_path(self.path))
+        if not path.is_file():
+            self.send_error(404)
+            return None
+        data = path.read_bytes()
+        etag = f'"{hashlib.sha256(data).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+        self.sent.append(self.path)
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        return open(path, 'rb')
+
+
+def source_meta(stor):
+    sql = 'SELECT attribute_id, etag, fetched_at FROM watchdog_source'
+    return {aid: meta for aid, *meta in stor.db_conn.execute(sql)}
+
+
+def test_revalidation(tmp_path, monkeypatch):
+    handler = functools.partial(ETagHandler, directory=str(tmp_path))
+    monkeypatch.setattr(ETagHandler, 'sent', [])
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    (tmp_path / 'a.txt').write_text('a')
+
+    stor = mkstor()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    src = ent.create_attribute_safe('a_textsource*', DType.TEXT,
+                                    f"{url}/a.txt")
+    slow = ent.create_attribute_safe('b_textsource', DType.TEXT,
+                                     f"{url}/a.txt")
+    ent.create_attribute_safe('b_interval', DType.TEXT, '3600')
+    try:
+        assert watchdog.plugin_init(stor)
+        assert ETagHandler.sent == ['/a.txt'] * 2
+        meta = source_meta(stor)
+        assert set(meta) == {src.id, slow.id}
+
+        # not modified, nothing is downloaded nor written
+        changes = stor.db_conn.total_changes
+        assert watchdog.plugin_init(stor)
+        assert ETagHandler.sent == ['/a.txt'] * 2
+        assert stor.db_conn.total_changes == changes + 1
+        assert source_meta(stor)[slow.id] == meta[slow.id]
+        etag, fetched_at = source_meta(stor)[src.id]
+        assert etag == meta[src.id][0] and fetched_at > meta[src.id][1]
+
+        # only sources past their interval are refreshed
+        (tmp_path / 'a.txt').write_text('b')
+        assert watchdog.plugin_init(stor)
+        assert ETagHandler.sent == ['/a.txt'] * 3
+        assert ent.attributes['a'].data == 'b'
+        assert ent.attributes['a_1'].data == 'a'
+        assert ent.attributes['b'].data == 'a'
+
+        # a changed URL discards the metadata
+        slow.data = f"{url}/a.txt?v=2"
+        assert slow.update_safe() and watchdog.plugin_init(stor)
+        assert ent.attributes['b'].data == 'b'
+
+        # deleted targets are downloaded again, not revalidated
+        sent = len(ETagHandler.sent)
+        assert ent.attributes['a'].delete_safe()
+        assert ent.attributes['b'].delete_safe()
+        assert watchdog.plugin_init(stor)
+        assert len(ETagHandler.sent) == sent + 2
+        assert ent.attributes['a'].data == 'b'
+        assert ent.attributes['b'].data == 'b'
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert src.delete_safe()
+    assert set(source_meta(stor)) == {slow.id}
+
+
+class CachingHandler(ETagHandler):
+    """Answers as a stale cache, not modified unless asked not to cache"""
+    def send_head(self):
+        if self.headers.get('Cache-Control') == 'no-cache':
+            return super().send_head()
+        self.send_response(304)
+        self.send_header('ETag', '"cached"')
+        self.end_headers()
+        return None
+
+
+def test_not_modified_without_meta(tmp_path, monkeypatch):
+    handler = functools.partial(CachingHandler, directory=str(tmp_path))
+    monkeypatch.setattr(ETagHandler, 'sent', [])
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    (tmp_path / 'a.txt').write_text('a')
+
+    stor = mkstor()
+    ent = stor.create_group_safe('G').create_entity_safe('E')
+    src = ent.create_attribute_safe('a_textsource', DType.TEXT,
+                                    f"{url}/a.txt")
+    try:
+        # no metadata to revalidate, the source is fetched in full
+        assert watchdog.plugin_init(stor)
+        assert ETagHandler.sent == ['/a.txt']
+        assert ent.attributes['a'].data == 'a'
+
+        # nor once the metadata are gone
+        (tmp_path / 'a.txt').write_text('b')
+        with stor.db_conn:
+            stor.db_conn.execute('DELETE FROM watchdog_source')
+        assert watchdog.plugin_init(stor)
+        assert ETagHandler.sent == ['/a.txt'] * 2
+        assert ent.attributes['a'].data == 'b'
+        assert set(source_meta(stor)) == {src.id}
+    finally:
+        httpd.shutdown()
+        httpd.server_close()